@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from valutatrade_hub.core.utils import utcnow_iso
+from valutatrade_hub.infra.settings import SettingsLoader
+
+RATES = {"BTC_USD": 50000.0, "ETH_USD": 2500.0}
+
+
+#Каждый тест - в своей папке данных со свежими курсами, чтобы get-rate и сделки не ходили в сеть
+@pytest.fixture
+def data_dir(tmp_path):
+    settings = SettingsLoader()
+    previous = {key: settings.get(key) for key in ("DATA_DIR", "LOG_DIR")}
+    data = tmp_path / "data"
+    data.mkdir()
+    now = utcnow_iso()
+    pairs = {pair: {"rate": rate, "updated_at": now, "source": "test"} for pair, rate in RATES.items()}
+    (data / "rates.json").write_text(json.dumps({"pairs": pairs, "last_refresh": now}), encoding="utf-8")
+    settings.override(DATA_DIR=str(data), LOG_DIR=str(tmp_path / "logs"))
+    yield data
+    settings.override(**previous)
+
+
+@pytest.fixture
+def make_uc(data_dir):
+    from valutatrade_hub.core.usecases import CoreUseCases
+
+    created = []
+
+    def make() -> CoreUseCases:
+        uc = CoreUseCases(autostart=False)
+        created.append(uc)
+        return uc
+
+    yield make
+    for uc in created:
+        uc.shutdown()
+
+
+@pytest.fixture
+def alice(make_uc):
+    #Пользователь с 1000 USD на счету
+    uc = make_uc()
+    uc.register("alice", "secret")
+    uc.login("alice", "secret")
+    uc.buy("USD", 1000)
+    return uc
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import json
+
+from valutatrade_hub.core.alerts import ABOVE, BELOW, AlertBook, _Side
+
+
+def _side(*thresholds: float) -> _Side:
+    side = _Side()
+    for alert_id, threshold in enumerate(thresholds, start=1):
+        side.add(threshold, alert_id)
+    return side
+
+
+def test_above_takes_old_inclusive_new_exclusive():
+    #above срабатывает при old <= t < new
+    side = _side(100.0, 100.0, 105.0, 99.0)
+    assert side.take((100.0, -1), (105.0, -1), right=False) == [1, 2]
+    assert [t for t, _id in side.keys] == [99.0, 105.0]
+
+
+def test_below_takes_new_exclusive_old_inclusive():
+    #below срабатывает при new < t <= old
+    side = _side(95.0, 100.0, 100.0, 101.0)
+    assert side.take((95.0, float("inf")), (100.0, float("inf")), right=True) == [2, 3]
+    assert [t for t, _id in side.keys] == [95.0, 101.0]
+
+
+def test_take_outside_range_is_empty():
+    side = _side(10.0, 20.0)
+    assert side.take((30.0, -1), (40.0, -1), right=False) == []
+    assert len(side.keys) == 2
+
+
+def _pairs(rate: float) -> dict:
+    return {"BTC_USD": {"rate": rate}}
+
+
+def test_evaluate_fires_only_crossed_thresholds(data_dir):
+    book = AlertBook()
+    up = book.add(1, "BTC_USD", ABOVE, 100.0, "BTC_USD")
+    down = book.add(1, "BTC_USD", BELOW, 90.0, "BTC_USD")
+    assert book.evaluate(_pairs(95.0), _pairs(100.0)) == [] #ровно на пороге - ещё не выше
+    fired = book.evaluate(_pairs(100.0), _pairs(101.0))
+    assert [a["id"] for a in fired] == [up["id"]]
+    assert book.evaluate(_pairs(101.0), _pairs(100.0)) == [] #сработавшие одноразовые
+    fired = book.evaluate(_pairs(100.0), _pairs(89.0))
+    assert [a["id"] for a in fired] == [down["id"]]
+
+
+def test_alert_met_at_creation_keeps_its_id(data_dir):
+    book = AlertBook()
+    first = book.add(1, "BTC_USD", ABOVE, 100.0, "BTC_USD", current_rate=150.0)
+    assert first["fired"]
+    second = AlertBook().add(1, "BTC_USD", ABOVE, 200.0, "BTC_USD", current_rate=150.0)
+    assert second["id"] == first["id"] + 1
+    lines = (data_dir / "notifications.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["alert_id"] for line in lines] == [first["id"]]
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from valutatrade_hub.core.exposure import ExposureAggregates
+
+
+def test_incremental_totals_follow_trades(alice):
+    alice.buy("BTC", 0.01)
+    alice.sell("BTC", 0.004)
+    totals = ExposureAggregates().totals()
+    assert totals["BTC"][0] == pytest.approx(0.006)
+    assert totals["USD"][0] == pytest.approx(1000.0 - 0.01 * 50000.0 + 0.004 * 50000.0)
+    assert "расхождений: 0" in alice.exposure(verify=True)
+
+
+def test_verify_repairs_drifted_file(alice, data_dir):
+    alice.buy("BTC", 0.01)
+    path = data_dir / "exposure.json"
+    doc = json.loads(path.read_text(encoding="utf-8"))
+    doc["totals"]["BTC"] = 5.0
+    path.write_text(json.dumps(doc), encoding="utf-8")
+
+    assert "расхождений: 1" in alice.exposure(verify=True)
+    assert ExposureAggregates().totals()["BTC"][0] == pytest.approx(0.01)
+
+
+def test_lagging_file_is_rebuilt_from_ledger(alice, make_uc):
+    #exposure.json отстал от журнала (сбой до сохранения): при следующем чтении агрегаты пересчитываются
+    alice.buy("BTC", 0.01)
+    alice._ledger.record_many(
+        [{"user_id": alice.session.user_id, "side": "BUY", "currency": "ETH", "amount": 0.1, "rate": 2500.0, "usd_delta": -250.0}]
+    )
+    make_uc()._ensure_exposure()
+    totals = ExposureAggregates().totals()
+    assert totals["ETH"][0] == pytest.approx(0.1)
+    assert ExposureAggregates().ledger_seq() == alice._ledger.last_seq()
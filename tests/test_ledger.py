@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from valutatrade_hub.core.exceptions import InsufficientFundsError
+from valutatrade_hub.core.ledger import TradeLedger
+from valutatrade_hub.infra.settings import SettingsLoader
+
+
+def _trade(uid: int, side: str, code: str, amount: float, rate: float, usd_delta: float) -> dict:
+    return {"user_id": uid, "side": side, "currency": code, "amount": amount, "rate": rate, "usd_delta": usd_delta}
+
+
+def test_replay_from_snapshot_matches_full_tail(data_dir):
+    settings = SettingsLoader()
+    every = settings.get("LEDGER_SNAPSHOT_EVERY", 100)
+    settings.override(LEDGER_SNAPSHOT_EVERY=3)
+    try:
+        ledger = TradeLedger()
+        trades = [_trade(1, "BUY", "USD", 1000.0, 1.0, 1000.0)]
+        trades += [_trade(1, "BUY", "BTC", 0.001, 50000.0, -50.0) for _ in range(5)]
+        for t in trades:
+            ledger.record_many([t])
+    finally:
+        settings.override(LEDGER_SNAPSHOT_EVERY=every)
+
+    assert ledger.last_seq() == 6
+    assert ledger.snapshot_source()[1] > 0 #снимки писались по ходу
+    wallets, _basis = TradeLedger().load_user(1)
+    assert wallets["USD"] == pytest.approx(1000.0 - 5 * 50.0)
+    assert wallets["BTC"] == pytest.approx(0.005)
+    assert TradeLedger().load_all() == {1: wallets}
+
+
+def test_record_many_assigns_consecutive_seq(data_dir):
+    ledger = TradeLedger()
+    first = ledger.record_many([_trade(1, "BUY", "USD", 10.0, 1.0, 10.0)])
+    batch = ledger.record_many([_trade(2, "BUY", "USD", 5.0, 1.0, 5.0), _trade(1, "SELL", "USD", 1.0, 1.0, -1.0)])
+    assert [e["seq"] for e in first + batch] == [1, 2, 3]
+    assert ledger.user_version(1) == 3
+    assert ledger.user_version(2) == 2
+
+
+def test_concurrent_sessions_cannot_double_spend(alice, make_uc):
+    #Две сессии одного пользователя тратят по 600 из 1000 USD одновременно: проходит ровно одна
+    other = make_uc()
+    other.login("alice", "secret")
+    for _ in range(10):
+        barrier = threading.Barrier(2)
+        results: list[str] = []
+
+        def spend(uc) -> None:
+            barrier.wait()
+            try:
+                uc.sell("USD", 600)
+                results.append("ok")
+            except InsufficientFundsError:
+                results.append("refused")
+
+        threads = [threading.Thread(target=spend, args=(uc,)) for uc in (alice, other)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(results) == ["ok", "refused"]
+        usd = alice._load_portfolio(alice.session.user_id).get_wallet("USD").balance
+        assert usd == pytest.approx(400.0)
+        alice.buy("USD", 600)
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import pytest
+
+from valutatrade_hub.core.orders import BUY, SELL, OrderBook
+
+
+def _order(order_id: int, uid: int, side: str, amount: float) -> dict:
+    return {"id": order_id, "user_id": uid, "side": side, "currency": "BTC", "amount": amount}
+
+
+def test_partial_failure_commits_only_covered_fills(alice, make_uc):
+    bob = make_uc()
+    bob.register("bob", "secret")
+    bob_id = bob._db.load_users()[-1]["user_id"]
+    alice_id = alice.session.user_id
+    seq = alice._ledger.last_seq()
+
+    results = alice._execute_fills(
+        [
+            (_order(1, alice_id, BUY, 0.01), 50000.0),
+            (_order(2, bob_id, BUY, 0.01), 50000.0), #у bob нет USD
+            (_order(3, alice_id, SELL, 1.0), 50000.0), #продажа больше купленного
+        ]
+    )
+
+    assert results[1] is None
+    assert results[2] and results[3]
+    assert alice._ledger.last_seq() == seq + 1 #в журнал попала только исполненная заявка
+    wallets = alice._load_portfolio(alice_id)
+    assert wallets.get_wallet("BTC").balance == pytest.approx(0.01)
+    assert wallets.get_wallet("USD").balance == pytest.approx(500.0)
+    assert bob._load_portfolio(bob_id).get_wallet("BTC") is None
+    assert "расхождений: 0" in alice.exposure(verify=True)
+
+
+def test_match_fills_and_rejects_in_one_pass(alice):
+    uid = alice.session.user_id
+    book = OrderBook(executor=alice._execute_fills)
+    covered = book.place(uid, BUY, "BTC", 0.01, 60000.0)
+    uncovered = book.place(uid, BUY, "BTC", 1.0, 60000.0)
+    waiting = book.place(uid, BUY, "BTC", 0.01, 40000.0)
+
+    done = {o["id"]: o for o in book.match({"BTC_USD": {"rate": 50000.0}})}
+
+    assert done[covered["id"]]["status"] == "filled"
+    assert done[uncovered["id"]]["status"] == "rejected"
+    assert waiting["id"] not in done
+    assert [o["id"] for o in book.for_user(uid)] == [waiting["id"]]
+
+
+def test_executor_error_returns_orders_to_book(data_dir):
+    def broken(_candidates):
+        raise RuntimeError("ledger unavailable")
+
+    book = OrderBook(executor=broken)
+    order = book.place(7, SELL, "BTC", 0.5, 10.0)
+    with pytest.raises(RuntimeError):
+        book.match({"BTC_USD": {"rate": 20.0}})
+    assert [o["id"] for o in book.for_user(7)] == [order["id"]]
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import pytest
+
+
+def test_login_is_restored_by_next_process(alice, make_uc):
+    restored = make_uc()
+    assert restored.session.username == "alice"
+    assert restored.session.user_id == alice.session.user_id
+
+
+def test_logout_revokes_saved_session(alice, make_uc):
+    alice.logout()
+    fresh = make_uc()
+    assert fresh.session.user_id is None
+    with pytest.raises(PermissionError):
+        fresh.show_portfolio()
+
+
+def test_register_rejects_taken_name(alice):
+    assert "уже занято" in alice.register("alice", "other")
+    assert [u["username"] for u in alice._db.load_users()] == ["alice"]
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from valutatrade_hub.core.valuation_cache import ValuationCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = ValuationCache(max_size=2)
+    cache.put((1, "USD", 1, 1), "a")
+    cache.put((2, "USD", 1, 1), "b")
+    assert cache.get((1, "USD", 1, 1)) == "a"
+    cache.put((3, "USD", 1, 1), "c")
+    assert cache.get((2, "USD", 1, 1)) is None
+    assert cache.stats()["evicted"] == 1
+
+
+def test_new_rates_version_drops_everything():
+    cache = ValuationCache(max_size=10)
+    cache.put((1, "USD", 1, 1), "a")
+    assert cache.get((1, "USD", 2, 1)) is None
+    assert cache.stats()["size"] == 0
+    cache.put((1, "USD", 1, 1), "stale") #посчитано по старым курсам - не сохраняется
+    assert cache.stats()["size"] == 0
+
+
+def test_invalidate_users_keeps_other_users():
+    cache = ValuationCache(max_size=10)
+    cache.put((1, "USD", 1, 1), "a")
+    cache.put((1, "EUR", 1, 1), "a-eur")
+    cache.put((2, "USD", 1, 1), "b")
+    cache.invalidate_users([1])
+    assert cache.get((1, "USD", 1, 1)) is None
+    assert cache.get((2, "USD", 1, 1)) == "b"
+    assert cache.stats()["invalidated"] == 2
+
+
+def test_trade_changes_shown_portfolio(alice):
+    before = alice.show_portfolio()
+    assert alice.show_portfolio() == before
+    alice.buy("BTC", 0.01)
+    assert alice.show_portfolio() != before
@@ -8,6 +8,7 @@ from valutatrade_hub.core.exceptions import (
     CurrencyNotFoundError,
     InsufficientFundsError,
 )
+from valutatrade_hub.core.currencies import find_currencies
 from valutatrade_hub.core.usecases import CoreUseCases
 
 #Парсер аргументов
@@ -18,8 +19,8 @@ def _parse_kwargs(tokens: list[str]) -> dict[str, str]:
         t = tokens[i]
         if t.startswith("--"):
             key = t[2:]
-            if i + 1 >= len(tokens):
-                out[key] = ""
+            if i + 1 >= len(tokens) or tokens[i + 1].startswith("--"):
+                out[key] = "" #флаг без значения, например --apply
                 i += 1
             else:
                 out[key] = tokens[i + 1]
@@ -36,12 +37,35 @@ def main() -> None:
     print("\nСписок команд")
     print("\n> register --username <тут_имя> --password <не меньше 4 циферок>")
     print("\n> login --username <тут_имя> --password <как при регистрации>")
+    print("\n> logout")
     print("\n> show-portfolio [--base <код валюты>]")
     print("\n> buy --currency <код валюты> --amount <количество>")
     print("\n> sell --currency <код валюты> --amount <количество>")
     print("\n> get-rate --from <код валюты> --to <код валюты>")
-    print("\n> update-rates [--source coingecko|exchangerate]")
-    print("\n> show-rates [--currency <код валюты>] [--top 2]")
+    print("\n> update-rates [--source coingecko|exchangerate] [--record] [--async]")
+    print("\n> bench-refresh [--iterations N] [--latency-ms X] [--jitter-ms X] [--error-rate p]")
+    print("  [--timeout-rate p] [--partial-rate p] [--timeout-s S]")
+    print("\n> show-rates [--currency <код валюты>] [--top 2] [--offset N] [--limit N]")
+    print("  [--source <источник>] [--max-age <секунды>] [--stale] [--format table|plain|json]")
+    print("\n> report [--format csv|ndjson] [--out <файл>] [--workers N] [--since <дата ISO>] [--base USD]")
+    print("\n> import-users --file <файл.csv|ndjson> [--format csv|ndjson] [--chunk N] [--errors <файл>]")
+    print("\n> import-portfolios --file <файл.csv|ndjson> [--format csv|ndjson] [--chunk N] [--errors <файл>]")
+    print("\n> export-users [--out <файл>] [--format csv|ndjson]")
+    print("\n> export-portfolios [--out <файл>] [--format csv|ndjson]")
+    print("\n> place-order --side buy|sell --currency <код валюты> --amount <количество> --price <лимит в USD>")
+    print("\n> cancel-order --id <номер>")
+    print("\n> orders")
+    print("\n> rebalance (--targets <файл.json|csv> | --weights USD=60,BTC=30,ETH=10) [--apply] [--min-trade <USD>]")
+    print("\n> alert-add --pair BTC_USD (--above <курс> | --below <курс>)")
+    print("\n> alert-remove --id <номер>")
+    print("\n> alerts")
+    print("\n> status")
+    print("\n> load-test [--users 10] [--processes 1] [--duration 10] [--mix buy=25,sell=15,get-rate=30,show-portfolio=25,login=5] [--think-ms 0] [--latency-ms 50] [--data-dir <папка>] [--keep]")
+    print("\n> analyze-logs [--window <минуты>] [--action BUY] [--format table|json]")
+    print("\n> rate-stats [--pair BTC_USD] [--window 24h] [--format table|json]")
+    print("\n> currencies [--prefix <начало кода>] [--sync]")
+    print("\n> exposure [--base USD] [--verify]")
+    print("\n> replay --until <дата ISO> [--user <id>]")
     print("\nДля выхода: exit, quit")
 
     while True: #обработка команд
@@ -49,11 +73,9 @@ def main() -> None:
             raw = input("> ").strip()
             if not raw:
                 continue
-            if raw.lower() in {"exit", "quit"}:
-                print("До свидания!")
-                return
             if raw.lower() in {"exit", "quit"}:
                 uc.shutdown()
+                print("До свидания!")
                 return
 
             tokens = shlex.split(raw)
@@ -78,6 +100,9 @@ def main() -> None:
                         )
                     )
 
+                elif cmd == "logout":
+                    print(uc.logout())
+
                 elif cmd == "show-portfolio":
                     base = kw.get("base", "USD")
                     print(uc.show_portfolio(base=base))
@@ -99,13 +124,161 @@ def main() -> None:
 
                 elif cmd == "update-rates":
                     source = kw.get("source", "all")
-                    print(uc.update_rates(source=source))
+                    print(uc.update_rates(source=source, record="record" in kw, use_async="async" in kw))
+
+                elif cmd == "bench-refresh":
+                    latency_raw = kw.get("latency-ms")
+                    print(
+                        uc.bench_refresh(
+                            iterations=int(kw.get("iterations") or 100),
+                            latency_ms=float(latency_raw) if latency_raw else None,
+                            jitter_ms=float(kw.get("jitter-ms") or 0),
+                            error_rate=float(kw.get("error-rate") or 0),
+                            timeout_rate=float(kw.get("timeout-rate") or 0),
+                            partial_rate=float(kw.get("partial-rate") or 0),
+                            timeout_s=float(kw.get("timeout-s") or 10),
+                        )
+                    )
 
                 elif cmd == "show-rates":
                     currency = kw.get("currency")
                     top_raw = kw.get("top")
                     top = int(top_raw) if top_raw else None
-                    print(uc.show_rates(currency=currency, top=top))
+                    limit_raw = kw.get("limit")
+                    max_age_raw = kw.get("max-age")
+                    print(
+                        uc.show_rates(
+                            currency=currency,
+                            top=top,
+                            offset=int(kw.get("offset") or 0),
+                            limit=int(limit_raw) if limit_raw else None,
+                            source=kw.get("source") or None,
+                            max_age=int(max_age_raw) if max_age_raw else None,
+                            stale="stale" in kw,
+                            fmt=kw.get("format") or "table",
+                        )
+                    )
+
+                elif cmd == "report":
+                    workers_raw = kw.get("workers")
+                    print(
+                        uc.generate_report(
+                            fmt=kw.get("format") or "csv",
+                            out=kw.get("out") or None,
+                            workers=int(workers_raw) if workers_raw else None,
+                            since=kw.get("since") or None,
+                            base=kw.get("base", "USD"),
+                        )
+                    )
+
+                elif cmd in ("import-users", "import-portfolios"):
+                    run = uc.import_users if cmd == "import-users" else uc.import_portfolios
+                    chunk_raw = kw.get("chunk")
+                    print(
+                        run(
+                            path=kw.get("file", ""),
+                            fmt=kw.get("format") or None,
+                            chunk=int(chunk_raw) if chunk_raw else None,
+                            errors=kw.get("errors") or None,
+                            progress=print,
+                        )
+                    )
+
+                elif cmd in ("export-users", "export-portfolios"):
+                    run = uc.export_users if cmd == "export-users" else uc.export_portfolios
+                    print(run(out=kw.get("out") or None, fmt=kw.get("format") or None))
+
+                elif cmd == "place-order":
+                    print(
+                        uc.place_order(
+                            side=kw.get("side", ""),
+                            currency_code=kw.get("currency", ""),
+                            amount=float(kw.get("amount", "0")),
+                            price=float(kw.get("price", "0")),
+                        )
+                    )
+
+                elif cmd == "cancel-order":
+                    print(uc.cancel_order(order_id=int(kw.get("id") or 0)))
+
+                elif cmd == "orders":
+                    print(uc.list_orders())
+
+                elif cmd == "rebalance":
+                    min_trade_raw = kw.get("min-trade")
+                    print(
+                        uc.rebalance(
+                            targets=kw.get("targets") or None,
+                            weights=kw.get("weights") or None,
+                            apply="apply" in kw,
+                            min_trade=float(min_trade_raw) if min_trade_raw else None,
+                        )
+                    )
+
+                elif cmd == "alert-add":
+                    above_raw, below_raw = kw.get("above"), kw.get("below")
+                    print(
+                        uc.add_alert(
+                            pair=kw.get("pair", ""),
+                            above=float(above_raw) if above_raw else None,
+                            below=float(below_raw) if below_raw else None,
+                        )
+                    )
+
+                elif cmd == "alert-remove":
+                    print(uc.remove_alert(alert_id=int(kw.get("id") or 0)))
+
+                elif cmd == "alerts":
+                    print(uc.list_alerts())
+
+                elif cmd == "status":
+                    print(uc.status())
+
+                elif cmd == "load-test":
+                    print(
+                        uc.load_test(
+                            users=int(kw.get("users") or 10),
+                            processes=int(kw.get("processes") or 1),
+                            duration_s=float(kw.get("duration") or 10),
+                            mix=kw.get("mix") or None,
+                            think_ms=float(kw.get("think-ms") or 0),
+                            latency_ms=float(kw.get("latency-ms") or 50),
+                            data_dir=kw.get("data-dir") or None,
+                            keep="keep" in kw,
+                        )
+                    )
+
+                elif cmd == "analyze-logs":
+                    print(
+                        uc.analyze_logs(
+                            window_minutes=int(kw.get("window") or 60),
+                            action=kw.get("action") or None,
+                            fmt=kw.get("format") or "table",
+                        )
+                    )
+
+                elif cmd == "rate-stats":
+                    print(
+                        uc.rate_stats(
+                            pair=kw.get("pair") or None,
+                            window=kw.get("window") or "24h",
+                            fmt=kw.get("format") or "table",
+                        )
+                    )
+
+                elif cmd == "currencies":
+                    if "sync" in kw:
+                        print(uc.sync_currencies())
+                    print(uc.list_currencies(prefix=kw.get("prefix", "")))
+
+                elif cmd == "exposure":
+                    base = kw.get("base", "USD")
+                    print(uc.exposure(base=base, verify="verify" in kw))
+
+                elif cmd == "replay":
+                    user_raw = kw.get("user")
+                    user_id = int(user_raw) if user_raw else None
+                    print(uc.replay(until=kw.get("until", ""), user_id=user_id))
 
                 else:
                     print("Неизвестная команда")
@@ -113,7 +286,11 @@ def main() -> None:
                 print(str(e))
             except CurrencyNotFoundError as e:
                 print(str(e))
-                print("Подсказка: используйте поддерживаемые коды (USD, EUR, BTC, ETH, SOL, RUB, GBP).")
+                similar = [c.code for c in find_currencies(e.code[:1], limit=8)] if e.code else []
+                if similar:
+                    print(f"Подсказка: похожие коды: {', '.join(similar)}. Полный список: currencies --prefix <код>")
+                else:
+                    print("Подсказка: используйте поддерживаемые коды (USD, EUR, BTC, ETH, SOL, RUB, GBP).")
             except ApiRequestError as e:
                 print(str(e))
                 print("Подсказка: попробуйте позже или выполните update-rates.")
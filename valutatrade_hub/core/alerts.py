@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Any
+
+try:
+    import fcntl #только POSIX; без него два процесса могут выдать один id или дважды отправить уведомление
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from valutatrade_hub.core.utils import utcnow_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+ABOVE = "above"
+BELOW = "below"
+
+
+def _rate(obj: Any) -> float | None:
+    rate = obj.get("rate") if isinstance(obj, dict) else None
+    return float(rate) if isinstance(rate, (int, float)) and rate > 0 else None
+
+
+#Одна сторона пары: пороги (threshold, id) по возрастанию
+class _Side:
+    __slots__ = ("keys",)
+
+    def __init__(self) -> None:
+        self.keys: list[tuple[float, int]] = []
+
+    def add(self, threshold: float, alert_id: int) -> None:
+        insort(self.keys, (threshold, alert_id))
+
+    def remove(self, threshold: float, alert_id: int) -> None:
+        i = bisect_left(self.keys, (threshold, alert_id))
+        if i < len(self.keys) and self.keys[i] == (threshold, alert_id):
+            del self.keys[i]
+
+    def take(self, lo_key: tuple[float, int], hi_key: tuple[float, int], right: bool) -> list[int]:
+        #Вырезает диапазон порогов между старым и новым курсом - это и есть сработавшие
+        find = bisect_right if right else bisect_left
+        lo, hi = find(self.keys, lo_key), find(self.keys, hi_key)
+        fired = [alert_id for _t, alert_id in self.keys[lo:hi]]
+        del self.keys[lo:hi]
+        return fired
+
+
+#Ценовые уведомления. По каждой паре пороги "выше" и "ниже" лежат в отсортированных списках,
+#поэтому проверка после обновления - бисекция по старому и новому курсу,
+#а не обход всех заявок: стоимость растёт с числом сработавших, а не зарегистрированных.
+#alerts.jsonl - журнал событий add/remove/fired: добавление и срабатывание дописывают строку,
+#другой процесс дочитывает хвост с последнего смещения. Сработавшие уведомления одноразовые
+#и дописываются в notifications.jsonl. Изменения идут под блокировкой alerts.jsonl.lock, как у OrderBook.
+class AlertBook:
+    def __init__(self) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._alerts: dict[int, dict[str, Any]] = {}
+        self._index: dict[str, dict[str, _Side]] = {}
+        self._next_id = 1
+        self._dead = 0
+        self._file_id: tuple[int, int] | None = None
+        self._offset = 0
+
+    def _path(self):
+        return self._settings.path_for("ALERTS_FILE")
+
+    def _index_add(self, alert: dict[str, Any]) -> None:
+        sides = self._index.setdefault(alert["pair"], {ABOVE: _Side(), BELOW: _Side()})
+        sides[alert["op"]].add(float(alert["threshold"]), int(alert["id"]))
+
+    def _apply(self, event: dict[str, Any]) -> None:
+        alert_id = int(event.get("id", 0))
+        self._next_id = max(self._next_id, alert_id + 1)
+        #Свои события тоже перечитываются при следующей синхронизации - применение идемпотентно
+        if event.get("event") == "next_id":
+            return #метка сжатия: выданные id не должны повторяться
+        if event.get("event") == "add":
+            if alert_id not in self._alerts:
+                alert = {k: v for k, v in event.items() if k != "event"}
+                self._alerts[alert_id] = alert
+                self._index_add(alert)
+            return
+        alert = self._alerts.pop(alert_id, None)
+        if alert is not None:
+            self._dead += 2
+            self._index[alert["pair"]][alert["op"]].remove(float(alert["threshold"]), alert_id)
+
+    def _sync(self) -> None:
+        #Дочитывает события других процессов; после сжатия файла (новый inode) - читает заново
+        path = self._path()
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            self._alerts, self._index, self._next_id, self._dead = {}, {}, 1, 0
+            self._file_id, self._offset = file_id, 0
+        if st.st_size == self._offset:
+            return
+        for pos, event in self._db.iter_jsonl(path, offset=self._offset):
+            self._apply(event)
+            self._offset = pos
+
+    def _append(self, events: list[dict[str, Any]]) -> None:
+        self._db.append_jsonl(self._path(), events)
+        self._dead += sum(2 for e in events if e["event"] != "add")
+        self._compact()
+
+    def _compact(self) -> None:
+        #Журнал переписывается только активными заявками, когда мёртвых строк заметно больше
+        if self._dead < 1000 or self._dead < 2 * len(self._alerts):
+            return
+        self._sync()
+        path = self._path()
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.unlink(missing_ok=True)
+        events = [{"event": "add", **a} for a in self._alerts.values()]
+        self._db.append_jsonl(tmp, events + [{"event": "next_id", "id": self._next_id - 1}])
+        tmp.replace(path)
+        st = path.stat()
+        self._file_id, self._offset, self._dead = (st.st_dev, st.st_ino), st.st_size, 0
+
+    def _file_lock(self):
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock = open(path.with_suffix(path.suffix + ".lock"), "a+b")
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        return lock
+
+    def add(
+        self,
+        user_id: int,
+        pair: str,
+        op: str,
+        threshold: float,
+        label: str,
+        current_rate: float | None = None,
+    ) -> dict[str, Any]:
+        #pair/op/threshold - в виде, как пара хранится в снимке; label - как ввёл пользователь
+        if op not in (ABOVE, BELOW):
+            raise ValueError("Условие должно быть: above или below")
+        with self._lock, self._file_lock():
+            self._sync()
+            alert = {
+                "id": self._next_id,
+                "user_id": int(user_id),
+                "pair": pair,
+                "op": op,
+                "threshold": float(threshold),
+                "label": label,
+                "created_at": utcnow_iso(),
+            }
+            self._next_id += 1
+            #Условие уже выполнено - уведомление приходит сразу. Пара add + fired в журнале
+            #закрепляет id: иначе следующее уведомление получило бы тот же id, что уже есть в notifications.jsonl
+            if current_rate is not None and (
+                (op == ABOVE and current_rate > threshold) or (op == BELOW and current_rate < threshold)
+            ):
+                self._append([{"event": "add", **alert}, {"event": "fired", "id": alert["id"]}])
+                self._notify([(alert, None, current_rate)])
+                return {**alert, "fired": True}
+            self._alerts[alert["id"]] = alert
+            self._index_add(alert)
+            self._append([{"event": "add", **alert}])
+            return {**alert, "fired": False}
+
+    def remove(self, user_id: int, alert_id: int) -> bool:
+        with self._lock, self._file_lock():
+            self._sync()
+            alert = self._alerts.get(int(alert_id))
+            if alert is None or int(alert["user_id"]) != int(user_id):
+                return False
+            del self._alerts[int(alert_id)]
+            self._index[alert["pair"]][alert["op"]].remove(float(alert["threshold"]), int(alert_id))
+            self._append([{"event": "remove", "id": int(alert_id)}])
+            return True
+
+    def for_user(self, user_id: int) -> list[dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            return sorted(
+                (a for a in self._alerts.values() if int(a["user_id"]) == int(user_id)),
+                key=lambda a: a["id"],
+            )
+
+    def evaluate(self, old_pairs: dict[str, Any], new_pairs: dict[str, Any]) -> list[dict[str, Any]]:
+        #Вызывается после записи нового снимка курсов
+        fired: list[tuple[dict[str, Any], float | None, float]] = []
+        with self._lock, self._file_lock():
+            self._sync()
+            for pair, sides in self._index.items():
+                new = _rate(new_pairs.get(pair))
+                if new is None:
+                    continue
+                old = _rate(old_pairs.get(pair))
+                if old == new:
+                    continue
+                ids: list[int] = []
+                #above: old <= t < new; below: new < t <= old. Без прошлого курса - все выполненные
+                if old is None or new > old:
+                    lo = (old, -1) if old is not None else (float("-inf"), -1)
+                    ids += sides[ABOVE].take(lo, (new, -1), right=False)
+                if old is None or new < old:
+                    hi = (old, float("inf")) if old is not None else (float("inf"), -1)
+                    ids += sides[BELOW].take((new, float("inf")), hi, right=True)
+                for alert_id in ids:
+                    alert = self._alerts.pop(alert_id, None)
+                    if alert is not None:
+                        fired.append((alert, old, new))
+            if fired:
+                self._append([{"event": "fired", "id": a["id"]} for a, _old, _new in fired])
+                self._notify(fired)
+        return [alert for alert, _old, _new in fired]
+
+    def _notify(self, fired: list[tuple[dict[str, Any], float | None, float]]) -> None:
+        ts = utcnow_iso()
+        self._db.append_jsonl(
+            self._settings.path_for("NOTIFICATIONS_FILE"),
+            [
+                {
+                    "alert_id": alert["id"],
+                    "user_id": alert["user_id"],
+                    "alert": alert["label"],
+                    "pair": alert["pair"],
+                    "op": alert["op"],
+                    "threshold": alert["threshold"],
+                    "old_rate": old,
+                    "new_rate": new,
+                    "fired_at": ts,
+                }
+                for alert, old, new in fired
+            ],
+        )
+        self._logger.info("Сработало уведомлений о курсе: %s", len(fired))
+
+    def notifications(self, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
+        #Журнал читается потоково, в памяти только последние limit записей пользователя
+        recent: deque = deque(maxlen=max(1, int(limit)))
+        for _pos, rec in self._db.iter_jsonl(self._settings.path_for("NOTIFICATIONS_FILE")):
+            if int(rec.get("user_id", -1)) == int(user_id):
+                recent.append(rec)
+        return list(recent)
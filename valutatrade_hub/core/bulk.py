@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import csv
+import json
+import math
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TextIO
+
+from valutatrade_hub.core.currencies import get_currency
+from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.core.ledger import DEPOSIT, TradeLedger
+from valutatrade_hub.core.models import User
+from valutatrade_hub.core.utils import parse_iso_dt
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+FORMATS = ("csv", "ndjson")
+USER_FIELDS = ["user_id", "username", "hashed_password", "salt", "registration_date"]
+PORTFOLIO_FIELDS = ["user_id", "username", "currency", "amount", "cost"]
+
+Row = tuple[int, dict[str, Any] | None, str | None]
+Progress = Callable[[dict[str, int]], None]
+
+
+def detect_format(path: Path, fmt: str | None = None) -> str:
+    #Формат по ключу --format, иначе по расширению: .csv - CSV, остальное - NDJSON
+    fmt = str(fmt or "").strip().lower() or ("csv" if path.suffix.lower() == ".csv" else "ndjson")
+    if fmt not in FORMATS:
+        raise ValueError("format должен быть: csv или ndjson")
+    return fmt
+
+
+def iter_rows(path: Path, fmt: str) -> Iterator[Row]:
+    #(номер строки, запись, ошибка разбора); файл читается построчно, целиком в память не попадает
+    with path.open("r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k: v for k, v in row.items() if k is not None}, None
+            return
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield n, None, f"некорректный JSON: {e.msg}"
+                continue
+            if not isinstance(row, dict):
+                yield n, None, "строка должна быть JSON-объектом"
+                continue
+            yield n, row, None
+
+
+def _chunks(rows: Iterable[Row], size: int) -> Iterator[list[Row]]:
+    it = iter(rows)
+    while chunk := list(islice(it, max(1, size))):
+        yield chunk
+
+
+#Построчная запись CSV или NDJSON
+class RowWriter:
+    def __init__(self, f: TextIO, fmt: str, fields: list[str]) -> None:
+        self._f = f
+        self._csv = csv.DictWriter(f, fieldnames=fields) if fmt == "csv" else None
+        if self._csv is not None:
+            self._csv.writeheader()
+        self.count = 0
+
+    def write(self, row: dict[str, Any]) -> None:
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.count += 1
+
+
+#Отклонённые строки импорта: NDJSON {"line", "error", "row"}, файл создаётся при первой ошибке.
+#Первые несколько ошибок остаются в памяти для вывода в консоль
+class RejectLog:
+    def __init__(self, path: Path, keep: int = 5) -> None:
+        self.path = path
+        self.count = 0
+        self.samples: list[str] = []
+        self._keep = keep
+        self._f: TextIO | None = None
+
+    def add(self, line: int, error: str, row: dict[str, Any] | None) -> None:
+        if self._f is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._f = self.path.open("w", encoding="utf-8")
+        self._f.write(json.dumps({"line": line, "error": error, "row": row}, ensure_ascii=False) + "\n")
+        self.count += 1
+        if len(self.samples) < self._keep:
+            self.samples.append(f"строка {line}: {error}")
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def _user_record(row: dict[str, Any], names: set[str], now: datetime) -> tuple[dict[str, Any] | None, str | None]:
+    #Пароль открытым текстом хешируется как при register; готовые hashed_password + salt (export-users) переносятся как есть
+    username = str(row.get("username") or "").strip()
+    if username in names:
+        return None, f"имя '{username}' уже занято"
+    registered = parse_iso_dt(str(row.get("registration_date") or "")) or now
+    try:
+        user = User(
+            user_id=0,
+            username=username,
+            hashed_password=str(row.get("hashed_password") or ""),
+            salt=str(row.get("salt") or ""),
+            registration_date=registered,
+        )
+        if not (user.hashed_password and user.salt):
+            user.change_password(str(row.get("password") or ""))
+    except ValueError as e:
+        return None, str(e)
+    return {
+        "username": user.username,
+        "hashed_password": user.hashed_password,
+        "salt": user.salt,
+        "registration_date": user.registration_date.isoformat(),
+    }, None
+
+
+def import_users(
+    db: DatabaseManager, path: Path, fmt: str, chunk_rows: int, rejects: RejectLog, progress: Progress
+) -> dict[str, int]:
+    #Один проход: users.json и portfolios.json переписываются потоково, новые записи - пачками по chunk_rows.
+    #id выдаются блоком на пачку. Файлы подменяются только в конце, ошибка посередине их не трогает
+    existing = db.load_users()
+    names = {str(u.get("username")) for u in existing}
+    next_id = max((int(u["user_id"]) for u in existing), default=0) + 1
+    stats = {"rows": 0, "accepted": 0, "rejected": 0, "first_id": next_id, "last_id": next_id - 1}
+
+    settings = SettingsLoader()
+    users_path, portfolios_path = settings.path_for("USERS_FILE"), settings.path_for("PORTFOLIOS_FILE")
+    with db.open_json_array(users_path) as users_out, db.open_json_array(portfolios_path) as pf_out:
+        for u in existing:
+            users_out.write(u)
+        for p in db.load_portfolios():
+            pf_out.write(p)
+        existing = []
+
+        for chunk in _chunks(iter_rows(path, fmt), chunk_rows):
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            accepted: list[dict[str, Any]] = []
+            for line, row, error in chunk:
+                rec = None
+                if error is None:
+                    rec, error = _user_record(row, names, now)
+                if rec is None:
+                    rejects.add(line, str(error), row)
+                    continue
+                names.add(rec["username"])
+                accepted.append(rec)
+
+            block = range(next_id, next_id + len(accepted))
+            for user_id, rec in zip(block, accepted):
+                users_out.write({"user_id": user_id, **rec})
+                pf_out.write({"user_id": user_id, "wallets": {}})
+            next_id += len(accepted)
+
+            stats["rows"] += len(chunk)
+            stats["accepted"] += len(accepted)
+            stats["rejected"] = rejects.count
+            stats["last_id"] = next_id - 1
+            progress(dict(stats))
+    return stats
+
+
+def _deposit(
+    row: dict[str, Any], ids: set[int], by_name: dict[str, int]
+) -> tuple[dict[str, Any] | None, str | None]:
+    #Пользователь - по username, если он есть (id на другой площадке могли выдаться иначе), иначе по user_id
+    name = str(row.get("username") or "").strip()
+    if name:
+        uid = by_name.get(name)
+        if uid is None:
+            return None, f"пользователь '{name}' не найден"
+    else:
+        try:
+            uid = int(row.get("user_id"))
+        except (TypeError, ValueError):
+            return None, "нужен username или user_id"
+        if uid not in ids:
+            return None, f"пользователь id={uid} не найден"
+
+    try:
+        code = get_currency(str(row.get("currency") or "")).code
+    except CurrencyNotFoundError as e:
+        return None, str(e)
+
+    try:
+        amount = float(row.get("amount"))
+        cost = float(row.get("cost") or 0.0)
+    except (TypeError, ValueError):
+        return None, "amount и cost должны быть числами"
+    if not math.isfinite(amount) or amount <= 0:
+        return None, "'amount' должен быть положительным числом"
+    if not math.isfinite(cost) or cost < 0:
+        return None, "'cost' не может быть отрицательным"
+
+    if code == "USD":
+        return {"user_id": uid, "side": DEPOSIT, "currency": code, "amount": amount, "rate": 1.0, "usd_delta": amount}, None
+    return {"user_id": uid, "side": DEPOSIT, "currency": code, "amount": amount, "rate": cost, "usd_delta": 0.0}, None
+
+
+def import_portfolios(
+    db: DatabaseManager,
+    ledger: TradeLedger,
+    path: Path,
+    fmt: str,
+    chunk_rows: int,
+    rejects: RejectLog,
+    progress: Progress,
+) -> dict[str, int]:
+    #Строка - зачисление (DEPOSIT) в журнал сделок: пачки дописываются по мере чтения, снимок портфелей - один в конце
+    users = db.load_users()
+    ids = {int(u["user_id"]) for u in users}
+    by_name = {str(u["username"]): int(u["user_id"]) for u in users}
+    users = []
+    stats = {"rows": 0, "accepted": 0, "rejected": 0}
+
+    def batches() -> Iterator[list[dict[str, Any]]]:
+        for chunk in _chunks(iter_rows(path, fmt), chunk_rows):
+            batch: list[dict[str, Any]] = []
+            for line, row, error in chunk:
+                trade = None
+                if error is None:
+                    trade, error = _deposit(row, ids, by_name)
+                if trade is None:
+                    rejects.add(line, str(error), row)
+                    continue
+                batch.append(trade)
+            yield batch
+            stats["rows"] += len(chunk)
+            stats["accepted"] += len(batch)
+            stats["rejected"] = rejects.count
+            progress(dict(stats))
+
+    ledger.record_chunks(batches())
+    return stats
+
+
+def export_users(db: DatabaseManager, out: Path, fmt: str) -> int:
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8", newline="") as f:
+        writer = RowWriter(f, fmt, USER_FIELDS)
+        for u in db.load_users():
+            writer.write({k: u.get(k) for k in USER_FIELDS})
+    return writer.count
+
+
+def export_portfolios(db: DatabaseManager, ledger: TradeLedger, out: Path, fmt: str) -> int:
+    #Строка на (пользователь, валюта). Часть остатка с известной себестоимостью выгружается с cost,
+    #остаток без цены - отдельной строкой без cost: import-portfolios восстанавливает оба
+    state, basis = ledger.load_all_with_basis()
+    names = {int(u["user_id"]): str(u["username"]) for u in db.load_users()}
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("w", encoding="utf-8", newline="") as f:
+        writer = RowWriter(f, fmt, PORTFOLIO_FIELDS)
+        for uid in sorted(state):
+            for code in sorted(state[uid]):
+                balance = state[uid][code]
+                if balance <= 0:
+                    continue
+                cb = basis.get(uid, {}).get(code)
+                tracked = min(cb.qty, balance) if cb is not None and cb.avg_cost is not None else 0.0
+                row = {"user_id": uid, "username": names.get(uid, ""), "currency": code}
+                if tracked > 0:
+                    writer.write({**row, "amount": tracked, "cost": cb.avg_cost})
+                if balance - tracked > 1e-12:
+                    writer.write({**row, "amount": balance - tracked, "cost": ""})
+    return writer.count
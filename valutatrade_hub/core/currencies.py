@@ -1,8 +1,12 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any
 
 from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
 
 #Реализация базового класса Currency
 class Currency(ABC):
@@ -69,12 +73,108 @@ _CURRENCY_REGISTRY: dict[str, Currency] = {
     "SOL": CryptoCurrency("Solana", "SOL", "PoH", 8.00e10),
 }
 
+#Отсортированные коды для поиска по префиксу и id провайдеров для криптовалют
+_SORTED_CODES: list[str] = sorted(_CURRENCY_REGISTRY)
+_PROVIDER_IDS: dict[str, str] = {}
+_registry_loaded = False
+
+
+def _currency_from_entry(entry: dict[str, Any]) -> Currency:
+    if entry.get("type") == "crypto":
+        return CryptoCurrency(
+            str(entry.get("name") or entry.get("code")),
+            str(entry.get("code")),
+            str(entry.get("algorithm") or "unknown"),
+            float(entry.get("market_cap") or 0.0),
+        )
+    return FiatCurrency(
+        str(entry.get("name") or entry.get("code")),
+        str(entry.get("code")),
+        str(entry.get("issuing_country") or "unknown"),
+    )
+
+
+def _merge_entries(entries: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    #Встроенные валюты не перезаписываем, невалидные записи пропускаем
+    accepted: list[dict[str, Any]] = []
+    for entry in entries:
+        try:
+            currency = _currency_from_entry(entry)
+        except (TypeError, ValueError):
+            continue
+        if currency.code in _CURRENCY_REGISTRY:
+            continue
+        _CURRENCY_REGISTRY[currency.code] = currency
+        if entry.get("provider_id"):
+            _PROVIDER_IDS[currency.code] = str(entry["provider_id"])
+        accepted.append({**entry, "code": currency.code})
+    if accepted:
+        _SORTED_CODES[:] = sorted(_CURRENCY_REGISTRY)
+    return accepted
+
+
+def _registry_path():
+    return SettingsLoader().path_for("CURRENCIES_FILE")
+
+
+def _ensure_registry_loaded() -> None:
+    #Сохранённый реестр читается один раз за процесс, дальше - только dict-поиск
+    global _registry_loaded
+    if _registry_loaded:
+        return
+    _registry_loaded = True
+    doc = DatabaseManager().read_json(_registry_path(), default={"currencies": []})
+    _merge_entries(doc.get("currencies", []) or [])
+
+
+#Массовая регистрация валют из метаданных провайдеров - одна запись файла на пакет
+def register_currencies(entries: list[dict[str, Any]]) -> int:
+    _ensure_registry_loaded()
+    accepted = _merge_entries(entries)
+    if not accepted:
+        return 0
+    db = DatabaseManager()
+    doc = db.read_json(_registry_path(), default={"currencies": []})
+    doc.setdefault("currencies", []).extend(accepted)
+    db.write_json(_registry_path(), doc)
+    return len(accepted)
+
+
+def is_known_currency(code: str) -> bool:
+    _ensure_registry_loaded()
+    return str(code).strip().upper() in _CURRENCY_REGISTRY
+
+
+def currency_codes(crypto: bool) -> set[str]:
+    #Коды реестра одного типа: криптовалюты или фиат
+    _ensure_registry_loaded()
+    kind = CryptoCurrency if crypto else FiatCurrency
+    return {code for code, c in _CURRENCY_REGISTRY.items() if isinstance(c, kind)}
+
+
+def find_currencies(prefix: str, limit: int = 20) -> list[Currency]:
+    _ensure_registry_loaded()
+    prefix = str(prefix).strip().upper()
+    out: list[Currency] = []
+    i = bisect_left(_SORTED_CODES, prefix)
+    while i < len(_SORTED_CODES) and len(out) < limit and _SORTED_CODES[i].startswith(prefix):
+        out.append(_CURRENCY_REGISTRY[_SORTED_CODES[i]])
+        i += 1
+    return out
+
+
+def crypto_provider_ids() -> dict[str, str]:
+    _ensure_registry_loaded()
+    return dict(_PROVIDER_IDS)
+
+
 #Фабричный метод get_currency
 def get_currency(code: str) -> Currency:
     if not isinstance(code, str) or not code.strip():
         raise CurrencyNotFoundError(code=str(code))
+    _ensure_registry_loaded()
     code = code.strip().upper()
     currency = _CURRENCY_REGISTRY.get(code)
     if currency is None:
         raise CurrencyNotFoundError(code=code)
-    return currency
\ No newline at end of file
+    return currency
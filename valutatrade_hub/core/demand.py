@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Iterable
+
+from valutatrade_hub.core.exposure import ExposureAggregates
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+#Спрос на курсы: валюты, которые кто-то держит (число ненулевых кошельков из exposure.json)
+#или недавно запрашивал через get-rate/show-rates. Горячие валюты обновляются каждый прогон,
+#полный список провайдера (холодный слой) - раз в RATES_COLD_INTERVAL_SECONDS.
+#Файл перечитывается на каждый вызов, чтобы планировщик видел запросы соседних процессов.
+class DemandTracker:
+    def __init__(self) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._lock = threading.Lock()
+
+    def _path(self):
+        return self._settings.path_for("DEMAND_FILE")
+
+    def _read(self) -> dict[str, Any]:
+        doc = self._db.read_json(self._path(), default={})
+        doc.setdefault("watched", {})
+        doc.setdefault("full_refresh", {})
+        return doc
+
+    def touch(self, codes: Iterable[str]) -> None:
+        #Время запроса пишется не чаще раза в минуту на валюту, чтобы get-rate не писал файл каждый раз
+        base = str(self._settings.get("DEFAULT_BASE_CURRENCY", "USD"))
+        window = float(self._settings.get("DEMAND_WATCH_SECONDS", 86400))
+        now = time.time()
+        with self._lock:
+            doc = self._read()
+            watched = doc["watched"]
+            stale = [code for code, ts in watched.items() if now - float(ts) > window]
+            for code in stale:
+                del watched[code]
+            changed = bool(stale)
+            for code in codes:
+                if not code or code == base:
+                    continue
+                if now - float(watched.get(code, 0)) >= 60:
+                    watched[code] = now
+                    changed = True
+            if changed:
+                self._db.write_json(self._path(), doc)
+
+    def hot_set(self) -> set[str] | None:
+        #None - позиции по книге ещё не посчитаны, спрос неизвестен
+        exposure = ExposureAggregates()
+        if not exposure.is_initialized():
+            return None
+        held = {code for code, (_total, holders) in exposure.totals().items() if holders > 0}
+        window = float(self._settings.get("DEMAND_WATCH_SECONDS", 86400))
+        now = time.time()
+        with self._lock:
+            watched = self._read()["watched"]
+        recent = {code for code, ts in watched.items() if now - float(ts) <= window}
+        held.discard(str(self._settings.get("DEFAULT_BASE_CURRENCY", "USD")))
+        return held | recent
+
+    def plan(self, client_name: str) -> set[str] | None:
+        #Что загрузить провайдеру в этом прогоне: набор кодов или None - полный список
+        cold_interval = float(self._settings.get("RATES_COLD_INTERVAL_SECONDS", 21600))
+        with self._lock:
+            last_full = float(self._read()["full_refresh"].get(client_name, 0))
+        if time.time() - last_full >= cold_interval:
+            return None
+        return self.hot_set()
+
+    def mark_full(self, client_name: str) -> None:
+        with self._lock:
+            doc = self._read()
+            doc["full_refresh"][client_name] = time.time()
+            self._db.write_json(self._path(), doc)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import logging
+import math
+from typing import Any
+
+from valutatrade_hub.core.utils import utcnow_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+
+#Агрегаты по всей книге: сумма балансов и число ненулевых кошельков по валютам.
+#Обновляются инкрементально при каждой сделке, полный пересчёт - только в verify() и rebuild().
+#ledger_seq - последняя учтённая сделка журнала: по нему видно, что агрегаты отстали (сбой, другой процесс).
+#write_behind - commit() только помечает изменения, файл пишет flush() (фоновый сброс WriteBehindLedger).
+class ExposureAggregates:
+    def __init__(self, write_behind: bool = False) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._logger = logging.getLogger(__name__)
+        self._doc: dict[str, Any] | None = None
+        self._write_behind = write_behind
+        self._dirty = False
+
+    def _path(self):
+        return self._settings.path_for("EXPOSURE_FILE")
+
+    def _load(self) -> dict[str, Any]:
+        if self._doc is None:
+            doc = self._db.read_json(self._path(), default={})
+            doc.setdefault("totals", {})
+            doc.setdefault("holders", {})
+            doc.setdefault("trades_since_verify", 0)
+            doc.setdefault("verified_at", None)
+            self._doc = doc
+        return self._doc
+
+    def reload(self) -> None:
+        #Перечитать файл перед изменением: его могли переписать другие процессы.
+        #Несохранённые изменения write-behind не выбрасываем - они новее файла
+        if not self._dirty:
+            self._doc = None
+
+    def is_initialized(self) -> bool:
+        return self._load().get("verified_at") is not None
+
+    def apply(self, code: str, old_balance: float, new_balance: float) -> None:
+        doc = self._load()
+        totals, holders = doc["totals"], doc["holders"]
+        totals[code] = totals.get(code, 0.0) + (new_balance - old_balance)
+        was, now = old_balance > 0, new_balance > 0
+        if was != now:
+            holders[code] = holders.get(code, 0) + (1 if now else -1)
+
+    def commit(self, ledger_seq: int | None = None, trades: int = 1) -> bool:
+        #Сохраняет агрегаты после пачки из trades сделок; True - пора запустить полную сверку
+        doc = self._load()
+        doc["trades_since_verify"] = int(doc["trades_since_verify"]) + int(trades)
+        if ledger_seq is not None:
+            doc["ledger_seq"] = int(ledger_seq)
+        if self._write_behind:
+            self._dirty = True
+        else:
+            self._db.write_json(self._path(), doc)
+        every = int(self._settings.get("EXPOSURE_VERIFY_EVERY", 500))
+        return every > 0 and doc["trades_since_verify"] >= every
+
+    def flush(self) -> None:
+        if self._dirty:
+            self._dirty = False
+            self._db.write_json(self._path(), self._load())
+
+    def ledger_seq(self) -> int | None:
+        value = self._load().get("ledger_seq")
+        return int(value) if value is not None else None
+
+    def totals(self) -> dict[str, tuple[float, int]]:
+        doc = self._load()
+        codes = set(doc["totals"]) | set(doc["holders"])
+        return {
+            c: (float(doc["totals"].get(c, 0.0)), int(doc["holders"].get(c, 0)))
+            for c in sorted(codes)
+        }
+
+    def _recount(self, state: dict[int, dict[str, float]]) -> tuple[dict[str, float], dict[str, int]]:
+        totals: dict[str, float] = {}
+        holders: dict[str, int] = {}
+        for wallets in state.values():
+            for code, balance in wallets.items():
+                totals[code] = totals.get(code, 0.0) + balance
+                if balance > 0:
+                    holders[code] = holders.get(code, 0) + 1
+        return totals, holders
+
+    def _save_recount(
+        self, totals: dict[str, float], holders: dict[str, int], ledger_seq: int | None = None
+    ) -> None:
+        doc = self._load()
+        doc["totals"] = totals
+        doc["holders"] = holders
+        doc["trades_since_verify"] = 0
+        doc["verified_at"] = utcnow_iso()
+        if ledger_seq is not None:
+            doc["ledger_seq"] = int(ledger_seq)
+        self._dirty = False
+        self._db.write_json(self._path(), doc)
+
+    def verify(self, state: dict[int, dict[str, float]], ledger_seq: int | None = None) -> list[str]:
+        #Полный пересчёт по всем портфелям; расхождения исправляются и возвращаются
+        totals, holders = self._recount(state)
+
+        doc = self._load()
+        mismatches: list[str] = []
+        if doc.get("verified_at") is not None:
+            for code in sorted(set(totals) | set(doc["totals"])):
+                expected, actual = totals.get(code, 0.0), float(doc["totals"].get(code, 0.0))
+                if not math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-6):
+                    mismatches.append(f"{code}: total {actual} != {expected}")
+                if holders.get(code, 0) != int(doc["holders"].get(code, 0)):
+                    mismatches.append(
+                        f"{code}: holders {doc['holders'].get(code, 0)} != {holders.get(code, 0)}"
+                    )
+        for m in mismatches:
+            self._logger.warning("Расхождение агрегатов exposure: %s", m)
+
+        self._save_recount(totals, holders, ledger_seq=ledger_seq)
+        return mismatches
+
+    def rebuild(self, state: dict[int, dict[str, float]], ledger_seq: int | None = None) -> None:
+        #Пересчёт, когда агрегаты заведомо отстали (массовый импорт, сбой до сброса): расхождения ожидаемы
+        self._save_recount(*self._recount(state), ledger_seq=ledger_seq)
@@ -0,0 +1,500 @@
+from __future__ import annotations
+
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    import fcntl #только POSIX; без него два процесса могут выдать один seq
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from valutatrade_hub.core.models import CostBasis
+from valutatrade_hub.core.utils import parse_iso_dt, utcnow_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+Wallets = dict[str, float]
+Bases = dict[str, CostBasis]
+
+DEPOSIT = "DEPOSIT" #зачисление без оплаты в USD (импорт портфелей)
+
+
+#Применение одной сделки к балансам (и, если передана, к себестоимости) пользователя
+def apply_trade(wallets: Wallets, entry: dict[str, Any], basis: Bases | None = None) -> None:
+    code = str(entry["currency"])
+    usd_delta = float(entry["usd_delta"])
+    if code == "USD":
+        wallets["USD"] = wallets.get("USD", 0.0) + usd_delta
+        return
+    amount = float(entry["amount"])
+    if entry["side"] == DEPOSIT:
+        #Цена зачисления известна - позиция входит в себестоимость, иначе остаток без цены
+        if basis is not None and float(entry["rate"]) > 0:
+            basis.setdefault(code, CostBasis()).on_buy(amount, float(entry["rate"]))
+        wallets[code] = wallets.get(code, 0.0) + amount
+        return
+    if basis is not None:
+        cb = basis.setdefault(code, CostBasis())
+        if entry["side"] == "BUY":
+            cb.on_buy(amount, float(entry["rate"]))
+        else:
+            cb.on_sell(amount, float(entry["rate"]), wallets.get(code, 0.0))
+    sign = 1.0 if entry["side"] == "BUY" else -1.0
+    wallets[code] = wallets.get(code, 0.0) + sign * amount
+    wallets["USD"] = wallets.get("USD", 0.0) + usd_delta
+
+
+def _wallets_from_row(row: dict[str, Any]) -> Wallets:
+    out: Wallets = {}
+    for code, w in (row.get("wallets", {}) or {}).items():
+        if isinstance(w, dict):
+            out[str(w.get("currency_code", code)).upper()] = float(w.get("balance", 0.0))
+        else:
+            out[str(code).upper()] = float(w)
+    return out
+
+
+def _basis_from_row(row: dict[str, Any]) -> Bases:
+    out: Bases = {}
+    for code, w in (row.get("wallets", {}) or {}).items():
+        if isinstance(w, dict) and w.get("cost_basis"):
+            out[str(w.get("currency_code", code)).upper()] = CostBasis.from_dict(w["cost_basis"])
+    return out
+
+
+def _wallets_to_row(user_id: int, wallets: Wallets, basis: Bases | None = None) -> dict[str, Any]:
+    basis = basis or {}
+    rows: dict[str, Any] = {}
+    for c, b in wallets.items():
+        rows[c] = {"currency_code": c, "balance": b}
+        if c in basis:
+            rows[c]["cost_basis"] = basis[c].to_dict()
+    return {"user_id": user_id, "wallets": rows}
+
+
+#Журнал сделок: каждая сделка - одна строка в trades.jsonl.
+#Портфели - представление: последний снимок + хвост журнала после него.
+class TradeLedger:
+    def __init__(self) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._cached_seq: int | None = None
+        self._cached: dict[str, Any] | None = None
+        self._file_mutex = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        self._versions_lock = threading.Lock()
+        self._versions_seq: int | None = None
+        self._versions_offset = 0
+        self._versions: dict[int, int] = {}
+
+    def _ledger_path(self) -> Path:
+        return self._settings.path_for("TRADES_FILE")
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        #Межпроцессная блокировка журнала (trades.jsonl.lock): выдача seq, дозапись и снимок идут под ней.
+        #Повторный вход из того же экземпляра не блокируется - flock второго дескриптора ждал бы сам себя
+        with self._file_mutex:
+            if self._lock_depth == 0:
+                path = self._ledger_path()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._lock_file = open(path.with_suffix(path.suffix + ".lock"), "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _snapshots_dir(self) -> Path:
+        return self._settings.data_dir() / str(self._settings.get("SNAPSHOTS_DIR", "snapshots"))
+
+    def _list_snapshots(self) -> list[tuple[int, Path]]:
+        out: list[tuple[int, Path]] = []
+        folder = self._snapshots_dir()
+        if not folder.exists():
+            return out
+        for path in folder.glob("portfolios_*.json"):
+            try:
+                out.append((int(path.stem.split("_", 1)[1]), path))
+            except ValueError:
+                continue
+        out.sort()
+        return out
+
+    def _read_snapshot(self, seq: int, path: Path) -> dict[str, Any]:
+        #Снимки неизменяемы, поэтому разобранный последний снимок держим в памяти
+        if self._cached_seq == seq and self._cached is not None:
+            return self._cached
+        doc = self._db.read_json(path, default={})
+        rows = doc.get("portfolios", [])
+        doc["index"] = {int(row["user_id"]): _wallets_from_row(row) for row in rows}
+        doc["basis"] = {int(row["user_id"]): _basis_from_row(row) for row in rows}
+        self._cached_seq, self._cached = seq, doc
+        return doc
+
+    def _write_snapshot(
+        self, seq: int, offset: int, state: dict[int, Wallets], basis: dict[int, Bases] | None = None
+    ) -> None:
+        basis = basis or {}
+        rows = [_wallets_to_row(uid, w, basis.get(uid)) for uid, w in sorted(state.items())]
+        self._write_rows(seq, offset, rows)
+
+    def _write_rows(self, seq: int, offset: int, rows: list[dict[str, Any]]) -> None:
+        doc = {"seq": seq, "offset": offset, "created_at": utcnow_iso(), "portfolios": rows}
+        self._db.write_json(self._snapshots_dir() / f"portfolios_{seq:012d}.json", doc)
+
+    def _save_view(self, seq: int, offset: int, rows: list[dict[str, Any]], changed: set[int] | None = None) -> None:
+        #Снимок и материализованное представление portfolios.json; changed - строки, которые надо заменить (None - все)
+        self._write_rows(seq, offset, rows)
+        view = {int(r["user_id"]): r for r in self._db.load_portfolios()}
+        for row in rows:
+            if changed is None or int(row["user_id"]) in changed:
+                view[int(row["user_id"])] = row
+        self._db.save_portfolios([view[uid] for uid in sorted(view)])
+        self._prune()
+
+    def _latest_snapshot(self) -> dict[str, Any]:
+        snapshots = self._list_snapshots()
+        if not snapshots:
+            #Первый запуск: исходный снимок из текущего portfolios.json
+            rows = self._db.load_portfolios()
+            state = {int(r["user_id"]): _wallets_from_row(r) for r in rows}
+            basis = {int(r["user_id"]): _basis_from_row(r) for r in rows}
+            self._write_snapshot(seq=0, offset=0, state=state, basis=basis)
+            snapshots = self._list_snapshots()
+        seq, path = snapshots[-1]
+        return self._read_snapshot(seq, path)
+
+    def _tail(self, snapshot: dict[str, Any]):
+        return self._db.iter_jsonl(self._ledger_path(), offset=int(snapshot.get("offset", 0)))
+
+    def load_user(self, user_id: int) -> tuple[Wallets, Bases]:
+        snapshot = self._latest_snapshot()
+        wallets = dict(snapshot["index"].get(int(user_id), {}))
+        basis = {c: cb.copy() for c, cb in snapshot["basis"].get(int(user_id), {}).items()}
+        for _pos, entry in self._tail(snapshot):
+            if int(entry.get("user_id", -1)) == int(user_id):
+                apply_trade(wallets, entry, basis)
+        return wallets, basis
+
+    def load_wallets(self, user_id: int) -> Wallets:
+        return self.load_user(user_id)[0]
+
+    def record(
+        self,
+        user_id: int,
+        side: str,
+        currency: str,
+        amount: float,
+        rate: float,
+        usd_delta: float,
+    ) -> dict[str, Any]:
+        trade = {"user_id": user_id, "side": side, "currency": currency, "amount": amount, "rate": rate}
+        return self.record_many([{**trade, "usd_delta": usd_delta}])[0]
+
+    def _last_seq(self, snapshot: dict[str, Any]) -> int:
+        last_seq = int(snapshot.get("seq", 0))
+        for _pos, entry in self._tail(snapshot):
+            last_seq = max(last_seq, int(entry.get("seq", 0)))
+        return last_seq
+
+    @staticmethod
+    def _entries(trades: list[dict[str, Any]], last_seq: int) -> list[dict[str, Any]]:
+        ts = utcnow_iso()
+        return [
+            {
+                "seq": last_seq + i,
+                "user_id": int(t["user_id"]),
+                "side": t["side"],
+                "currency": t["currency"],
+                "amount": float(t["amount"]),
+                "rate": float(t["rate"]),
+                "usd_delta": float(t["usd_delta"]),
+                "timestamp": ts,
+            }
+            for i, t in enumerate(trades, start=1)
+        ]
+
+    def record_many(self, trades: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        #Пачка сделок дописывается в журнал одной записью; последний seq перечитывается под блокировкой
+        with self.locked():
+            snapshot = self._latest_snapshot()
+            entries = self._entries(trades, self._last_seq(snapshot))
+            if not entries:
+                return []
+            self._db.append_jsonl(self._ledger_path(), entries)
+
+            every = int(self._settings.get("LEDGER_SNAPSHOT_EVERY", 100))
+            if every > 0 and entries[-1]["seq"] - int(snapshot.get("seq", 0)) >= every:
+                self.snapshot()
+        return entries
+
+    def record_chunks(self, chunks: Iterable[list[dict[str, Any]]]) -> int:
+        #Массовая запись: последний seq ищется один раз, пачки дописываются по мере поступления,
+        #снимок - один в конце, а не каждые LEDGER_SNAPSHOT_EVERY записей. Журнал заблокирован на весь импорт:
+        #иначе последний seq пришлось бы искать заново перед каждой пачкой
+        with self.locked():
+            last_seq = self._last_seq(self._latest_snapshot())
+            count = 0
+            for trades in chunks:
+                entries = self._entries(trades, last_seq)
+                if not entries:
+                    continue
+                self._db.append_jsonl(self._ledger_path(), entries)
+                last_seq = entries[-1]["seq"]
+                count += len(entries)
+            if count:
+                self.snapshot()
+        return count
+
+    def _materialize(self, with_basis: bool = False) -> tuple[dict[int, Wallets], dict[int, Bases], int, int]:
+        snapshot = self._latest_snapshot()
+        state = {uid: dict(w) for uid, w in snapshot["index"].items()}
+        basis: dict[int, Bases] = {}
+        if with_basis:
+            basis = {uid: {c: cb.copy() for c, cb in b.items()} for uid, b in snapshot["basis"].items()}
+        seq, offset = int(snapshot.get("seq", 0)), int(snapshot.get("offset", 0))
+        for pos, entry in self._tail(snapshot):
+            uid = int(entry["user_id"])
+            apply_trade(state.setdefault(uid, {}), entry, basis.setdefault(uid, {}) if with_basis else None)
+            seq, offset = int(entry["seq"]), pos
+        return state, basis, seq, offset
+
+    def load_all(self) -> dict[int, Wallets]:
+        return self._materialize()[0]
+
+    def snapshot_source(self) -> tuple[Path, int]:
+        #Последний снимок и смещение хвоста журнала после него - для потоковой обработки всей книги,
+        #когда собирать состояние в памяти (load_all) нельзя. seq и offset _write_rows пишет до портфелей
+        snapshots = self._list_snapshots()
+        if not snapshots:
+            self._latest_snapshot()
+            snapshots = self._list_snapshots()
+        path = snapshots[-1][1]
+        with path.open("r", encoding="utf-8") as f:
+            m = re.search(r'"offset"\s*:\s*(\d+)', f.read(4096))
+        return path, int(m.group(1)) if m else 0
+
+    def iter_snapshot(self, path: Path) -> Iterator[tuple[int, Wallets]]:
+        for row in self._db.iter_json_array(path, key="portfolios"):
+            yield int(row["user_id"]), _wallets_from_row(row)
+
+    def iter_tail(self, offset: int) -> Iterator[dict[str, Any]]:
+        for _pos, entry in self._db.iter_jsonl(self._ledger_path(), offset=offset):
+            yield entry
+
+    def load_all_with_basis(self) -> tuple[dict[int, Wallets], dict[int, Bases]]:
+        state, basis, _seq, _offset = self._materialize(with_basis=True)
+        return state, basis
+
+    def snapshot(self) -> int:
+        with self.locked():
+            state, basis, seq, offset = self._materialize(with_basis=True)
+            if seq == int(self._latest_snapshot().get("seq", 0)):
+                return seq
+
+            rows = [_wallets_to_row(uid, w, basis.get(uid)) for uid, w in sorted(state.items())]
+            self._save_view(seq, offset, rows)
+        return seq
+
+    def last_seq(self) -> int:
+        return self._last_seq(self._latest_snapshot())
+
+    def user_version(self, user_id: int) -> int:
+        #Версия портфеля: seq последней сделки пользователя после снимка, а если их нет - seq снимка.
+        #Равные версии - равные портфели. Хвост дочитывается с запомненного места, а не с начала
+        with self._versions_lock:
+            snapshot = self._latest_snapshot()
+            seq = int(snapshot.get("seq", 0))
+            if self._versions_seq != seq:
+                self._versions_seq, self._versions_offset, self._versions = seq, int(snapshot.get("offset", 0)), {}
+            for pos, entry in self._db.iter_jsonl(self._ledger_path(), offset=self._versions_offset):
+                self._versions[int(entry["user_id"])] = int(entry["seq"])
+                self._versions_offset = pos
+            return self._versions.get(int(user_id), seq)
+
+    def close(self) -> None:
+        #Синхронный журнал ничего не держит в памяти; WriteBehindLedger здесь сбрасывает изменения
+        pass
+
+    def _prune(self) -> None:
+        keep = int(self._settings.get("LEDGER_SNAPSHOTS_KEEP", 10))
+        snapshots = self._list_snapshots()
+        #Исходный снимок (seq=0) не удаляем - без него историю не восстановить
+        candidates = [s for s in snapshots if s[0] != 0]
+        for _seq, path in candidates[: max(0, len(candidates) - keep)]:
+            path.unlink(missing_ok=True)
+
+    def replay(self, until: datetime) -> dict[int, Wallets]:
+        if until.tzinfo is None:
+            until = until.replace(tzinfo=timezone.utc)
+        self._latest_snapshot()
+
+        chosen: dict[str, Any] | None = None
+        for _seq, path in self._list_snapshots():
+            doc = self._db.read_json(path, default={})
+            created = parse_iso_dt(str(doc.get("created_at", "")))
+            if chosen is None or (created is not None and created <= until):
+                chosen = doc
+            else:
+                break
+
+        state = {int(r["user_id"]): _wallets_from_row(r) for r in chosen.get("portfolios", [])}
+        for _pos, entry in self._tail(chosen):
+            ts = parse_iso_dt(str(entry.get("timestamp", "")))
+            if ts is not None and ts > until:
+                break
+            apply_trade(state.setdefault(int(entry["user_id"]), {}), entry)
+        return state
+
+
+#Портфели в памяти поверх журнала (LEDGER_WRITE_BEHIND). Сделка - только дозапись в trades.jsonl:
+#журнал и есть журнал намерений, после сбоя состояние восстанавливается из снимка и хвоста, как обычно.
+#Состояние догоняет журнал с запомненного смещения, поэтому видит и сделки соседних процессов.
+#Снимок, portfolios.json и подписчики on_flush (агрегаты exposure) пишет фоновый поток: раз в
+#LEDGER_FLUSH_INTERVAL_SECONDS или раньше, когда изменённых пользователей набралось LEDGER_FLUSH_MAX_DIRTY.
+#close() дописывает всё несохранённое.
+class WriteBehindLedger(TradeLedger):
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.RLock() #состояние в памяти
+        self._flush_lock = threading.Lock() #фоновый сброс и close() не пишут одновременно
+        self._state: dict[int, Wallets] | None = None
+        self._basis: dict[int, Bases] = {}
+        self._seq = 0
+        self._offset = 0
+        self._flushed_seq = 0
+        self._base_seq = 0
+        self._user_seqs: dict[int, int] = {}
+        self._dirty: set[int] = set()
+        self._hooks: list[Callable[[], None]] = []
+        self._interval = float(self._settings.get("LEDGER_FLUSH_INTERVAL_SECONDS", 5))
+        self._max_dirty = int(self._settings.get("LEDGER_FLUSH_MAX_DIRTY", 1000))
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._logger = logging.getLogger(__name__)
+
+    def on_flush(self, hook: Callable[[], None]) -> None:
+        self._hooks.append(hook)
+
+    def _catch_up(self) -> None:
+        if self._state is None:
+            snapshot = self._latest_snapshot()
+            self._state = {uid: dict(w) for uid, w in snapshot["index"].items()}
+            self._basis = {uid: {c: cb.copy() for c, cb in b.items()} for uid, b in snapshot["basis"].items()}
+            self._seq = self._flushed_seq = self._base_seq = int(snapshot.get("seq", 0))
+            self._offset = int(snapshot.get("offset", 0))
+        for pos, entry in self._db.iter_jsonl(self._ledger_path(), offset=self._offset):
+            uid = int(entry["user_id"])
+            apply_trade(self._state.setdefault(uid, {}), entry, self._basis.setdefault(uid, {}))
+            self._seq = max(self._seq, int(entry.get("seq", 0)))
+            self._offset = pos
+            self._dirty.add(uid)
+            self._user_seqs[uid] = int(entry.get("seq", 0))
+
+    def load_user(self, user_id: int) -> tuple[Wallets, Bases]:
+        with self._lock:
+            self._catch_up()
+            uid = int(user_id)
+            return dict(self._state.get(uid, {})), {c: cb.copy() for c, cb in self._basis.get(uid, {}).items()}
+
+    def load_all(self) -> dict[int, Wallets]:
+        with self._lock:
+            self._catch_up()
+            return {uid: dict(w) for uid, w in self._state.items()}
+
+    def load_all_with_basis(self) -> tuple[dict[int, Wallets], dict[int, Bases]]:
+        with self._lock:
+            self._catch_up()
+            state = {uid: dict(w) for uid, w in self._state.items()}
+            basis = {uid: {c: cb.copy() for c, cb in b.items()} for uid, b in self._basis.items()}
+        return state, basis
+
+    def last_seq(self) -> int:
+        with self._lock:
+            self._catch_up()
+            return self._seq
+
+    def user_version(self, user_id: int) -> int:
+        with self._lock:
+            self._catch_up()
+            return self._user_seqs.get(int(user_id), self._base_seq)
+
+    def record_many(self, trades: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        #Синхронно только дозапись в журнал; свои строки применяются тем же догоном, что и чужие.
+        #Блокировка журнала берётся раньше self._lock - в том же порядке, что и у вызывающего _commit_batch
+        with self.locked(), self._lock:
+            self._catch_up()
+            entries = self._entries(trades, self._seq)
+            if not entries:
+                return []
+            #Снимок будет не скоро: до ответа пользователю строки должны быть на диске
+            self._db.append_jsonl(self._ledger_path(), entries, sync=True)
+            self._catch_up()
+            dirty = len(self._dirty)
+        self._start_flusher()
+        if dirty >= self._max_dirty:
+            self._wake.set()
+        return entries
+
+    def snapshot(self) -> int:
+        return self.flush()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                self._catch_up()
+                if self._seq == self._flushed_seq and not self._dirty:
+                    return self._seq
+                seq, offset, changed = self._seq, self._offset, self._dirty
+                self._dirty = set()
+                #Строки собираются под блокировкой (только память), запись на диск - без неё
+                rows = [_wallets_to_row(uid, w, self._basis.get(uid)) for uid, w in sorted(self._state.items())]
+            try:
+                with self.locked():
+                    if seq != self._flushed_seq:
+                        self._save_view(seq, offset, rows, changed)
+                    for hook in self._hooks:
+                        hook()
+            except Exception:
+                with self._lock:
+                    self._dirty |= changed
+                raise
+            self._flushed_seq = seq
+            return seq
+
+    def _start_flusher(self) -> None:
+        if self._thread is not None or self._stop.is_set():
+            return
+        self._thread = threading.Thread(target=self._run, name="ledger-flusher", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                self._logger.error("Не удалось сохранить портфели: %s", str(e))
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import hashlib
 import secrets
+from collections import deque
 from datetime import datetime
 from typing import Any
 
@@ -78,11 +79,96 @@ class User:
             return False
         return self._hash_password(password, self._salt) == self._hashed_password
 
+#Себестоимость позиции в USD: средняя цена и очередь лотов FIFO.
+#Остаток без известной цены (купленный до ведения журнала) списывается первым и в P&L не участвует.
+class CostBasis:
+    _EPS = 1e-12
+
+    def __init__(
+        self,
+        qty: float = 0.0,
+        cost: float = 0.0,
+        lots: list[list[float]] | None = None,
+        realized_avg: float = 0.0,
+        realized_fifo: float = 0.0,
+    ) -> None:
+        self.qty = float(qty)
+        self.cost = float(cost)
+        self.lots: deque[list[float]] = deque([float(q), float(p)] for q, p in (lots or []))
+        self.realized_avg = float(realized_avg)
+        self.realized_fifo = float(realized_fifo)
+
+    @property
+    def avg_cost(self) -> float | None:
+        return self.cost / self.qty if self.qty > self._EPS else None
+
+    def on_buy(self, amount: float, price: float) -> None:
+        self.qty += amount
+        self.cost += amount * price
+        self.lots.append([amount, price])
+
+    def on_sell(self, amount: float, price: float, balance_before: float) -> tuple[float, float]:
+        untracked = max(0.0, balance_before - self.qty)
+        q = min(max(0.0, amount - untracked), self.qty)
+        if q <= self._EPS:
+            return 0.0, 0.0
+
+        avg = self.cost / self.qty
+        realized_avg = q * (price - avg)
+        self.cost -= q * avg
+        self.qty -= q
+
+        realized_fifo = 0.0
+        remaining = q
+        while remaining > self._EPS and self.lots:
+            lot = self.lots[0]
+            take = min(lot[0], remaining)
+            realized_fifo += take * (price - lot[1])
+            remaining -= take
+            if lot[0] - take <= self._EPS:
+                self.lots.popleft()
+            else:
+                lot[0] -= take
+
+        if self.qty <= self._EPS:
+            self.qty, self.cost = 0.0, 0.0
+            self.lots.clear()
+        self.realized_avg += realized_avg
+        self.realized_fifo += realized_fifo
+        return realized_avg, realized_fifo
+
+    def unrealized(self, price: float) -> float:
+        return self.qty * price - self.cost
+
+    def copy(self) -> CostBasis:
+        return CostBasis.from_dict(self.to_dict())
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "qty": self.qty,
+            "cost": self.cost,
+            "lots": [list(lot) for lot in self.lots],
+            "realized_avg": self.realized_avg,
+            "realized_fifo": self.realized_fifo,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any] | None) -> CostBasis:
+        data = data or {}
+        return cls(
+            qty=data.get("qty", 0.0),
+            cost=data.get("cost", 0.0),
+            lots=data.get("lots"),
+            realized_avg=data.get("realized_avg", 0.0),
+            realized_fifo=data.get("realized_fifo", 0.0),
+        )
+
 #Класс для кошелька
 class Wallet:
-    def __init__(self, currency_code: str, balance: float = 0.0) -> None:
+    def __init__(self, currency_code: str, balance: float = 0.0, cost_basis: CostBasis | None = None) -> None:
         self.currency_code = str(currency_code).strip().upper()
         self.balance = balance
+        self.cost_basis = cost_basis or CostBasis()
 
     @property
     def balance(self) -> float:
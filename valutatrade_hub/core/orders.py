@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import heapq
+import logging
+import threading
+from typing import Any, Callable
+
+try:
+    import fcntl #только POSIX; без него два процесса могут сопоставить одну заявку
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from valutatrade_hub.core.utils import utcnow_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+BUY = "BUY"
+SELL = "SELL"
+
+#Исполнитель: получает [(заявка, курс)] и возвращает {id: None - исполнена, str - причина отказа}
+Executor = Callable[[list[tuple[dict[str, Any], float]]], dict[int, str | None]]
+
+
+def _rate(obj: Any) -> float | None:
+    rate = obj.get("rate") if isinstance(obj, dict) else None
+    return float(rate) if isinstance(rate, (int, float)) and rate > 0 else None
+
+
+#Лимитные заявки против курсов провайдеров. По каждой паре две кучи с приоритетом цена-время:
+#покупки - сначала самый высокий лимит, продажи - самый низкий. После нового снимка курсов
+#из вершин снимаются только исполнимые заявки: O(k log n) на k исполненных.
+#orders.jsonl - журнал событий place/cancel/filled/rejected, как у уведомлений о курсах;
+#отменённые заявки удаляются из куч лениво, при извлечении.
+class OrderBook:
+    def __init__(self, executor: Executor | None = None) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._orders: dict[int, dict[str, Any]] = {}
+        self._heaps: dict[str, dict[str, list[tuple[float, int]]]] = {}
+        self._next_id = 1
+        self._dead = 0
+        self._file_id: tuple[int, int] | None = None
+        self._offset = 0
+
+    def _path(self):
+        return self._settings.path_for("ORDERS_FILE")
+
+    def _push(self, order: dict[str, Any]) -> None:
+        heaps = self._heaps.setdefault(f"{order['currency']}_USD", {BUY: [], SELL: []})
+        #Ключ: цена (для покупок со знаком минус, чтобы вершиной был лучший лимит), затем id - время подачи
+        price = -float(order["limit"]) if order["side"] == BUY else float(order["limit"])
+        heapq.heappush(heaps[order["side"]], (price, int(order["id"])))
+
+    def _apply(self, event: dict[str, Any]) -> None:
+        order_id = int(event.get("id", 0))
+        self._next_id = max(self._next_id, order_id + 1)
+        if event.get("event") == "place":
+            if order_id not in self._orders:
+                order = {k: v for k, v in event.items() if k != "event"}
+                self._orders[order_id] = order
+                self._push(order)
+            return
+        if self._orders.pop(order_id, None) is not None:
+            self._dead += 2
+
+    def _sync(self) -> None:
+        path = self._path()
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return
+        file_id = (st.st_dev, st.st_ino)
+        if file_id != self._file_id or st.st_size < self._offset:
+            self._orders, self._heaps, self._next_id, self._dead = {}, {}, 1, 0
+            self._file_id, self._offset = file_id, 0
+        if st.st_size == self._offset:
+            return
+        for pos, event in self._db.iter_jsonl(path, offset=self._offset):
+            self._apply(event)
+            self._offset = pos
+
+    def _append(self, events: list[dict[str, Any]]) -> None:
+        self._db.append_jsonl(self._path(), events)
+        self._dead += sum(2 for e in events if e["event"] != "place")
+        if self._dead >= 1000 and self._dead >= 2 * len(self._orders):
+            self._compact()
+
+    def _compact(self) -> None:
+        self._sync()
+        path = self._path()
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.unlink(missing_ok=True)
+        self._db.append_jsonl(
+            tmp, [{"event": "place", **o} for o in sorted(self._orders.values(), key=lambda o: o["id"])]
+        )
+        tmp.replace(path)
+        st = path.stat()
+        self._file_id, self._offset, self._dead = (st.st_dev, st.st_ino), st.st_size, 0
+        #Кучи пересобираются без отменённых
+        self._heaps = {}
+        for order in self._orders.values():
+            self._push(order)
+
+    def _file_lock(self):
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        lock = open(path.with_suffix(path.suffix + ".lock"), "a+b")
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        return lock
+
+    def place(self, user_id: int, side: str, currency: str, amount: float, limit: float) -> dict[str, Any]:
+        if side not in (BUY, SELL):
+            raise ValueError("side должен быть: buy или sell")
+        with self._lock, self._file_lock():
+            self._sync()
+            order = {
+                "id": self._next_id,
+                "user_id": int(user_id),
+                "side": side,
+                "currency": currency,
+                "amount": float(amount),
+                "limit": float(limit),
+                "created_at": utcnow_iso(),
+            }
+            self._next_id += 1
+            self._orders[order["id"]] = order
+            self._push(order)
+            self._append([{"event": "place", **order}])
+            return order
+
+    def cancel(self, user_id: int, order_id: int) -> bool:
+        with self._lock, self._file_lock():
+            self._sync()
+            order = self._orders.get(int(order_id))
+            if order is None or int(order["user_id"]) != int(user_id):
+                return False
+            del self._orders[int(order_id)]
+            self._append([{"event": "cancel", "id": int(order_id)}])
+            return True
+
+    def for_user(self, user_id: int) -> list[dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            return sorted(
+                (o for o in self._orders.values() if int(o["user_id"]) == int(user_id)),
+                key=lambda o: o["id"],
+            )
+
+    def _take(self, heap: list[tuple[float, int]], eligible: Callable[[float], bool]) -> list[dict[str, Any]]:
+        out: list[dict[str, Any]] = []
+        while heap:
+            key, order_id = heap[0]
+            order = self._orders.get(order_id)
+            if order is None:
+                heapq.heappop(heap) #отменена или исполнена другим процессом
+                continue
+            if not eligible(key):
+                break
+            heapq.heappop(heap)
+            out.append(order)
+        return out
+
+    def match(self, pairs: dict[str, Any]) -> list[dict[str, Any]]:
+        #Один проход после записи снимка курсов; исполнение - одной пачкой через executor
+        if self._executor is None:
+            return []
+        with self._lock, self._file_lock():
+            self._sync()
+            candidates: list[tuple[dict[str, Any], float]] = []
+            for pair, heaps in self._heaps.items():
+                rate = _rate(pairs.get(pair))
+                if rate is None:
+                    continue
+                candidates += [(o, rate) for o in self._take(heaps[BUY], lambda k: -k >= rate)]
+                candidates += [(o, rate) for o in self._take(heaps[SELL], lambda k: k <= rate)]
+            if not candidates:
+                return []
+
+            try:
+                results = self._executor(candidates)
+            except Exception:
+                #Ничего не исполнено - заявки возвращаются в книгу
+                for order, _rate_value in candidates:
+                    self._push(order)
+                raise
+
+            ts = utcnow_iso()
+            events: list[dict[str, Any]] = []
+            done: list[dict[str, Any]] = []
+            for order, rate in candidates:
+                reason = results.get(int(order["id"]))
+                self._orders.pop(int(order["id"]), None)
+                if reason is None:
+                    events.append({"event": "filled", "id": order["id"], "rate": rate, "at": ts})
+                else:
+                    events.append({"event": "rejected", "id": order["id"], "reason": reason, "at": ts})
+                done.append(
+                    {**order, "status": "filled" if reason is None else "rejected", "rate": rate, "reason": reason}
+                )
+            self._append(events)
+        self._logger.info(
+            "Лимитные заявки: исполнено %s, отклонено %s",
+            sum(1 for o in done if o["status"] == "filled"),
+            sum(1 for o in done if o["status"] == "rejected"),
+        )
+        return done
+
+    def history(self, user_id: int, limit: int = 10) -> list[dict[str, Any]]:
+        #Закрытые заявки пользователя из журнала: исполненные и отклонённые
+        placed: dict[int, dict[str, Any]] = {}
+        closed: list[dict[str, Any]] = []
+        for _pos, event in self._db.iter_jsonl(self._path()):
+            order_id = int(event.get("id", 0))
+            if event.get("event") == "place":
+                if int(event.get("user_id", -1)) == int(user_id):
+                    placed[order_id] = event
+            elif event.get("event") in ("filled", "rejected") and order_id in placed:
+                closed.append({**placed.pop(order_id), **event})
+        return closed[-max(1, int(limit)):]
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import logging
+import math
+import re
+import statistics
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Any, Iterable
+
+from valutatrade_hub.core.utils import parse_iso_dt
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_window(value: Any) -> int:
+    #"24h", "90m", "7d" или число секунд
+    m = re.fullmatch(r"\s*(\d+)\s*([smhdw]?)\s*", str(value).lower())
+    if m is None or int(m.group(1)) <= 0:
+        raise ValueError("Окно задаётся как 90m, 24h, 7d или число секунд")
+    return int(m.group(1)) * _UNITS[m.group(2) or "s"]
+
+
+def format_window(seconds: int) -> str:
+    for unit in ("w", "d", "h", "m"):
+        if seconds % _UNITS[unit] == 0:
+            return f"{seconds // _UNITS[unit]}{unit}"
+    return f"{seconds}s"
+
+
+#Колонки истории одной пары: время (epoch) и курс, по возрастанию времени
+class _Series:
+    __slots__ = ("ts", "rates")
+
+    def __init__(self) -> None:
+        self.ts = array("d")
+        self.rates = array("d")
+
+
+#Скользящее окно по паре: суммы курсов и лог-доходностей, монотонные очереди для min/max.
+#Точка добавляется и выбывает ровно один раз, поэтому ответ по окну - амортизированное O(1).
+class _WindowAcc:
+    __slots__ = ("window", "start", "end", "n", "total", "ret_n", "ret_sum", "ret_sq", "mins", "maxs")
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.start = 0
+        self.end = 0
+        self.n = 0
+        self.total = 0.0
+        self.ret_n = 0
+        self.ret_sum = 0.0
+        self.ret_sq = 0.0
+        self.mins: deque[int] = deque()
+        self.maxs: deque[int] = deque()
+
+    def push(self, s: _Series, i: int) -> None:
+        x = s.rates[i]
+        self.n += 1
+        self.total += x
+        #Доходность считается, только если обе точки в окне
+        if i - 1 >= self.start:
+            r = math.log(x / s.rates[i - 1])
+            self.ret_n += 1
+            self.ret_sum += r
+            self.ret_sq += r * r
+        while self.mins and s.rates[self.mins[-1]] >= x:
+            self.mins.pop()
+        self.mins.append(i)
+        while self.maxs and s.rates[self.maxs[-1]] <= x:
+            self.maxs.pop()
+        self.maxs.append(i)
+        self.end = i + 1
+
+    def expire(self, s: _Series, now: float) -> None:
+        cutoff = now - self.window
+        while self.start < self.end and s.ts[self.start] < cutoff:
+            i = self.start
+            self.n -= 1
+            self.total -= s.rates[i]
+            if i + 1 < self.end:
+                r = math.log(s.rates[i + 1] / s.rates[i])
+                self.ret_n -= 1
+                self.ret_sum -= r
+                self.ret_sq -= r * r
+            self.start += 1
+        if self.n == 0:
+            #Пустое окно - сбрасываем накопленную погрешность сумм
+            self.total = self.ret_sum = self.ret_sq = 0.0
+            self.ret_n = 0
+        while self.mins and self.mins[0] < self.start:
+            self.mins.popleft()
+        while self.maxs and self.maxs[0] < self.start:
+            self.maxs.popleft()
+
+
+def _ema_step(state: tuple[float, float] | None, ts: float, x: float, tau: float) -> tuple[float, float]:
+    #EMA по времени: вес нового курса зависит от интервала до прошлой точки, а не от числа точек
+    if state is None:
+        return ts, x
+    last_ts, value = state
+    alpha = 1.0 - math.exp(-max(ts - last_ts, 0.0) / tau)
+    return ts, value + alpha * (x - value)
+
+
+def _ema_tau(window: int) -> float:
+    #Постоянная времени - половина окна: средний лаг как у SMA того же окна
+    return window / 2.0
+
+
+#Скользящая аналитика по истории курсов (exchange_rates.json).
+#История читается один раз в колонки array("d"); дальше RatesUpdater передаёт новые записи в ingest(),
+#и аккумуляторы окон из RATE_STATS_WINDOWS обновляются инкрементально. Остальные окна считаются
+#по срезу колонок (bisect по времени). Если историю дописал другой процесс (сменились mtime/размер файла),
+#колонки перечитываются при следующем запросе.
+class RateStats:
+    def __init__(self) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._windows = sorted(
+            {parse_window(w) for w in self._settings.get("RATE_STATS_WINDOWS", ["1h", "24h", "7d"])}
+        )
+        self._loaded: tuple[int, int] | None = None
+        self._version = 0
+        self._series: dict[str, _Series] = {}
+        self._accs: dict[str, dict[int, _WindowAcc]] = {}
+        self._emas: dict[str, dict[int, tuple[float, float]]] = {}
+        self._corr_cache: dict[tuple[int, int], tuple[int, dict[str, Any]]] = {}
+
+    def _file_state(self) -> tuple[int, int]:
+        try:
+            st = self._settings.path_for("HISTORY_FILE").stat()
+        except FileNotFoundError:
+            return (0, 0)
+        return st.st_mtime_ns, st.st_size
+
+    def _reset(self) -> None:
+        self._series, self._accs, self._emas, self._corr_cache = {}, {}, {}, {}
+        self._version += 1
+
+    def _ensure_loaded(self) -> None:
+        state = self._file_state()
+        if state == self._loaded:
+            return
+        self._reset()
+        self._ingest(self._db.load_history())
+        self._loaded = state
+
+    def _ingest(self, records: Iterable[dict[str, Any]]) -> int:
+        points: list[tuple[float, str, float]] = []
+        for rec in records:
+            rate = rec.get("rate")
+            dt = parse_iso_dt(rec.get("timestamp") or "")
+            if not isinstance(rate, (int, float)) or rate <= 0 or dt is None:
+                continue
+            pair = f"{rec.get('from_currency')}_{rec.get('to_currency')}"
+            points.append((dt.timestamp(), pair, float(rate)))
+        points.sort()
+        added = 0
+        for ts, pair, rate in points:
+            s = self._series.get(pair)
+            if s is None:
+                s = self._series[pair] = _Series()
+                self._accs[pair] = {w: _WindowAcc(w) for w in self._windows}
+                self._emas[pair] = {}
+            #Повтор того же updated_at провайдера - не новая точка
+            if s.ts and ts <= s.ts[-1]:
+                continue
+            s.ts.append(ts)
+            s.rates.append(rate)
+            i = len(s.ts) - 1
+            for acc in self._accs[pair].values():
+                acc.push(s, i)
+                acc.expire(s, ts)
+            emas = self._emas[pair]
+            for w in self._windows:
+                emas[w] = _ema_step(emas.get(w), ts, rate, _ema_tau(w))
+            added += 1
+        if added:
+            self._version += 1
+        return added
+
+    def ingest(self, records: list[dict[str, Any]]) -> None:
+        #Вызывается RatesUpdater после записи истории; пока статистику не запрашивали - ничего не делает
+        with self._lock:
+            if self._loaded is None:
+                return
+            self._ingest(records)
+            self._loaded = self._file_state()
+
+    def pairs(self) -> list[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return sorted(self._series)
+
+    def stats(self, pair: str, window: int, now: float | None = None) -> dict[str, Any] | None:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            s = self._series.get(pair)
+            if s is None:
+                return None
+            acc = self._accs[pair].get(window)
+            if acc is not None:
+                acc.expire(s, now)
+                return self._from_acc(pair, s, acc, self._emas[pair].get(window))
+            return self._from_slice(pair, s, window, now)
+
+    def _from_acc(
+        self, pair: str, s: _Series, acc: _WindowAcc, ema: tuple[float, float] | None
+    ) -> dict[str, Any]:
+        if acc.n == 0:
+            return {"pair": pair, "window": acc.window, "points": 0}
+        return {
+            "pair": pair,
+            "window": acc.window,
+            "points": acc.n,
+            "last": s.rates[acc.end - 1],
+            "sma": acc.total / acc.n,
+            "ema": ema[1] if ema is not None else None,
+            "min": s.rates[acc.mins[0]],
+            "max": s.rates[acc.maxs[0]],
+            "volatility": math.sqrt(max(acc.ret_sq, 0.0)) if acc.ret_n else None,
+            "returns": acc.ret_n,
+        }
+
+    def _from_slice(self, pair: str, s: _Series, window: int, now: float) -> dict[str, Any]:
+        lo = bisect_left(s.ts, now - window)
+        hi = bisect_right(s.ts, now)
+        if lo >= hi:
+            return {"pair": pair, "window": window, "points": 0}
+        rates = s.rates[lo:hi]
+        returns = [math.log(b / a) for a, b in zip(rates, rates[1:])]
+        ema: tuple[float, float] | None = None
+        tau = _ema_tau(window)
+        #EMA помнит курсы и до начала окна - как и инкрементальная
+        for ts, x in zip(s.ts[:hi], s.rates[:hi]):
+            ema = _ema_step(ema, ts, x, tau)
+        return {
+            "pair": pair,
+            "window": window,
+            "points": len(rates),
+            "last": rates[-1],
+            "sma": math.fsum(rates) / len(rates),
+            "ema": ema[1] if ema is not None else None,
+            "min": min(rates),
+            "max": max(rates),
+            "volatility": math.sqrt(math.fsum(r * r for r in returns)) if returns else None,
+            "returns": len(returns),
+        }
+
+    def correlations(self, window: int, now: float | None = None) -> dict[str, Any]:
+        #Корреляция лог-доходностей пар на общей сетке времени (последний известный курс в узле).
+        #Матрица кешируется до следующего изменения истории.
+        now = time.time() if now is None else now
+        step = max(1, int(self._settings.get("RATE_STATS_CORR_STEP_SECONDS", 1200)))
+        with self._lock:
+            self._ensure_loaded()
+            key = (window, int(now // step))
+            cached = self._corr_cache.get(key)
+            if cached is not None and cached[0] == self._version:
+                return cached[1]
+
+            grid = [now - window + k * step for k in range(window // step + 1)]
+            returns: dict[str, list[float | None]] = {}
+            for pair, s in self._series.items():
+                values: list[float | None] = []
+                for t in grid:
+                    i = bisect_right(s.ts, t) - 1
+                    values.append(s.rates[i] if i >= 0 else None)
+                rets = [
+                    math.log(b / a) if a is not None and b is not None else None
+                    for a, b in zip(values, values[1:])
+                ]
+                if sum(1 for r in rets if r is not None) >= 2:
+                    returns[pair] = rets
+
+            names = sorted(returns)
+            matrix: dict[str, dict[str, float | None]] = {p: {} for p in names}
+            for i, a in enumerate(names):
+                matrix[a][a] = 1.0
+                for b in names[i + 1:]:
+                    xs, ys = [], []
+                    for x, y in zip(returns[a], returns[b]):
+                        if x is not None and y is not None:
+                            xs.append(x)
+                            ys.append(y)
+                    try:
+                        value: float | None = statistics.correlation(xs, ys)
+                    except statistics.StatisticsError:
+                        value = None #мало общих точек или курс не менялся
+                    matrix[a][b] = matrix[b][a] = value
+            result = {"window": window, "step": step, "pairs": names, "matrix": matrix}
+            self._corr_cache = {key: (self._version, result)}
+            return result
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import itertools
+import threading
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from valutatrade_hub.core.rates_view import RatesIndex
+
+#Неизменяемый снимок курсов в памяти процесса. Обновление курсов собирает новый объект
+#и подменяет ссылку на него целиком (присваивание ссылки атомарно), читатели берут ссылку
+#один раз на команду: все поиски внутри команды идут по одному снимку, без блокировок и без разбора JSON.
+class RatesSnapshot:
+    __slots__ = ("version", "last_refresh", "origin", "_pairs", "_doc", "_index", "_index_lock")
+
+    #origin - откуда снимок: ("shm", seq) или ("file", mtime_ns, size, inode); по нему видно, что источник сменился
+    def __init__(self, doc: dict[str, Any], version: int, origin: tuple | None = None) -> None:
+        pairs: dict[str, tuple[float, str, str]] = {}
+        raw: dict[str, dict[str, Any]] = {}
+        for pair, obj in (doc.get("pairs", {}) or {}).items():
+            if not isinstance(obj, dict):
+                continue
+            raw[pair] = dict(obj)
+            rate = obj.get("rate")
+            updated_at = obj.get("updated_at")
+            if isinstance(rate, (int, float)) and isinstance(updated_at, str):
+                pairs[pair] = (float(rate), updated_at, str(obj.get("source", "unknown")))
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "last_refresh", doc.get("last_refresh"))
+        object.__setattr__(self, "origin", origin)
+        object.__setattr__(self, "_pairs", MappingProxyType(pairs))
+        object.__setattr__(self, "_doc", MappingProxyType(raw))
+        object.__setattr__(self, "_index", None)
+        object.__setattr__(self, "_index_lock", threading.Lock())
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("RatesSnapshot неизменяем")
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def __contains__(self, pair: str) -> bool:
+        return pair in self._pairs
+
+    @property
+    def pairs(self) -> Mapping[str, dict[str, Any]]:
+        #Пары в формате rates.json - для уведомлений и заявок; словари внутри не менять
+        return self._doc
+
+    def rate(self, pair: str) -> tuple[float, str, str] | None:
+        #(курс, updated_at, источник) или None
+        return self._pairs.get(pair)
+
+    def convert(self, from_code: str, to_code: str) -> tuple[float, str, str] | None:
+        #Прямая пара, иначе обратная
+        direct = self._pairs.get(f"{from_code}_{to_code}")
+        if direct is not None:
+            return direct
+        rev = self._pairs.get(f"{to_code}_{from_code}")
+        if rev is None or rev[0] == 0:
+            return None
+        return 1.0 / rev[0], rev[1], rev[2]
+
+    @property
+    def index(self) -> RatesIndex:
+        #Индекс для show-rates строится при первом обращении, один раз на снимок
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    object.__setattr__(
+                        self, "_index", RatesIndex({"pairs": self._doc, "last_refresh": self.last_refresh})
+                    )
+        return self._index
+
+
+_versions = itertools.count(1)
+_publish_lock = threading.Lock()
+_current = RatesSnapshot({}, 0)
+
+
+def current_snapshot() -> RatesSnapshot:
+    return _current
+
+
+def _newer_shm(current: tuple | None, origin: tuple | None) -> bool:
+    return bool(current and origin and current[0] == origin[0] == "shm" and current[1] > origin[1])
+
+
+def publish_snapshot(doc: dict[str, Any], origin: tuple | None = None) -> RatesSnapshot:
+    #Писатели (обновление курсов в фоне и в CLI) сериализуются между собой, читатели - нет
+    global _current
+    with _publish_lock:
+        if _newer_shm(_current.origin, origin):
+            return _current #пока писали, уже принят более новый снимок другого процесса
+        snap = RatesSnapshot(doc, next(_versions), origin)
+        _current = snap
+    return snap
+
+
+def adopt_snapshot(doc: dict[str, Any], origin: tuple) -> RatesSnapshot:
+    #Снимок, опубликованный другим процессом (rates.shm или rates.json): подменяем, только если источник
+    #сменился. Сравнение по seq или mtime/размеру файла, а не по last_refresh - у того секундная точность
+    global _current
+    with _publish_lock:
+        if _current.version and (_current.origin == origin or _newer_shm(_current.origin, origin)):
+            return _current
+        snap = RatesSnapshot(doc, next(_versions), origin)
+        _current = snap
+    return snap
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import heapq
+import json
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Any, Iterable, NamedTuple
+
+from valutatrade_hub.core.utils import parse_iso_dt
+
+
+class RateRow(NamedTuple):
+    pair: str
+    rate: float
+    updated_at: str
+    source: str
+    age_key: float #метка времени обновления (epoch), -inf если неизвестна
+
+
+#Индекс по снимку курсов: строится один раз на снимок (по last_refresh)
+class RatesIndex:
+    def __init__(self, rates_doc: dict[str, Any]) -> None:
+        self.last_refresh = rates_doc.get("last_refresh")
+        rows: list[RateRow] = []
+        for pair, obj in (rates_doc.get("pairs", {}) or {}).items():
+            if not isinstance(obj, dict):
+                continue
+            rate = obj.get("rate")
+            if not isinstance(rate, (int, float)):
+                continue
+            updated_at = str(obj.get("updated_at") or "")
+            dt = parse_iso_dt(updated_at)
+            if dt is not None and dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            rows.append(
+                RateRow(
+                    pair=pair,
+                    rate=float(rate),
+                    updated_at=updated_at,
+                    source=str(obj.get("source", "unknown")),
+                    age_key=dt.timestamp() if dt is not None else float("-inf"),
+                )
+            )
+
+        rows.sort(key=lambda r: r.pair)
+        self._by_pair = rows
+        self._by_rate = sorted(rows, key=lambda r: r.rate, reverse=True)
+        self._by_currency: dict[str, list[RateRow]] = {}
+        for row in rows:
+            base, _, quote = row.pair.partition("_")
+            self._by_currency.setdefault(base, []).append(row)
+            if quote and quote != base:
+                self._by_currency.setdefault(quote, []).append(row)
+
+    def __len__(self) -> int:
+        return len(self._by_pair)
+
+    def query(
+        self,
+        currency: str | None = None,
+        source: str | None = None,
+        max_age_seconds: int | None = None,
+        stale_after_seconds: int | None = None,
+        top: int | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+    ) -> list[RateRow]:
+        now = datetime.now(timezone.utc).timestamp()
+        src = source.strip().lower() if source else None
+
+        def keep(row: RateRow) -> bool:
+            if src is not None and row.source.lower() != src:
+                return False
+            if max_age_seconds is not None and now - row.age_key > max_age_seconds:
+                return False
+            if stale_after_seconds is not None and now - row.age_key <= stale_after_seconds:
+                return False
+            return True
+
+        offset = max(0, int(offset))
+        count = None if limit is None else max(0, int(limit))
+        if top is not None:
+            count = max(0, int(top)) if count is None else min(count, int(top))
+
+        if currency is not None:
+            candidates: Iterable[RateRow] = (r for r in self._by_currency.get(currency, []) if keep(r))
+            if top is not None:
+                #В пределах одной валюты список короткий - берём top через кучу
+                return heapq.nlargest(offset + count, candidates, key=lambda r: r.rate)[offset:]
+        else:
+            ordered = self._by_rate if top is not None else self._by_pair
+            candidates = (r for r in ordered if keep(r))
+
+        stop = None if count is None else offset + count
+        return list(islice(candidates, offset, stop))
+
+
+#Отрисовка без PrettyTable для больших выдач
+def render_plain(rows: list[RateRow]) -> str:
+    width = max((len(r.pair) for r in rows), default=4)
+    lines = [f"{'PAIR':<{width}}  {'RATE':>20}  {'UPDATED_AT':<20}  SOURCE"]
+    lines.extend(f"{r.pair:<{width}}  {r.rate:>20.8f}  {r.updated_at:<20}  {r.source}" for r in rows)
+    return "\n".join(lines)
+
+
+def render_json(rows: list[RateRow], last_refresh: str | None, offset: int) -> str:
+    return json.dumps(
+        {
+            "last_refresh": last_refresh,
+            "offset": offset,
+            "count": len(rows),
+            "items": [
+                {"pair": r.pair, "rate": r.rate, "updated_at": r.updated_at, "source": r.source}
+                for r in rows
+            ],
+        },
+        ensure_ascii=False,
+    )
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import csv
+import json
+from pathlib import Path
+from typing import Any
+
+from valutatrade_hub.core.currencies import get_currency
+from valutatrade_hub.core.rates_snapshot import RatesSnapshot
+
+Weights = dict[str, float]
+
+
+def normalize_weights(raw: dict[str, Any]) -> Weights:
+    #Доли или проценты - приводим к сумме 1; коды проверяются по реестру валют
+    weights: Weights = {}
+    for code, value in raw.items():
+        w = float(value)
+        if w < 0:
+            raise ValueError(f"Доля {code} не может быть отрицательной")
+        code = get_currency(str(code)).code
+        weights[code] = weights.get(code, 0.0) + w
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Сумма целевых долей должна быть положительной")
+    return {code: w / total for code, w in weights.items()}
+
+
+def parse_weights(text: str) -> Weights:
+    #"USD=60,BTC=30,ETH=10"
+    raw: dict[str, float] = {}
+    for part in str(text).split(","):
+        code, sep, value = part.strip().partition("=")
+        if not sep:
+            raise ValueError("Доли задаются как USD=60,BTC=30,ETH=10")
+        raw[code.strip().upper()] = raw.get(code.strip().upper(), 0.0) + float(value)
+    return normalize_weights(raw)
+
+
+def load_targets(path: Path) -> dict[str, Weights]:
+    #JSON {"пользователь": {"USD": 60, ...}} или CSV с колонками user,currency,weight.
+    #Пользователь - имя или id
+    if path.suffix.lower() == ".csv":
+        raw: dict[str, dict[str, float]] = {}
+        with path.open("r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                user = str(row.get("user", "")).strip()
+                code = str(row.get("currency", "")).strip().upper()
+                if not user or not code:
+                    continue
+                weights = raw.setdefault(user, {})
+                weights[code] = weights.get(code, 0.0) + float(row.get("weight") or 0)
+    else:
+        raw = json.loads(path.read_text(encoding="utf-8"))
+        if not isinstance(raw, dict):
+            raise ValueError("Файл целей: объект {пользователь: {валюта: доля}}")
+    return {str(user): normalize_weights(w) for user, w in raw.items()}
+
+
+def plan_user(
+    user_id: int,
+    balances: dict[str, float],
+    weights: Weights,
+    rates: RatesSnapshot,
+    min_trade_usd: float,
+) -> dict[str, Any]:
+    #Сделки против USD, приводящие портфель к целевым долям по одному снимку курсов.
+    #Считается колонками: коды, балансы, курсы, стоимости - без поиска курса на каждую операцию
+    codes = sorted(c for c in set(balances) | set(weights) if balances.get(c, 0.0) > 0 or weights.get(c, 0.0) > 0)
+    qty = [max(float(balances.get(c, 0.0)), 0.0) for c in codes]
+    px: list[float] = []
+    for c in codes:
+        rate = (1.0, "", "") if c == "USD" else rates.convert(c, "USD")
+        if rate is None:
+            return {"user_id": user_id, "error": f"нет курса {c}→USD", "trades": []}
+        px.append(rate[0])
+    values = [q * p for q, p in zip(qty, px)]
+    total = sum(values)
+    if total <= 0:
+        return {"user_id": user_id, "error": "портфель пуст", "trades": []}
+
+    target = [weights.get(c, 0.0) * total for c in codes]
+    deltas = [t - v for t, v in zip(target, values)]
+    drift = max(abs(v / total - weights.get(c, 0.0)) for c, v in zip(codes, values))
+
+    #Сначала продажи, потом покупки: покупки оплачиваются из USD после продаж
+    sells: list[dict[str, Any]] = []
+    buys: list[dict[str, Any]] = []
+    for c, q, p, d in zip(codes, qty, px, deltas):
+        if c == "USD" or abs(d) < min_trade_usd:
+            continue
+        if d < 0:
+            #Цель 0 - продаём весь остаток, без пыли от округления
+            amount = q if weights.get(c, 0.0) == 0 else min(-d / p, q)
+            sells.append({"user_id": user_id, "side": "SELL", "currency": c, "amount": amount, "rate": p})
+        else:
+            buys.append({"user_id": user_id, "side": "BUY", "currency": c, "amount": d / p, "rate": p})
+
+    usd = qty[codes.index("USD")] if "USD" in codes else 0.0
+    cash = usd + sum(t["amount"] * t["rate"] for t in sells)
+    cost = sum(t["amount"] * t["rate"] for t in buys)
+    if cost > cash > 0:
+        #Погрешность округления не должна превращаться в нехватку средств
+        scale = cash / cost * (1 - 1e-12)
+        for t in buys:
+            t["amount"] *= scale
+    elif cost > cash:
+        buys = []
+    trades = sells + buys
+    for t in trades:
+        t["usd_delta"] = t["amount"] * t["rate"] * (1.0 if t["side"] == "SELL" else -1.0)
+    return {"user_id": user_id, "total_usd": total, "drift": drift, "trades": trades}
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+#Переменная окружения для скриптов: токен без локального файла
+TOKEN_ENV = "VALUTATRADE_TOKEN"
+
+
+def _token_key(token: str) -> str:
+    #В хранилище только хеш токена: утечка sessions.json не даёт войти
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+#Сессии, переживающие перезапуск CLI: data/sessions.json - {sha256(токен): запись},
+#сам токен - в локальном файле SESSION_TOKEN_FILE (или в VALUTATRADE_TOKEN).
+#Поиск по хешу - одно обращение к словарю, без users.json и без хеширования пароля.
+class SessionStore:
+    def __init__(self) -> None:
+        self._db = DatabaseManager()
+        self._settings = SettingsLoader()
+        self._lock = threading.Lock()
+
+    def _path(self) -> Path:
+        return self._settings.path_for("SESSIONS_FILE")
+
+    def _token_path(self) -> Path:
+        return self._settings.path_for("SESSION_TOKEN_FILE")
+
+    def issue(self, user_id: int, username: str) -> str:
+        token = secrets.token_urlsafe(32)
+        ttl = int(self._settings.get("SESSION_TTL_SECONDS", 43200))
+        now = time.time()
+        with self._lock:
+            sessions = self._db.read_json(self._path(), default={})
+            #Заодно вычищаем истёкшие, чтобы файл не рос
+            sessions = {k: v for k, v in sessions.items() if float(v.get("expires_ts", 0)) > now}
+            sessions[_token_key(token)] = {
+                "user_id": int(user_id),
+                "username": username,
+                "created_ts": now,
+                "expires_ts": now + ttl,
+            }
+            self._db.write_json(self._path(), sessions)
+        return token
+
+    def resolve(self, token: str) -> dict[str, Any] | None:
+        if not token:
+            return None
+        with self._lock:
+            entry = self._db.read_json(self._path(), default={}).get(_token_key(token))
+        if not isinstance(entry, dict) or float(entry.get("expires_ts", 0)) <= time.time():
+            return None
+        return entry
+
+    def revoke(self, token: str) -> bool:
+        if not token:
+            return False
+        with self._lock:
+            sessions = self._db.read_json(self._path(), default={})
+            if sessions.pop(_token_key(token), None) is None:
+                return False
+            self._db.write_json(self._path(), sessions)
+        return True
+
+    def local_token(self) -> str:
+        env = os.getenv(TOKEN_ENV, "").strip()
+        if env:
+            return env
+        try:
+            return self._token_path().read_text(encoding="utf-8").strip()
+        except OSError:
+            return ""
+
+    def save_local_token(self, token: str) -> None:
+        path = self._token_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        #Файл с токеном доступен только владельцу
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(token)
+
+    def clear_local_token(self) -> None:
+        try:
+            self._token_path().unlink()
+        except FileNotFoundError:
+            pass
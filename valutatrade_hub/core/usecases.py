@@ -1,20 +1,43 @@
 from __future__ import annotations
 
+import json
+import threading
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable
 
 from prettytable import PrettyTable #выводит таблицу в определеоном формате
 
-from valutatrade_hub.core.currencies import get_currency
-from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.core.alerts import ABOVE, BELOW, AlertBook
+from valutatrade_hub.core.currencies import find_currencies, get_currency, register_currencies
+from valutatrade_hub.core.demand import DemandTracker
+from valutatrade_hub.core.exceptions import ApiRequestError, InsufficientFundsError
+from valutatrade_hub.core.exposure import ExposureAggregates
+from valutatrade_hub.core.ledger import TradeLedger, WriteBehindLedger
 from valutatrade_hub.core.models import Portfolio, User, Wallet
+from valutatrade_hub.core.orders import BUY, SELL, OrderBook
+from valutatrade_hub.core.rate_stats import RateStats, format_window, parse_window
+from valutatrade_hub.core.rates_snapshot import RatesSnapshot, adopt_snapshot, current_snapshot
+from valutatrade_hub.core.rates_view import render_json, render_plain
+from valutatrade_hub.core.sessions import SessionStore
 from valutatrade_hub.core.utils import parse_iso_dt, validate_amount
+from valutatrade_hub.core.valuation_cache import ValuationCache
 from valutatrade_hub.decorators import log_action
 from valutatrade_hub.infra.database import DatabaseManager
 from valutatrade_hub.infra.settings import SettingsLoader
-from valutatrade_hub.logging_config import setup_logging
+from valutatrade_hub.infra.shared_rates import SharedRatesReader, publish_rates
+from valutatrade_hub.logging_config import logging_stats, setup_logging, shutdown_logging
+from valutatrade_hub.parser_service.pipeline import AsyncRatesScheduler
 from valutatrade_hub.parser_service.scheduler import RatesScheduler
 
+def _format_pipeline_metrics(metrics: dict[str, dict]) -> str:
+    return "\n".join(
+        f"- {stage}: вход {m['received']}, выход {m['emitted']}, отброшено {m['dropped']}, "
+        f"{m['per_s']}/с, занятость {m['busy_pct']}%, очередь {m['queue_depth']} (макс. {m['max_queue_depth']})"
+        for stage, m in metrics.items()
+    )
+
 #Реализация бизнес-логики
 @dataclass
 class Session:
@@ -23,13 +46,63 @@ class Session:
 
 #Основной класс для реализации логики
 class CoreUseCases:
-    def __init__(self) -> None:
+    def __init__(self, rate_clients: Callable[[str], list] | None = None, autostart: bool = True) -> None:
+        #rate_clients - подставные провайдеры для update-rates (нагрузочный прогон); autostart - фоновое автообновление
         setup_logging()
         self._db = DatabaseManager()
         self._settings = SettingsLoader()
         self.session = Session()
-        self._scheduler = RatesScheduler(interval_seconds=3600) #автообнолвение раз в час
-        self._scheduler.start()
+        self._sessions = SessionStore()
+        self._restore_session()
+        self._write_behind = bool(self._settings.get("LEDGER_WRITE_BEHIND", False))
+        if self._write_behind:
+            #Сделка пишет только строку журнала; портфели и агрегаты сохраняет фоновый сброс
+            self._ledger = WriteBehindLedger()
+            self._exposure = ExposureAggregates(write_behind=True)
+            self._ledger.on_flush(self._exposure.flush)
+        else:
+            self._ledger = TradeLedger()
+            self._exposure = ExposureAggregates()
+        self._shared_rates = SharedRatesReader()
+        self._shared_doc: dict | None = None
+        if self._shared_rates.snapshot() is None:
+            #Первый запуск после обновления: публикуем уже сохранённый rates.json
+            rates = self._db.load_rates()
+            if rates.get("pairs"):
+                publish_rates(rates)
+        self._demand = DemandTracker()
+        self._alerts = AlertBook()
+        self._trade_lock = threading.RLock() #сделки потоков этого процесса; между процессами - блокировка журнала
+        self._orders = OrderBook(executor=self._execute_fills)
+        self._stats = RateStats()
+        self._valuations = ValuationCache()
+        self._rate_clients = rate_clients
+        interval = int(self._settings.get("RATES_HOT_INTERVAL_SECONDS", 1200))
+        if str(self._settings.get("RATES_PIPELINE", "thread")).lower() == "asyncio":
+            self._scheduler = AsyncRatesScheduler(
+                interval_seconds=interval,
+                demand=self._demand,
+                alerts=self._alerts,
+                orders=self._orders,
+                stats=self._stats,
+            )
+        else:
+            self._scheduler = RatesScheduler(
+                interval_seconds=interval,
+                demand=self._demand,
+                alerts=self._alerts,
+                orders=self._orders,
+                stats=self._stats,
+            ) #автообновление по спросу
+        if autostart:
+            self._scheduler.start()
+
+    def _restore_session(self) -> None:
+        #Вход по сохранённому токену: login в прошлом запуске CLI
+        entry = self._sessions.resolve(self._sessions.local_token())
+        if entry is not None:
+            self.session.user_id = int(entry["user_id"])
+            self.session.username = str(entry["username"])
 
     def _ensure_logged_in(self) -> None:
         if self.session.user_id is None:
@@ -57,35 +130,36 @@ class CoreUseCases:
         if len(password) < 4:
             raise ValueError("Пароль должен быть не короче 4 символов")
 
-        users = self._db.load_users()
-        if any(u.get("username") == username for u in users):
-            return f"Имя пользователя '{username}' уже занято"
+        with self._db.users_locked():
+            users = self._db.load_users()
+            if any(u.get("username") == username for u in users):
+                return f"Имя пользователя '{username}' уже занято"
 
-        user_id = self._next_user_id(users)
+            user_id = self._next_user_id(users)
 
-        tmp_user = User(
-            user_id=user_id,
-            username=username,
-            hashed_password="",
-            salt=User.generate_salt(),
-            registration_date=datetime.now(timezone.utc).replace(microsecond=0),
-        )
-        tmp_user.change_password(password)
-
-        users.append(
-            {
-                "user_id": user_id,
-                "username": tmp_user.username,
-                "hashed_password": tmp_user.hashed_password,
-                "salt": tmp_user.salt,
-                "registration_date": tmp_user.registration_date.isoformat(),
-            }
-        )
-        self._db.save_users(users) #сохранение пользователей в базу
+            tmp_user = User(
+                user_id=user_id,
+                username=username,
+                hashed_password="",
+                salt=User.generate_salt(),
+                registration_date=datetime.now(timezone.utc).replace(microsecond=0),
+            )
+            tmp_user.change_password(password)
+
+            users.append(
+                {
+                    "user_id": user_id,
+                    "username": tmp_user.username,
+                    "hashed_password": tmp_user.hashed_password,
+                    "salt": tmp_user.salt,
+                    "registration_date": tmp_user.registration_date.isoformat(),
+                }
+            )
+            self._db.save_users(users) #сохранение пользователей в базу
 
-        portfolios = self._db.load_portfolios()
-        portfolios.append({"user_id": user_id, "wallets": {}})
-        self._db.save_portfolios(portfolios)
+            portfolios = self._db.load_portfolios()
+            portfolios.append({"user_id": user_id, "wallets": {}})
+            self._db.save_portfolios(portfolios)
 
         return (
             f"Пользователь '{username}' зарегистрирован (id={user_id}). "
@@ -112,63 +186,144 @@ class CoreUseCases:
         if not user.verify_password(password):
             return "Неверный пароль"
 
+        self._sessions.revoke(self._sessions.local_token())
+        self._sessions.save_local_token(self._sessions.issue(user.user_id, user.username))
         self.session.user_id = user.user_id
         self.session.username = user.username
         return f"Вы вошли как '{user.username}'"
 
+    @log_action("LOGOUT")
+    def logout(self) -> str:
+        self._ensure_logged_in()
+        username = self.session.username
+        self._sessions.revoke(self._sessions.local_token())
+        self._sessions.clear_local_token()
+        self.session.user_id = None
+        self.session.username = None
+        return f"Сессия '{username}' завершена"
+
+    @staticmethod
+    def _build_portfolio(user_id: int, balances: dict[str, float], basis: dict) -> Portfolio:
+        wallets = {
+            code: Wallet(currency_code=code, balance=b, cost_basis=basis.get(code))
+            for code, b in balances.items()
+        }
+        return Portfolio(user_id=int(user_id), wallets=wallets)
+
+    def _load_portfolio(self, user_id: int) -> Portfolio:
+        balances, basis = self._ledger.load_user(int(user_id))
+        return self._build_portfolio(user_id, balances, basis)
+
     def _load_portfolio_for_session(self) -> Portfolio:
         self._ensure_logged_in()
-        portfolios = self._db.load_portfolios()
-        row = next((p for p in portfolios if int(p.get("user_id")) == self.session.user_id), None)
-        if row is None:
-            return Portfolio(user_id=int(self.session.user_id), wallets={})
-
-        wallets_data = row.get("wallets", {}) or {}
-        wallets: dict[str, Wallet] = {}
-        for code, w in wallets_data.items():
-            if isinstance(w, dict):
-                balance = float(w.get("balance", 0.0))
-                ccode = str(w.get("currency_code", code)).upper()
-            else:
-                balance = float(w)
-                ccode = str(code).upper()
-            wallets[ccode] = Wallet(currency_code=ccode, balance=balance)
-        return Portfolio(user_id=int(self.session.user_id), wallets=wallets)
-
-    def _save_portfolio(self, portfolio: Portfolio) -> None:
-        portfolios = self._db.load_portfolios()
-        row = next((p for p in portfolios if int(p.get("user_id")) == portfolio.user_id), None)
-        wallets_dump = {c: {"currency_code": c, "balance": w.balance} for c, w in portfolio.wallets.items()}
-        if row is None:
-            portfolios.append({"user_id": portfolio.user_id, "wallets": wallets_dump})
-        else:
-            row["wallets"] = wallets_dump
-        self._db.save_portfolios(portfolios)
-
-    def _get_rate_pair(self, pair: str) -> tuple[float, str, str] | None:
-        rates = self._db.load_rates()
-        pairs = rates.get("pairs", {}) or {}
-        obj = pairs.get(pair)
-        if not isinstance(obj, dict):
-            return None
-        rate = obj.get("rate")
-        updated_at = obj.get("updated_at")
-        source = obj.get("source", "unknown")
-        if not isinstance(rate, (int, float)) or not isinstance(updated_at, str):
-            return None
-        return float(rate), updated_at, str(source)
-
-    def _get_rate(self, from_code: str, to_code: str) -> tuple[float, str, str] | None:
-        direct = self._get_rate_pair(f"{from_code}_{to_code}")
-        if direct is not None:
-            return direct
-        rev = self._get_rate_pair(f"{to_code}_{from_code}")
-        if rev is None:
-            return None
-        rate, updated_at, source = rev
-        if rate == 0:
-            return None
-        return 1.0 / rate, updated_at, source
+        return self._load_portfolio(int(self.session.user_id))
+
+    def _commit_trade(
+        self,
+        portfolio: Portfolio,
+        before: dict[str, float],
+        side: str,
+        currency_code: str,
+        amount: float,
+        rate: float,
+        usd_delta: float,
+    ) -> None:
+        trade = {"user_id": portfolio.user_id, "side": side, "currency": currency_code, "amount": amount}
+        self._commit_batch([(portfolio, before)], [{**trade, "rate": rate, "usd_delta": usd_delta}])
+
+    def _commit_batch(self, changes: list[tuple[Portfolio, dict[str, float]]], trades: list[dict]) -> None:
+        #Сделки фиксируются одной записью в журнал и инкрементальным обновлением агрегатов.
+        #Всё под блокировкой журнала: exposure.json перечитывается, и если в нём учтены не все сделки
+        #до этой пачки (другой процесс, сбой до сброса), агрегаты пересчитываются по журналу
+        with self._trade_lock, self._ledger.locked():
+            entries = self._ledger.record_many(trades)
+            if not entries:
+                return
+            self._valuations.invalidate_users(portfolio.user_id for portfolio, _before in changes)
+            seq = entries[-1]["seq"]
+            self._exposure.reload()
+            if not self._exposure.is_initialized() or self._exposure.ledger_seq() != entries[0]["seq"] - 1:
+                self._exposure.rebuild(self._ledger.load_all(), ledger_seq=seq)
+                return
+            for portfolio, before in changes:
+                for code, old_balance in before.items():
+                    self._exposure.apply(code, old_balance, portfolio.get_wallet(code).balance)
+            if self._exposure.commit(seq, len(entries)):
+                self._exposure.verify(self._ledger.load_all(), ledger_seq=seq)
+
+    def _execute_fills(self, candidates: list[tuple[dict, float]]) -> dict[int, str | None]:
+        #Исполнение лимитных заявок по курсу снимка: те же проверки Wallet, одна пачка в журнал
+        results: dict[int, str | None] = {}
+        #Портфели читаются и проверяются под блокировкой журнала - как в buy/sell
+        with self._trade_lock, self._ledger.locked():
+            portfolios: dict[int, Portfolio] = {}
+            befores: dict[int, dict[str, float]] = {}
+            trades: list[dict] = []
+            for order, rate in candidates:
+                uid = int(order["user_id"])
+                if uid not in portfolios:
+                    portfolios[uid], befores[uid] = self._load_portfolio(uid), {}
+                portfolio, before = portfolios[uid], befores[uid]
+                code, amount = str(order["currency"]), float(order["amount"])
+                wallet = portfolio.get_wallet(code) or portfolio.add_currency(code)
+                usd = portfolio.get_wallet("USD") or portfolio.add_currency("USD")
+                before.setdefault(code, wallet.balance)
+                before.setdefault("USD", usd.balance)
+                try:
+                    if order["side"] == BUY:
+                        usd.withdraw(amount * rate)
+                        wallet.deposit(amount)
+                        usd_delta = -amount * rate
+                    else:
+                        wallet.withdraw(amount)
+                        usd.deposit(amount * rate)
+                        usd_delta = amount * rate
+                except (InsufficientFundsError, ValueError) as e:
+                    results[int(order["id"])] = str(e)
+                    continue
+                trades.append(
+                    {
+                        "user_id": uid,
+                        "side": order["side"],
+                        "currency": code,
+                        "amount": amount,
+                        "rate": rate,
+                        "usd_delta": usd_delta,
+                    }
+                )
+                results[int(order["id"])] = None
+            if trades:
+                self._commit_batch([(portfolios[uid], befores[uid]) for uid in portfolios], trades)
+        return results
+
+    def _ensure_exposure(self) -> None:
+        #Агрегаты могли изменить другие процессы или они отстали после сбоя: сверяем ledger_seq с журналом
+        with self._ledger.locked():
+            self._exposure.reload()
+            seq = self._ledger.last_seq()
+            if not self._exposure.is_initialized() or self._exposure.ledger_seq() != seq:
+                self._exposure.rebuild(self._ledger.load_all(), ledger_seq=seq)
+
+    def _rates(self) -> RatesSnapshot:
+        #Ссылка на неизменяемый снимок курсов: команда берёт её один раз и ведёт все поиски по ней.
+        #Обновление в этом процессе подменяет снимок само; обновления других процессов приходят через rates.shm
+        seq, shared = self._shared_rates.read()
+        if shared is not None:
+            if shared is not self._shared_doc:
+                self._shared_doc = shared
+                return adopt_snapshot(shared, origin=("shm", seq))
+            return current_snapshot()
+        #Общий снимок недоступен - rates.json перечитывается, когда меняется файл
+        origin = self._db.rates_origin()
+        snap = current_snapshot()
+        if snap.version and snap.origin == origin:
+            return snap
+        return adopt_snapshot(self._db.load_rates(), origin=origin)
+
+    def _get_rate(
+        self, from_code: str, to_code: str, rates: RatesSnapshot | None = None
+    ) -> tuple[float, str, str] | None:
+        return (rates if rates is not None else self._rates()).convert(from_code, to_code)
 
     def _is_rate_fresh(self, updated_at: str) -> bool:
         ttl = int(self._settings.get("RATES_TTL_SECONDS", 300))
@@ -184,6 +339,7 @@ class CoreUseCases:
     def get_rate(self, from_code: str, to_code: str) -> str:
         from_code = get_currency(from_code).code
         to_code = get_currency(to_code).code
+        self._demand.touch((from_code, to_code))
 
         cached = self._get_rate(from_code, to_code)
         if cached is not None:
@@ -195,7 +351,7 @@ class CoreUseCases:
                     f"Обратный курс {to_code}→{from_code}: {inv:.8f}"
                 )
 
-        self.update_rates(source="all")
+        self.update_rates(source="all", demand_only=True, interactive=True)
 
         cached2 = self._get_rate(from_code, to_code)
         if cached2 is None:
@@ -214,42 +370,46 @@ class CoreUseCases:
         currency_code = get_currency(currency_code).code
         amount = validate_amount(amount)
 
-        portfolio = self._load_portfolio_for_session()
+        #Загрузка, проверка баланса и запись - одна критическая секция: иначе две сессии (или заявка
+        #планировщика) прочитают один и тот же баланс и обе его потратят
+        with self._trade_lock, self._ledger.locked():
+            portfolio = self._load_portfolio_for_session()
 
-        wallet = portfolio.get_wallet(currency_code)
-        if wallet is None:
-            wallet = portfolio.add_currency(currency_code)
+            wallet = portfolio.get_wallet(currency_code)
+            if wallet is None:
+                wallet = portfolio.add_currency(currency_code)
 
-        old_balance = wallet.balance
+            old_balance = wallet.balance
 
-        if currency_code == "USD":
-            wallet.deposit(amount)
-            self._save_portfolio(portfolio)
-            return (
-                f"Покупка выполнена: {amount:.4f} USD\n"
-                f"Изменения в портфеле:\n- USD: было {old_balance:.4f} → стало {wallet.balance:.4f}" #реализация покупки
-            )
+            if currency_code == "USD":
+                wallet.deposit(amount)
+                self._commit_trade(portfolio, {"USD": old_balance}, "BUY", "USD", amount, 1.0, amount)
+                return (
+                    f"Покупка выполнена: {amount:.4f} USD\n"
+                    f"Изменения в портфеле:\n- USD: было {old_balance:.4f} → стало {wallet.balance:.4f}" #реализация покупки
+                )
 
-        usd = portfolio.get_wallet("USD")
-        if usd is None:
-            usd = portfolio.add_currency("USD")
+            usd = portfolio.get_wallet("USD")
+            if usd is None:
+                usd = portfolio.add_currency("USD")
 
-        rate_data = self._get_rate(currency_code, "USD")
-        if rate_data is None:
-            raise ApiRequestError(reason=f"Не удалось получить курс для {currency_code}→USD")
-        rate, _updated_at, _source = rate_data
+            rate_data = self._get_rate(currency_code, "USD")
+            if rate_data is None:
+                raise ApiRequestError(reason=f"Не удалось получить курс для {currency_code}→USD")
+            rate, _updated_at, _source = rate_data
 
-        cost = amount * rate
-        usd.withdraw(cost)
-        wallet.deposit(amount)
-        self._save_portfolio(portfolio)
+            cost = amount * rate
+            before = {currency_code: old_balance, "USD": usd.balance}
+            usd.withdraw(cost)
+            wallet.deposit(amount)
+            self._commit_trade(portfolio, before, "BUY", currency_code, amount, rate, -cost)
 
-        return (
-            f"Покупка выполнена: {amount:.4f} {currency_code} по курсу {rate:.2f} USD/{currency_code}\n"
-            f"Изменения в портфеле:\n"
-            f"- {currency_code}: было {old_balance:.4f} → стало {wallet.balance:.4f}\n"
-            f"Оценочная стоимость покупки: {cost:,.2f} USD"
-        )
+            return (
+                f"Покупка выполнена: {amount:.4f} {currency_code} по курсу {rate:.2f} USD/{currency_code}\n"
+                f"Изменения в портфеле:\n"
+                f"- {currency_code}: было {old_balance:.4f} → стало {wallet.balance:.4f}\n"
+                f"Оценочная стоимость покупки: {cost:,.2f} USD"
+            )
 
     @log_action("SELL", verbose=True)
     def sell(self, currency_code: str, amount: float) -> str:
@@ -257,50 +417,67 @@ class CoreUseCases:
         currency_code = get_currency(currency_code).code
         amount = validate_amount(amount)
 
-        portfolio = self._load_portfolio_for_session()
-        wallet = portfolio.get_wallet(currency_code)
-        if wallet is None:
-            return (
-                f"У вас нет кошелька '{currency_code}'. Добавьте валюту: она создаётся " #реализация функции продажи
-                f"автоматически при первой покупке."
-            )
+        #Как в buy: баланс проверяется по журналу, перечитанному под его блокировкой
+        with self._trade_lock, self._ledger.locked():
+            portfolio = self._load_portfolio_for_session()
+            wallet = portfolio.get_wallet(currency_code)
+            if wallet is None:
+                return (
+                    f"У вас нет кошелька '{currency_code}'. Добавьте валюту: она создаётся " #реализация функции продажи
+                    f"автоматически при первой покупке."
+                )
 
-        old_balance = wallet.balance
+            old_balance = wallet.balance
 
-        if currency_code == "USD":
-            wallet.withdraw(amount)
-            self._save_portfolio(portfolio)
-            return (
-                f"Продажа выполнена: {amount:.2f} USD\n"
-                f"Изменения в портфеле:\n- USD: было {old_balance:.2f} → стало {wallet.balance:.2f}"
-            )
+            if currency_code == "USD":
+                wallet.withdraw(amount)
+                self._commit_trade(portfolio, {"USD": old_balance}, "SELL", "USD", amount, 1.0, -amount)
+                return (
+                    f"Продажа выполнена: {amount:.2f} USD\n"
+                    f"Изменения в портфеле:\n- USD: было {old_balance:.2f} → стало {wallet.balance:.2f}"
+                )
 
-        usd = portfolio.get_wallet("USD")
-        if usd is None:
-            usd = portfolio.add_currency("USD")
+            usd = portfolio.get_wallet("USD")
+            if usd is None:
+                usd = portfolio.add_currency("USD")
 
-        rate_data = self._get_rate(currency_code, "USD")
-        if rate_data is None:
-            raise ApiRequestError(reason=f"Не удалось получить курс для {currency_code}→USD")
-        rate, _updated_at, _source = rate_data
+            rate_data = self._get_rate(currency_code, "USD")
+            if rate_data is None:
+                raise ApiRequestError(reason=f"Не удалось получить курс для {currency_code}→USD")
+            rate, _updated_at, _source = rate_data
 
-        wallet.withdraw(amount)
-        proceeds = amount * rate
-        usd.deposit(proceeds)
-        self._save_portfolio(portfolio)
+            before = {currency_code: old_balance, "USD": usd.balance}
+            wallet.withdraw(amount)
+            realized_avg, realized_fifo = wallet.cost_basis.on_sell(amount, rate, old_balance)
+            proceeds = amount * rate
+            usd.deposit(proceeds)
+            self._commit_trade(portfolio, before, "SELL", currency_code, amount, rate, proceeds)
 
-        return (
-            f"Продажа выполнена: {amount:.4f} {currency_code} по курсу {rate:.2f} USD/{currency_code}\n"
-            f"Изменения в портфеле:\n"
-            f"- {currency_code}: было {old_balance:.4f} → стало {wallet.balance:.4f}\n"
-            f"Оценочная выручка: {proceeds:,.2f} USD"
-        )
+            return (
+                f"Продажа выполнена: {amount:.4f} {currency_code} по курсу {rate:.2f} USD/{currency_code}\n"
+                f"Изменения в портфеле:\n"
+                f"- {currency_code}: было {old_balance:.4f} → стало {wallet.balance:.4f}\n"
+                f"Оценочная выручка: {proceeds:,.2f} USD\n"
+                f"Реализованный P&L: {realized_avg:+,.2f} USD (по средней цене), {realized_fifo:+,.2f} USD (FIFO)"
+            )
 
     def show_portfolio(self, base: str = "USD") -> str:
         self._ensure_logged_in()
         base = get_currency(base).code
-        portfolio = self._load_portfolio_for_session()
+        user_id = int(self.session.user_id)
+
+        #Версия портфеля берётся до загрузки: если сделка проскочит между ними, запись просто не найдут
+        rates = self._rates() #весь портфель оценивается по одному снимку
+        key = (user_id, base, rates.version, self._ledger.user_version(user_id))
+        cached = self._valuations.get(key)
+        if cached is not None:
+            return cached
 
+        text = self._render_portfolio(self._load_portfolio(user_id), base, rates)
+        self._valuations.put(key, text)
+        return text
+
+    def _render_portfolio(self, portfolio: Portfolio, base: str, rates: RatesSnapshot) -> str:
         if not portfolio.wallets:
             return "Кошельков нет. Купите валюту: buy --currency USD --amount 100"
 
@@ -308,86 +485,829 @@ class CoreUseCases:
         lines.append(f"Портфель пользователя '{self.session.username}' (база: {base}):")
 
         total = 0.0
+        unrealized_total = 0.0
+        realized_total = 0.0
+        realized_fifo_total = 0.0
         for code, wallet in sorted(portfolio.wallets.items()):
+            pnl = ""
+            cb = wallet.cost_basis
+            realized_total += cb.realized_avg
+            realized_fifo_total += cb.realized_fifo
+            if code != "USD" and cb.avg_cost is not None:
+                usd_rate = rates.convert(code, "USD")
+                if usd_rate is not None:
+                    unrealized = cb.unrealized(usd_rate[0])
+                    unrealized_total += unrealized
+                    pnl = f"  | ср. цена {cb.avg_cost:,.2f} USD, P&L {unrealized:+,.2f} USD"
+
             if code == base:
                 value = wallet.balance
-                lines.append(f"- {code}: {wallet.balance:.4f}  → {value:,.2f} {base}")
+                lines.append(f"- {code}: {wallet.balance:.4f}  → {value:,.2f} {base}{pnl}")
                 total += value
                 continue
 
-            rate_data = self._get_rate(code, base)
+            rate_data = rates.convert(code, base)
             if rate_data is None:
-                lines.append(f"- {code}: {wallet.balance:.4f}  → (нет курса к {base})")
+                lines.append(f"- {code}: {wallet.balance:.4f}  → (нет курса к {base}){pnl}")
                 continue
 
             rate, _updated_at, _source = rate_data
             value = wallet.balance * rate
-            lines.append(f"- {code}: {wallet.balance:.4f}  → {value:,.2f} {base}")
+            lines.append(f"- {code}: {wallet.balance:.4f}  → {value:,.2f} {base}{pnl}")
             total += value
 
         lines.append("--------------------------")
         lines.append(f"ИТОГО: {total:,.2f} {base}")
+        lines.append(
+            f"P&L: нереализованный {unrealized_total:+,.2f} USD, реализованный "
+            f"{realized_total:+,.2f} USD (по средней цене), {realized_fifo_total:+,.2f} USD (FIFO)"
+        )
         return "\n".join(lines)
 
     @log_action("UPDATE_RATES") #обновление курсов через внешние API
-    def update_rates(self, source: str = "all") -> str:
-        from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
+    def update_rates(
+        self,
+        source: str = "all",
+        record: bool = False,
+        use_async: bool = False,
+        demand_only: bool = False,
+        interactive: bool = False,
+    ) -> str:
+        from valutatrade_hub.parser_service.circuit_breaker import GuardedApiClient
+        from valutatrade_hub.parser_service.quorum import build_clients
         from valutatrade_hub.parser_service.storage import RatesStorage
         from valutatrade_hub.parser_service.updater import RatesUpdater
 
-        clients = []
         src = str(source).strip().lower()
-        if src in {"all", ""}:
-            clients = [CoinGeckoClient(), ExchangeRateApiClient()]
-        elif src == "coingecko":
-            clients = [CoinGeckoClient()]
-        elif src == "exchangerate":
-            clients = [ExchangeRateApiClient()]
-        else:
-            raise ValueError("source должен быть: coingecko, exchangerate или all")
+        if self._rate_clients is not None and src in {"all", "", "coingecko", "exchangerate"}:
+            from valutatrade_hub.parser_service.replay import RecordingApiClient
 
-        updater = RatesUpdater(clients=clients, storage=RatesStorage())
+            clients = [GuardedApiClient(RecordingApiClient(c) if record else c) for c in self._rate_clients(src)]
+        else:
+            #Основной провайдер и его резервы (RATES_BACKUP_SOURCES) с хеджированием запросов
+            clients = build_clients(src, record=record, interactive=interactive)
+
+        if use_async:
+            import asyncio
+
+            from valutatrade_hub.parser_service.pipeline import AsyncRatesPipeline
+
+            pipeline = AsyncRatesPipeline(
+                clients=clients,
+                storage=RatesStorage(),
+                interval_seconds=0,
+                demand=self._demand if demand_only else None,
+                alerts=self._alerts,
+                orders=self._orders,
+                stats=self._stats,
+            )
+            metrics = asyncio.run(pipeline.run(rounds=1))
+            return "Update successful (asyncio).\n" + _format_pipeline_metrics(metrics)
+
+        #Ручной update-rates грузит всё; при промахе get-rate достаточно валют со спросом
+        updater = RatesUpdater(
+            clients=clients,
+            storage=RatesStorage(),
+            demand=self._demand if demand_only else None,
+            alerts=self._alerts,
+            orders=self._orders,
+            stats=self._stats,
+        )
         result = updater.run_update()
         return (
             "Update successful. "
             f"Total rates updated: {result['total']}. Last refresh: {result['last_refresh']}"
         )
 
-    def show_rates(self, currency: str | None = None, top: int | None = None) -> str:
-        rates = self._db.load_rates()
-        pairs = rates.get("pairs", {}) or {}
-        last_refresh = rates.get("last_refresh")
-
-        if not pairs:
+    def show_rates(
+        self,
+        currency: str | None = None,
+        top: int | None = None,
+        offset: int = 0,
+        limit: int | None = None,
+        source: str | None = None,
+        max_age: int | None = None,
+        stale: bool = False,
+        fmt: str = "table",
+    ) -> str:
+        fmt = str(fmt).strip().lower()
+        if fmt not in {"table", "plain", "json"}:
+            raise ValueError("format должен быть: table, plain или json")
+
+        index = self._rates().index #индекс строится один раз на снимок
+        if not len(index):
             return "Локальный кеш курсов пуст. Выполните 'update-rates', чтобы загрузить данные."
 
-        items = []
-        for pair, obj in pairs.items():
-            if not isinstance(obj, dict):
-                continue
-            rate = obj.get("rate")
-            updated_at = obj.get("updated_at")
-            if not isinstance(rate, (int, float)):
+        code = get_currency(currency).code if currency else None
+        if code:
+            self._demand.touch((code,))
+        ttl = int(self._settings.get("RATES_TTL_SECONDS", 300))
+        items = index.query(
+            currency=code,
+            source=source,
+            max_age_seconds=max_age,
+            stale_after_seconds=ttl if stale else None,
+            top=top,
+            offset=offset,
+            limit=limit,
+        )
+
+        if fmt == "json":
+            return render_json(items, index.last_refresh, offset)
+
+        header = f"Rates from cache (updated at {index.last_refresh}):"
+        if fmt == "plain":
+            return header + "\n" + render_plain(items)
+
+        table = PrettyTable()
+        table.field_names = ["PAIR", "RATE", "UPDATED_AT"]
+        for row in items:
+            table.add_row([row.pair, f"{row.rate:.8f}", row.updated_at])
+        return header + "\n" + str(table)
+
+    def list_currencies(self, prefix: str = "", limit: int = 20) -> str:
+        found = find_currencies(prefix, limit=int(limit))
+        if not found:
+            return f"Валюты с префиксом '{prefix}' не найдены"
+        return "\n".join(c.get_display_info() for c in found)
+
+    @log_action("SYNC_CURRENCIES")
+    def sync_currencies(self) -> str:
+        from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
+
+        added = 0
+        errors: list[str] = []
+        for client in (CoinGeckoClient(), ExchangeRateApiClient()):
+            try:
+                added += register_currencies(client.fetch_currencies())
+            except ApiRequestError as e:
+                errors.append(str(e))
+        if errors and not added:
+            raise ApiRequestError(reason="; ".join(errors))
+        return f"Реестр валют обновлён, добавлено: {added}"
+
+    @log_action("REPORT")
+    def generate_report(
+        self,
+        fmt: str = "csv",
+        out: str | None = None,
+        workers: int | None = None,
+        since: str | None = None,
+        base: str = "USD",
+    ) -> str:
+        from valutatrade_hub.reporting.generator import PortfolioReportGenerator
+
+        base = get_currency(base).code
+        fmt = str(fmt).strip().lower()
+        if since:
+            since_dt = parse_iso_dt(since)
+            if since_dt is None:
+                raise ValueError("'since' должен быть в формате ISO, пример: 2026-01-11T07:31:12Z")
+            if since_dt.tzinfo is None:
+                since_dt = since_dt.replace(tzinfo=timezone.utc)
+        else:
+            since_dt = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=1)
+
+        if out:
+            out_path = Path(out)
+        else:
+            stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            out_path = Path(self._settings.get("REPORTS_DIR", "reports")) / f"portfolios_{stamp}.{fmt}"
+
+        #Книга и история курсов читаются потоком: в памяти родителя нет ни всех портфелей, ни всей истории
+        users = self._db.iter_json_array(self._settings.path_for("USERS_FILE"))
+        summary = PortfolioReportGenerator(workers=workers).generate(
+            ledger=self._ledger,
+            max_user_id=max((int(u["user_id"]) for u in users), default=0),
+            rates_pairs=dict(self._rates().pairs),
+            history=self._db.iter_json_array(self._settings.path_for("HISTORY_FILE")),
+            since=since_dt,
+            out_path=out_path,
+            base=base,
+            fmt=fmt,
+        )
+        return (
+            f"Отчёт сохранён: {summary['path']} (пользователей: {summary['users']}, "
+            f"процессов: {summary['workers']})\n"
+            f"Стоимость: {summary['value']:,.2f} {base}, P&L с {since_dt.isoformat()}: "
+            f"{summary['pnl']:,.2f} {base}; без курса: {summary['unpriced_users']} польз."
+        )
+
+    def _bulk_progress(self, progress: Callable[[str], None] | None) -> Callable[[dict], None]:
+        def report(stats: dict) -> None:
+            if progress is not None:
+                progress(
+                    f"... строк: {stats['rows']}, принято: {stats['accepted']}, отклонено: {stats['rejected']}"
+                )
+
+        return report
+
+    def _bulk_source(self, path: str, fmt: str | None, errors: str | None):
+        from valutatrade_hub.core.bulk import RejectLog, detect_format
+
+        src = Path(path)
+        if not path or not src.is_file():
+            raise ValueError(f"Файл не найден: {path}")
+        rejects = RejectLog(Path(errors) if errors else src.with_name(f"{src.name}.rejected.ndjson"))
+        return src, detect_format(src, fmt), rejects
+
+    def _bulk_summary(self, head: str, rejects) -> str:
+        lines = [head]
+        if rejects.count:
+            lines.append(f"Отклонено строк: {rejects.count}, подробности: {rejects.path}")
+            lines += [f"- {s}" for s in rejects.samples]
+        return "\n".join(lines)
+
+    def _export_path(self, kind: str, out: str | None, fmt: str | None) -> tuple[Path, str]:
+        from valutatrade_hub.core.bulk import detect_format
+
+        if out:
+            return Path(out), detect_format(Path(out), fmt)
+        fmt = detect_format(Path(f"x.{fmt or 'csv'}"), fmt)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        return Path(self._settings.get("REPORTS_DIR", "reports")) / f"{kind}_{stamp}.{fmt}", fmt
+
+    @log_action("IMPORT_USERS")
+    def import_users(
+        self,
+        path: str,
+        fmt: str | None = None,
+        chunk: int | None = None,
+        errors: str | None = None,
+        progress: Callable[[str], None] | None = None,
+    ) -> str:
+        from valutatrade_hub.core import bulk
+
+        src, fmt, rejects = self._bulk_source(path, fmt, errors)
+        try:
+            #Вся перезапись users.json - под блокировкой register: иначе регистрация во время импорта
+            #пропадёт при подмене файла или получит тот же id
+            with self._db.users_locked():
+                stats = bulk.import_users(
+                    self._db,
+                    src,
+                    fmt,
+                    int(chunk or self._settings.get("BULK_CHUNK_ROWS", 10000)),
+                    rejects,
+                    self._bulk_progress(progress),
+                )
+        finally:
+            rejects.close()
+        head = f"Импорт пользователей: принято {stats['accepted']} из {stats['rows']} строк"
+        if stats["accepted"]:
+            head += f", id {stats['first_id']}..{stats['last_id']}"
+        return self._bulk_summary(head, rejects)
+
+    @log_action("IMPORT_PORTFOLIOS")
+    def import_portfolios(
+        self,
+        path: str,
+        fmt: str | None = None,
+        chunk: int | None = None,
+        errors: str | None = None,
+        progress: Callable[[str], None] | None = None,
+    ) -> str:
+        from valutatrade_hub.core import bulk
+
+        src, fmt, rejects = self._bulk_source(path, fmt, errors)
+        try:
+            with self._trade_lock:
+                stats = bulk.import_portfolios(
+                    self._db,
+                    self._ledger,
+                    src,
+                    fmt,
+                    int(chunk or self._settings.get("BULK_CHUNK_ROWS", 10000)),
+                    rejects,
+                    self._bulk_progress(progress),
+                )
+                if stats["accepted"]:
+                    #Зачисления не проходят через _commit_batch - агрегаты пересчитываются один раз
+                    with self._ledger.locked():
+                        self._exposure.rebuild(self._ledger.load_all(), ledger_seq=self._ledger.last_seq())
+                    self._valuations.clear()
+        finally:
+            rejects.close()
+        return self._bulk_summary(
+            f"Импорт портфелей: зачислено позиций {stats['accepted']} из {stats['rows']} строк", rejects
+        )
+
+    @log_action("EXPORT_USERS")
+    def export_users(self, out: str | None = None, fmt: str | None = None) -> str:
+        from valutatrade_hub.core.bulk import export_users
+
+        path, fmt = self._export_path("users", out, fmt)
+        return f"Пользователи выгружены: {path} (строк: {export_users(self._db, path, fmt)})"
+
+    @log_action("EXPORT_PORTFOLIOS")
+    def export_portfolios(self, out: str | None = None, fmt: str | None = None) -> str:
+        from valutatrade_hub.core.bulk import export_portfolios
+
+        path, fmt = self._export_path("portfolios", out, fmt)
+        return f"Портфели выгружены: {path} (строк: {export_portfolios(self._db, self._ledger, path, fmt)})"
+
+    @log_action("BENCH_REFRESH")
+    def bench_refresh(
+        self,
+        iterations: int = 100,
+        latency_ms: float | None = None,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        partial_rate: float = 0.0,
+        timeout_s: float = 10.0,
+    ) -> str:
+        from valutatrade_hub.parser_service.replay import benchmark_refresh, load_replay_clients
+
+        clients = load_replay_clients(
+            latency_ms=latency_ms,
+            jitter_ms=jitter_ms,
+            error_rate=error_rate,
+            timeout_rate=timeout_rate,
+            partial_rate=partial_rate,
+            timeout_s=timeout_s,
+            seed=42,
+        )
+        if not clients:
+            return "Записей нет. Сначала выполните: update-rates --record"
+
+        stats = benchmark_refresh(clients, iterations=int(iterations))
+        return (
+            f"Клиенты: {', '.join(c.name for c in clients)}; прогонов: {int(stats['iterations'])}\n"
+            f"Обновлений/с: {stats['refresh_per_s']:.2f}, курсов/с: {stats['pairs_per_s']:.1f}\n"
+            f"Задержка, мс: p50={stats['p50_ms']:.1f} p95={stats['p95_ms']:.1f} "
+            f"p99={stats['p99_ms']:.1f} max={stats['max_ms']:.1f}"
+        )
+
+    @log_action("LOAD_TEST")
+    def load_test(
+        self,
+        users: int = 10,
+        processes: int = 1,
+        duration_s: float = 10.0,
+        mix: str | None = None,
+        think_ms: float = 0.0,
+        latency_ms: float = 50.0,
+        data_dir: str | None = None,
+        keep: bool = False,
+    ) -> str:
+        import shutil
+        import tempfile
+
+        from valutatrade_hub.load_test import parse_mix, run_load_test
+
+        if int(users) <= 0 or int(processes) <= 0 or float(duration_s) <= 0:
+            raise ValueError("users, processes и duration должны быть положительными")
+        ops_mix = parse_mix(mix)
+        #Прогон идёт в отдельной папке данных: основная не меняется
+        if data_dir:
+            target, cleanup = Path(data_dir), False
+        else:
+            root = self._settings.data_dir() / "loadtest"
+            root.mkdir(parents=True, exist_ok=True)
+            target, cleanup = Path(tempfile.mkdtemp(prefix="run_", dir=root)), not keep
+
+        try:
+            result = run_load_test(
+                target,
+                users=int(users),
+                processes=int(processes),
+                duration_s=float(duration_s),
+                mix=ops_mix,
+                think_ms=float(think_ms),
+                provider_latency_ms=float(latency_ms),
+            )
+        finally:
+            if cleanup:
+                shutil.rmtree(target, ignore_errors=True)
+
+        table = PrettyTable()
+        table.field_names = ["OPERATION", "COUNT", "OPS/S", "P50_MS", "P95_MS", "P99_MS", "MAX_MS", "ERRORS"]
+        for op, m in result["by_operation"].items():
+            errors = ", ".join(f"{k}: {v}" for k, v in m["errors"].items()) or "-"
+            table.add_row([op, m["count"], m["ops_per_s"], m["p50_ms"], m["p95_ms"], m["p99_ms"], m["max_ms"], errors])
+        lines = [
+            f"Виртуальных пользователей: {result['users']}, процессов: {result['processes']}, "
+            f"время: {result['elapsed_s']} с",
+            f"Операций: {result['operations']}, {result['ops_per_s']}/с, доля ошибок: {result['error_rate']:.2%}",
+            str(table),
+        ]
+        violations = result["violations"]
+        lines.append(f"Сверка балансов: {'нарушений нет' if not violations else f'нарушений {len(violations)}'}")
+        lines += [f"- {v}" for v in violations[:20]]
+        if len(violations) > 20:
+            lines.append(f"... и ещё {len(violations) - 20}")
+        lines.append(f"Данные прогона: {result['data_dir']}" if not cleanup else "Данные прогона удалены (--keep, чтобы оставить)")
+        return "\n".join(lines)
+
+    def analyze_logs(self, window_minutes: int = 60, action: str | None = None, fmt: str = "table") -> str:
+        from valutatrade_hub.log_analyzer import analyze_logs, log_files
+
+        fmt = str(fmt).strip().lower()
+        if fmt not in {"table", "json"}:
+            raise ValueError("format должен быть: table или json")
+        if int(window_minutes) <= 0:
+            raise ValueError("'window' должен быть положительным числом минут")
+
+        paths = log_files(Path(self._settings.get("LOG_DIR", "logs")))
+        result = analyze_logs(paths, window_minutes=int(window_minutes), action=action)
+        if fmt == "json":
+            return json.dumps(result, ensure_ascii=False, indent=2)
+        if not result["actions"]:
+            return "В логах нет записей о действиях"
+
+        header = (
+            f"Файлов: {len(result['files'])}, строк: {result['lines']}, "
+            f"не разобрано: {result['skipped']}, окно: {result['window_minutes']} мин"
+        )
+        columns = ["COUNT", "ERRORS", "P50_MS", "P95_MS", "P99_MS", "MAX_MS"]
+
+        def cells(stats: dict) -> list:
+            return [stats["count"], stats["errors"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], stats["max_ms"]]
+
+        totals = PrettyTable()
+        totals.field_names = ["ACTION", *columns]
+        errors = PrettyTable()
+        errors.field_names = ["ACTION", "ERROR_TYPE", "COUNT"]
+        for name, stats in result["actions"].items():
+            totals.add_row([name, *cells(stats)])
+            for error_type, count in stats["error_types"].items():
+                errors.add_row([name, error_type, count])
+
+        windows = PrettyTable()
+        windows.field_names = ["WINDOW", "ACTION", *columns]
+        for w in result["windows"]:
+            windows.add_row([w["start"] or "-", w["action"], *cells(w)])
+
+        parts = [header, str(totals)]
+        if errors.rows:
+            parts += ["Ошибки по типам:", str(errors)]
+        parts += ["По окнам:", str(windows)]
+        return "\n".join(parts)
+
+    def rate_stats(self, pair: str | None = None, window: str = "24h", fmt: str = "table") -> str:
+        fmt = str(fmt).strip().lower()
+        if fmt not in {"table", "json"}:
+            raise ValueError("format должен быть: table или json")
+        seconds = parse_window(window)
+        pairs = self._stats.pairs()
+        if pair:
+            from_raw, sep, to_raw = str(pair).strip().upper().partition("_")
+            if not sep:
+                raise ValueError("Пара указывается как FROM_TO, например BTC_USD")
+            pair = f"{get_currency(from_raw).code}_{get_currency(to_raw).code}"
+            if pair not in pairs:
+                return f"По паре {pair} нет истории курсов. Пары с историей: {', '.join(pairs) or 'нет'}"
+
+        rows = [self._stats.stats(p, seconds) for p in ([pair] if pair else pairs)]
+        corr = self._stats.correlations(seconds)
+        if fmt == "json":
+            return json.dumps({"window": seconds, "stats": rows, "correlation": corr}, ensure_ascii=False, indent=2)
+        if not rows:
+            return "История курсов пуста. Выполните 'update-rates', чтобы накопить данные."
+
+        def num(value: float | None, spec: str = ".8f") -> str:
+            return "-" if value is None else format(value, spec)
+
+        table = PrettyTable()
+        table.field_names = ["PAIR", "POINTS", "LAST", "SMA", "EMA", "MIN", "MAX", "VOLATILITY_%"]
+        for r in rows:
+            if not r["points"]:
+                table.add_row([r["pair"], 0, "-", "-", "-", "-", "-", "-"])
                 continue
-            if currency:
-                c = get_currency(currency).code
-                if not (pair.startswith(f"{c}_") or pair.endswith(f"_{c}")):
-                    continue
-            items.append((pair, float(rate), str(updated_at) if updated_at else ""))
+            vol = r["volatility"] * 100 if r["volatility"] is not None else None
+            table.add_row(
+                [r["pair"], r["points"], num(r["last"]), num(r["sma"]), num(r["ema"]), num(r["min"]), num(r["max"]), num(vol, ".4f")]
+            )
+        lines = [f"Статистика курсов за {format_window(seconds)}:", str(table)]
+
+        #Для одной пары - её строка матрицы, для всех - матрица целиком
+        names = corr["pairs"]
+        shown = [pair] if pair else names
+        if pair in names or (not pair and names):
+            matrix = PrettyTable()
+            matrix.field_names = ["PAIR", *names]
+            for a in shown:
+                matrix.add_row([a, *(num(corr["matrix"][a].get(b), ".3f") for b in names)])
+            lines += [f"Корреляция доходностей (шаг {format_window(corr['step'])}):", str(matrix)]
+        else:
+            lines.append("Корреляция: недостаточно изменений курса за окно")
+        return "\n".join(lines)
 
-        if top is not None:
-            items.sort(key=lambda x: x[1], reverse=True)
-            items = items[: int(top)]
+    def _resolve_targets(self, targets: dict[str, dict[str, float]]) -> tuple[dict[int, dict[str, float]], list[str]]:
+        #Пользователь в файле целей - имя или id
+        users = self._db.load_users()
+        by_name = {str(u["username"]): int(u["user_id"]) for u in users}
+        ids = {int(u["user_id"]) for u in users}
+        goals: dict[int, dict[str, float]] = {}
+        unknown: list[str] = []
+        for user, weights in targets.items():
+            uid = by_name.get(user)
+            if uid is None and user.isdigit() and int(user) in ids:
+                uid = int(user)
+            if uid is None:
+                unknown.append(user)
+            else:
+                goals[uid] = weights
+        return goals, unknown
+
+    def _apply_rebalance(self, plans: list[dict], state: dict, basis: dict) -> int:
+        #Все сделки всех пользователей - одной пачкой в журнал. Пользователь, у которого
+        #не прошла проверка Wallet, пропускается целиком, чтобы не оставить портфель наполовину.
+        #Портфель - настоящий, как у buy/sell: с себестоимостью и без подрезки балансов, иначе
+        #приращения exposure считались бы от искажённых остатков. state и basis - один проход
+        #load_all_with_basis под блокировкой журнала, тем же, под которым строился план
+        changes: list[tuple[Portfolio, dict[str, float]]] = []
+        trades: list[dict] = []
+        for plan in plans:
+            if not plan["trades"]:
+                continue
+            uid = int(plan["user_id"])
+            try:
+                portfolio = self._build_portfolio(uid, state.get(uid, {}), basis.get(uid, {}))
+                usd = portfolio.get_wallet("USD") or portfolio.add_currency("USD")
+                before = {"USD": usd.balance}
+                for t in plan["trades"]:
+                    wallet = portfolio.get_wallet(t["currency"]) or portfolio.add_currency(t["currency"])
+                    before.setdefault(t["currency"], wallet.balance)
+                    if t["side"] == SELL:
+                        wallet.withdraw(t["amount"])
+                        usd.deposit(t["usd_delta"])
+                    else:
+                        usd.withdraw(-t["usd_delta"])
+                        wallet.deposit(t["amount"])
+            except (InsufficientFundsError, ValueError) as e:
+                plan["error"] = str(e)
+                continue
+            changes.append((portfolio, before))
+            trades += plan["trades"]
+        if trades:
+            self._commit_batch(changes, trades)
+        return len(trades)
+
+    @log_action("REBALANCE", verbose=True)
+    def rebalance(
+        self,
+        targets: str | None = None,
+        weights: str | None = None,
+        apply: bool = False,
+        min_trade: float | None = None,
+    ) -> str:
+        from valutatrade_hub.core.rebalance import load_targets, parse_weights, plan_user
+
+        if (targets is None) == (weights is None):
+            raise ValueError("Укажите --targets <файл> или --weights USD=60,BTC=30,ETH=10")
+        unknown: list[str] = []
+        if weights is not None:
+            self._ensure_logged_in()
+            goals = {int(self.session.user_id): parse_weights(weights)}
         else:
-            items.sort(key=lambda x: x[0])
+            path = Path(targets)
+            if not path.exists():
+                raise ValueError(f"Файл целей не найден: {targets}")
+            goals, unknown = self._resolve_targets(load_targets(path))
+        if min_trade is None:
+            min_trade = float(self._settings.get("REBALANCE_MIN_TRADE_USD", 1.0))
+
+        rates = self._rates() #весь план считается по одному снимку курсов
+        #План и исполнение - под одной блокировкой журнала: иначе сделка другого процесса между ними
+        #прошла бы мимо проверки балансов
+        with self._trade_lock, self._ledger.locked():
+            state, basis = self._ledger.load_all_with_basis()
+            plans = [plan_user(uid, state.get(uid, {}), w, rates, float(min_trade)) for uid, w in goals.items()]
+            applied = self._apply_rebalance(plans, state, basis) if apply else 0
+
+        names = {int(u["user_id"]): str(u["username"]) for u in self._db.load_users()}
+        trades = PrettyTable()
+        trades.field_names = ["USER", "SIDE", "CURRENCY", "AMOUNT", "RATE_USD", "USD"]
+        summary = PrettyTable()
+        summary.field_names = ["USER", "VALUE_USD", "DRIFT_%", "TRADES", "STATUS"]
+        for plan in plans:
+            name = names.get(int(plan["user_id"]), str(plan["user_id"]))
+            for t in plan["trades"]:
+                trades.add_row(
+                    [name, t["side"], t["currency"], f"{t['amount']:.8f}", f"{t['rate']:,.4f}", f"{t['usd_delta']:+,.2f}"]
+                )
+            if "error" in plan and "total_usd" not in plan:
+                summary.add_row([name, "-", "-", 0, plan["error"]])
+                continue
+            status = plan.get("error") or ("применено" if apply and plan["trades"] else "в цели" if not plan["trades"] else "план")
+            summary.add_row(
+                [name, f"{plan['total_usd']:,.2f}", f"{plan['drift'] * 100:.2f}", len(plan["trades"]), status]
+            )
+        for user in unknown:
+            summary.add_row([user, "-", "-", 0, "пользователь не найден"])
+
+        head = (
+            f"Ребалансировка применена: {applied} сделок записано одной пачкой"
+            if apply
+            else "Ребалансировка - пробный прогон, --apply для исполнения"
+        )
+        lines = [f"{head} (снимок курсов {rates.last_refresh}, порог {float(min_trade):,.2f} USD)", str(summary)]
+        if trades.rows:
+            lines += ["Сделки:", str(trades)]
+        return "\n".join(lines)
 
+    @log_action("PLACE_ORDER", verbose=True)
+    def place_order(self, side: str, currency_code: str, amount: float, price: float) -> str:
+        self._ensure_logged_in()
+        side = str(side).strip().upper()
+        if side not in (BUY, SELL):
+            raise ValueError("side должен быть: buy или sell")
+        currency_code = get_currency(currency_code).code
+        if currency_code == "USD":
+            raise ValueError("Лимитные заявки выставляются на валюты к USD")
+        amount = validate_amount(amount)
+        price = validate_amount(price)
+
+        order = self._orders.place(int(self.session.user_id), side, currency_code, amount, price)
+        lines = [
+            f"Заявка #{order['id']} выставлена: {'покупка' if side == BUY else 'продажа'} "
+            f"{amount:.4f} {currency_code} по цене {'не выше' if side == BUY else 'не ниже'} {price:,.2f} USD"
+        ]
+        #Заявка, исполнимая по текущему курсу, исполняется сразу
+        pair = f"{currency_code}_USD"
+        obj = self._rates().pairs.get(pair)
+        for done in self._orders.match({pair: obj}) if obj else []:
+            if done["status"] == "filled":
+                lines.append(f"Заявка #{done['id']} исполнена по курсу {done['rate']:,.2f} USD/{currency_code}")
+            else:
+                lines.append(f"Заявка #{done['id']} отклонена: {done['reason']}")
+        return "\n".join(lines)
+
+    @log_action("CANCEL_ORDER")
+    def cancel_order(self, order_id: int) -> str:
+        self._ensure_logged_in()
+        if not self._orders.cancel(int(self.session.user_id), int(order_id)):
+            return f"Заявка #{order_id} не найдена среди активных"
+        return f"Заявка #{order_id} отменена"
+
+    def list_orders(self, limit: int = 10) -> str:
+        self._ensure_logged_in()
+        uid = int(self.session.user_id)
         table = PrettyTable()
-        table.field_names = ["PAIR", "RATE", "UPDATED_AT"]
-        for pair, rate, updated_at in items:
-            table.add_row([pair, f"{rate:.8f}", updated_at])
+        table.field_names = ["ID", "SIDE", "CURRENCY", "AMOUNT", "LIMIT_USD", "CREATED_AT"]
+        for o in self._orders.for_user(uid):
+            table.add_row([o["id"], o["side"], o["currency"], f"{o['amount']:.4f}", f"{o['limit']:,.2f}", o["created_at"]])
+        lines = ["Активные заявки:", str(table) if table.rows else "- нет"]
+        closed = self._orders.history(uid, limit=limit)
+        lines.append("Закрытые заявки:")
+        for o in closed:
+            if o["event"] == "filled":
+                lines.append(f"- #{o['id']} {o['side']} {o['amount']:.4f} {o['currency']}: исполнена по {o['rate']:,.2f} ({o['at']})")
+            else:
+                lines.append(f"- #{o['id']} {o['side']} {o['amount']:.4f} {o['currency']}: отклонена - {o['reason']} ({o['at']})")
+        if not closed:
+            lines.append("- нет")
+        return "\n".join(lines)
 
-        header = f"Rates from cache (updated at {last_refresh}):"
-        return header + "\n" + str(table)
+    @log_action("ALERT_ADD")
+    def add_alert(self, pair: str, above: float | None = None, below: float | None = None) -> str:
+        self._ensure_logged_in()
+        if (above is None) == (below is None):
+            raise ValueError("Укажите ровно одно условие: --above или --below")
+        from_raw, sep, to_raw = str(pair).strip().upper().partition("_")
+        if not sep:
+            raise ValueError("Пара указывается как FROM_TO, например BTC_USD")
+        from_code, to_code = get_currency(from_raw).code, get_currency(to_raw).code
+        op, threshold = (ABOVE, above) if above is not None else (BELOW, below)
+        threshold = validate_amount(threshold)
+        label = f"{from_code}_{to_code} {'>' if op == ABOVE else '<'} {threshold:g}"
+
+        #Пороги хранятся для пары в том виде, в каком она лежит в снимке курсов
+        rates = self._rates()
+        key, current = f"{from_code}_{to_code}", None
+        if key in rates.pairs:
+            current = rates.rate(key)
+        elif f"{to_code}_{from_code}" in rates.pairs:
+            key = f"{to_code}_{from_code}"
+            op = BELOW if op == ABOVE else ABOVE
+            threshold = 1.0 / threshold
+            current = rates.rate(key)
+        alert = self._alerts.add(
+            user_id=int(self.session.user_id),
+            pair=key,
+            op=op,
+            threshold=threshold,
+            label=label,
+            current_rate=current[0] if current else None,
+        )
+        if alert["fired"]:
+            return f"Условие '{label}' уже выполнено - уведомление записано (alerts)"
+        return f"Уведомление #{alert['id']} создано: {label}"
+
+    @log_action("ALERT_REMOVE")
+    def remove_alert(self, alert_id: int) -> str:
+        self._ensure_logged_in()
+        if not self._alerts.remove(int(self.session.user_id), int(alert_id)):
+            return f"Уведомление #{alert_id} не найдено"
+        return f"Уведомление #{alert_id} удалено"
+
+    def list_alerts(self, limit: int = 10) -> str:
+        self._ensure_logged_in()
+        uid = int(self.session.user_id)
+        active = self._alerts.for_user(uid)
+        lines = ["Активные уведомления:"]
+        lines += [f"- #{a['id']}: {a['label']} (создано {a['created_at']})" for a in active] or ["- нет"]
+        fired = self._alerts.notifications(uid, limit=limit)
+        lines.append("Сработавшие:")
+        lines += [
+            f"- #{n['alert_id']}: {n['alert']}, курс {n['new_rate']:.8f} ({n['fired_at']})" for n in fired
+        ] or ["- нет"]
+        return "\n".join(lines)
+
+    def status(self) -> str:
+        from valutatrade_hub.parser_service.circuit_breaker import circuit_status
+        from valutatrade_hub.parser_service.quorum import latency_status
+
+        rates = self._rates()
+        lines = [
+            f"Пользователь: {self.session.username or '(не выполнен login)'}",
+            f"Курсы: {len(rates.pairs)} пар, обновлено: {rates.last_refresh} (снимок v{rates.version})",
+            "Провайдеры (circuit breaker):",
+        ]
+        lines.extend(circuit_status() or ["- обращений к провайдерам ещё не было"])
+        latency = latency_status()
+        if latency:
+            lines.append("Источники курсов (задержка, хеджирование):")
+            lines.extend(latency)
+        hot = self._demand.hot_set()
+        lines.append(
+            "Валюты со спросом: "
+            + (", ".join(sorted(hot)) or "нет" if hot is not None else "неизвестно (обновляется весь список)")
+        )
+        if isinstance(self._scheduler, AsyncRatesScheduler):
+            lines.append("Конвейер курсов (asyncio):")
+            lines.append(_format_pipeline_metrics(self._scheduler.metrics()))
+        cache = self._valuations.stats()
+        lines.append(
+            f"Кэш оценок портфелей: записей {cache['size']} из {cache['max_size']}, попаданий "
+            f"{cache['hits']} из {cache['hits'] + cache['misses']} ({cache['hit_ratio']:.0%}), "
+            f"вытеснено {cache['evicted']}, сброшено {cache['invalidated']}"
+        )
+        log = logging_stats()
+        lines.append(
+            f"Журнал действий: в очереди {log['queued']}, отброшено {log['dropped']}, "
+            f"пропущено выборкой {log['sampled_out']}"
+        )
+        return "\n".join(lines)
+
+    @log_action("EXPOSURE")
+    def exposure(self, base: str = "USD", verify: bool = False) -> str:
+        base = get_currency(base).code
+        if verify:
+            with self._ledger.locked():
+                self._exposure.reload()
+                mismatches = self._exposure.verify(self._ledger.load_all(), ledger_seq=self._ledger.last_seq())
+            status = f"Сверка выполнена, расхождений: {len(mismatches)}"
+        else:
+            self._ensure_exposure()
+            status = None
+
+        totals = self._exposure.totals()
+        if not totals:
+            return "Открытых позиций нет"
+
+        lines = [f"Совокупные позиции по всем пользователям (база: {base}):"]
+        rates = self._rates()
+        grand = 0.0
+        for code, (total, holders) in totals.items():
+            if code == base:
+                rate_data = (1.0, "", "")
+            else:
+                rate_data = rates.convert(code, base)
+            if rate_data is None:
+                lines.append(f"- {code}: {total:.4f} (кошельков: {holders})  → (нет курса к {base})")
+                continue
+            value = total * rate_data[0]
+            grand += value
+            lines.append(f"- {code}: {total:.4f} (кошельков: {holders})  → {value:,.2f} {base}")
+        lines.append("--------------------------")
+        lines.append(f"ИТОГО: {grand:,.2f} {base}")
+        if status:
+            lines.append(status)
+        return "\n".join(lines)
+
+    @log_action("REPLAY")
+    def replay(self, until: str, user_id: int | None = None) -> str:
+        until_dt = parse_iso_dt(until)
+        if until_dt is None:
+            raise ValueError("'until' должен быть в формате ISO, пример: 2026-01-11T07:31:12Z")
+
+        state = self._ledger.replay(until_dt)
+        if user_id is not None:
+            state = {uid: w for uid, w in state.items() if uid == int(user_id)}
+        if not state:
+            return f"На момент {until} портфелей не найдено"
+
+        lines = [f"Состояние портфелей на {until}:"]
+        for uid, wallets in sorted(state.items()):
+            parts = ", ".join(f"{c} {b:.4f}" for c, b in sorted(wallets.items())) or "пусто"
+            lines.append(f"- user_id={uid}: {parts}")
+        return "\n".join(lines)
 
     def shutdown(self) -> None:
-        self._scheduler.stop()
\ No newline at end of file
+        self._scheduler.stop()
+        self._ledger.close() #в режиме write-behind - сброс несохранённых портфелей
+        self._shared_rates.close()
+        shutdown_logging()
\ No newline at end of file
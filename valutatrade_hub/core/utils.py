@@ -34,4 +34,14 @@ def parse_iso_dt(value: str) -> datetime | None:
     try:
         return datetime.fromisoformat(v)
     except ValueError:
-        return None
\ No newline at end of file
+        return None
+
+
+#Перцентиль по отсортированному списку (линейная интерполяция)
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * (q / 100.0)
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
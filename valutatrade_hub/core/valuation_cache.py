@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from valutatrade_hub.infra.settings import SettingsLoader
+
+#(user_id, базовая валюта, версия снимка курсов, версия портфеля)
+ValuationKey = tuple[int, str, int, int]
+
+
+#Готовые оценки портфелей для show-portfolio, LRU на VALUATION_CACHE_SIZE записей (0 - кэш выключен).
+#Устаревшая запись не может быть выдана: версии курсов и портфеля входят в ключ. Явный сброс после
+#сделок и обновления курсов только освобождает место, чтобы мёртвые записи не вытесняли живые
+class ValuationCache:
+    def __init__(self, max_size: int | None = None) -> None:
+        size = max_size if max_size is not None else SettingsLoader().get("VALUATION_CACHE_SIZE", 1024)
+        self._max_size = max(0, int(size))
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[ValuationKey, Any] = OrderedDict()
+        self._by_user: dict[int, set[ValuationKey]] = {}
+        self._rates_version = 0
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        self._invalidated = 0
+
+    def get(self, key: ValuationKey) -> Any | None:
+        with self._lock:
+            self._sync_rates(key[2])
+            value = self._entries.get(key)
+            if value is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: ValuationKey, value: Any) -> None:
+        if self._max_size == 0:
+            return
+        with self._lock:
+            self._sync_rates(key[2])
+            if key[2] != self._rates_version:
+                return #пока считали, курсы обновились - запись уже никому не нужна
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self._max_size:
+                old, _value = self._entries.popitem(last=False)
+                self._forget(old)
+                self._evicted += 1
+
+    def invalidate_users(self, user_ids) -> None:
+        with self._lock:
+            for uid in {int(u) for u in user_ids}:
+                for key in self._by_user.pop(uid, ()):
+                    del self._entries[key]
+                    self._invalidated += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidated += len(self._entries)
+            self._entries.clear()
+            self._by_user.clear()
+
+    def _sync_rates(self, version: int) -> None:
+        #Новый снимок курсов: все записи посчитаны по старому, сбрасываем разом
+        if version <= self._rates_version:
+            return
+        self._rates_version = version
+        self._invalidated += len(self._entries)
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _forget(self, key: ValuationKey) -> None:
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": self._hits / lookups if lookups else 0.0,
+                "evicted": self._evicted,
+                "invalidated": self._invalidated,
+            }
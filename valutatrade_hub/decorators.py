@@ -11,29 +11,38 @@ def log_action(action: str, verbose: bool = False) -> Callable:
         @wraps(func)
         def wrapper(*args: Any, **kwargs: Any):
             logger = logging.getLogger(__name__)
-            started = time.time()
+            started = time.perf_counter()
             try:
                 result = func(*args, **kwargs)
-                elapsed_ms = int((time.time() - started) * 1000)
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+                #Поля в extra пишет JSON-форматтер; текст сообщения остаётся прежним
                 logger.info(
                     "%s result=OK elapsed_ms=%s args=%s kwargs=%s",
                     action,
                     elapsed_ms,
                     args if verbose else "<hidden>",
                     kwargs if verbose else "<hidden>",
+                    extra={"action": action, "result": "OK", "elapsed_ms": elapsed_ms},
                 )
                 return result
             except Exception as e:
-                elapsed_ms = int((time.time() - started) * 1000)
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
                 logger.info(
                     "%s result=ERROR error_type=%s error_message=%s elapsed_ms=%s",
                     action,
                     type(e).__name__,
                     str(e),
                     elapsed_ms,
+                    extra={
+                        "action": action,
+                        "result": "ERROR",
+                        "elapsed_ms": elapsed_ms,
+                        "error_type": type(e).__name__,
+                        "error_message": str(e),
+                    },
                 )
                 raise
 
         return wrapper
 
-    return decorator
\ No newline at end of file
+    return decorator
@@ -1,11 +1,52 @@
 from __future__ import annotations
 
 import json
+import os
+import re
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator, TextIO
+
+try:
+    import fcntl #только POSIX; без него регистрация и импорт в разных процессах могут выдать один id
+except ImportError:  # pragma: no cover
+    fcntl = None
 
 from valutatrade_hub.infra.settings import SettingsLoader
 
+
+#Потоковая запись JSON-массива: элементы пишутся по одному во временный файл,
+#файл подменяется целиком при выходе из with без ошибки. Формат тот же, что у write_json.
+class JsonArrayWriter:
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}.stream.tmp")
+        self._f: TextIO | None = None
+        self.count = 0
+
+    def __enter__(self) -> JsonArrayWriter:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self._tmp.open("w", encoding="utf-8")
+        self._f.write("[")
+        return self
+
+    def write(self, item: Any) -> None:
+        text = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+        self._f.write(("," if self.count else "") + "\n  " + text)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self._f.write("\n]" if self.count else "]")
+            self._f.close()
+            if exc_type is None:
+                self._tmp.replace(self._path)
+        finally:
+            if exc_type is not None:
+                self._tmp.unlink(missing_ok=True)
+
 #Singleton-обертка
 class DatabaseManager:
     _instance = None
@@ -31,9 +72,89 @@ class DatabaseManager:
 
     def write_json(self, path: Path, data: Any) -> None:
         path.parent.mkdir(parents=True, exist_ok=True)
-        tmp_path = path.with_suffix(path.suffix + ".tmp")
-        tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
-        tmp_path.replace(path)
+        #У каждого писателя свой временный файл: общий .tmp параллельные записи подменяли друг у друга
+        tmp_path = path.with_suffix(f"{path.suffix}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            tmp_path.replace(path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def append_jsonl(self, path: Path, records: list[Any], sync: bool = False) -> None:
+        #sync - дождаться записи на диск: журнал, который служит журналом намерений, не должен терять строки при сбое
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with path.open("a", encoding="utf-8") as f:
+            f.write(payload)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def iter_jsonl(self, path: Path, offset: int = 0) -> Iterator[tuple[int, Any]]:
+        #Отдаёт (смещение конца строки, запись), чтобы можно было продолжить чтение с места
+        if not path.exists():
+            return
+        with path.open("rb") as f:
+            f.seek(offset)
+            pos = offset
+            for raw in f:
+                pos += len(raw)
+                if not raw.endswith(b"\n"):
+                    break #недописанная строка - пропускаем
+                line = raw.strip()
+                if not line:
+                    continue
+                try:
+                    yield pos, json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def open_json_array(self, path: Path) -> JsonArrayWriter:
+        return JsonArrayWriter(path)
+
+    def iter_json_array(self, path: Path, key: str | None = None, block: int = 1 << 16) -> Iterator[Any]:
+        #Потоковое чтение JSON-массива (верхнего уровня или под ключом key), в памяти - один блок и элемент.
+        #Пара к JsonArrayWriter для файлов, которые нельзя грузить целиком
+        if not path.exists():
+            return
+        decoder = json.JSONDecoder()
+        start = re.compile(r"\[" if key is None else r'"%s"\s*:\s*\[' % re.escape(key))
+        with path.open("r", encoding="utf-8") as f:
+            buf, pos, eof = "", 0, False
+
+            def more() -> bool:
+                nonlocal buf, pos, eof
+                chunk = f.read(block)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                return not eof
+
+            while (m := start.search(buf)) is None:
+                if not more():
+                    return
+            pos = m.end()
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos >= len(buf):
+                    if not more():
+                        raise ValueError(f"{path}: JSON-массив не закрыт")
+                    continue
+                if buf[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if not more():
+                        raise
+                    continue
+                if end == len(buf) and not eof:
+                    #Число на границе блока могло оборваться - дочитываем и разбираем заново
+                    more()
+                    continue
+                pos = end
+                yield item
 
     def load_users(self) -> list[dict[str, Any]]:
         path = self._settings.path_for("USERS_FILE")
@@ -43,6 +164,17 @@ class DatabaseManager:
         path = self._settings.path_for("USERS_FILE")
         self.write_json(path, users)
 
+    @contextmanager
+    def users_locked(self) -> Iterator[None]:
+        #Чтение users.json, выдача id и запись - под одной блокировкой: register и import-users
+        #в разных процессах (и потоках - у каждого вызова свой дескриптор) не теряют друг друга
+        path = self._settings.path_for("USERS_FILE")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(path.suffix + ".lock"), "a+b") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
     def load_portfolios(self) -> list[dict[str, Any]]:
         path = self._settings.path_for("PORTFOLIOS_FILE")
         return self.read_json(path, default=[])
@@ -55,6 +187,14 @@ class DatabaseManager:
         path = self._settings.path_for("RATES_FILE")
         return self.read_json(path, default={"pairs": {}, "last_refresh": None})
 
+    def rates_origin(self) -> tuple:
+        #Отметка версии rates.json без чтения: меняется при каждой записи (файл подменяется целиком)
+        try:
+            st = self._settings.path_for("RATES_FILE").stat()
+        except FileNotFoundError:
+            return ("file", 0, 0)
+        return ("file", st.st_mtime_ns, st.st_size, st.st_ino)
+
     def save_rates(self, rates: dict[str, Any]) -> None:
         path = self._settings.path_for("RATES_FILE")
         self.write_json(path, rates)
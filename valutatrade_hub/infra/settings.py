@@ -17,6 +17,7 @@ class SettingsLoader:
             obj = super().__new__(cls)
             obj._cache = {}
             obj._loaded = False
+            obj._overrides = {}
             cls._instance = obj
         return cls._instance
 
@@ -30,9 +31,56 @@ class SettingsLoader:
             "PORTFOLIOS_FILE": "portfolios.json",
             "RATES_FILE": "rates.json",
             "HISTORY_FILE": "exchange_rates.json",
+            "RATES_SHM_FILE": "rates.shm", #снимок курсов в общей памяти для всех процессов
+            "RATES_SHM_CAPACITY": 4096, #число пар, под которое размечается файл
+            "SESSIONS_FILE": "sessions.json", #хеши выданных токенов входа
+            "SESSION_TOKEN_FILE": ".session", #токен текущего входа для следующих запусков CLI
+            "SESSION_TTL_SECONDS": 43200,
+            "TRADES_FILE": "trades.jsonl", #журнал сделок
+            "SNAPSHOTS_DIR": "snapshots", #снимки портфелей
+            "LEDGER_SNAPSHOT_EVERY": 100,
+            "LEDGER_SNAPSHOTS_KEEP": 10,
+            #Портфели в памяти, снимки и exposure.json пишет фоновый поток; сделка ждёт только дозаписи журнала
+            "LEDGER_WRITE_BEHIND": False,
+            "LEDGER_FLUSH_INTERVAL_SECONDS": 5,
+            "LEDGER_FLUSH_MAX_DIRTY": 1000, #столько изменённых пользователей - сброс, не дожидаясь интервала
+            "VALUATION_CACHE_SIZE": 1024, #готовых оценок show-portfolio в памяти (LRU), 0 - без кэша
+            "EXPOSURE_FILE": "exposure.json", #агрегаты по всем пользователям
+            "EXPOSURE_VERIFY_EVERY": 500,
+            "CURRENCIES_FILE": "currencies.json", #реестр валют от провайдеров
+            "CIRCUITS_FILE": "circuits.json", #состояние circuit breaker провайдеров
+            "CIRCUIT_FAILURE_THRESHOLD": 1,
+            "CIRCUIT_OPEN_SECONDS": 60,
+            "CIRCUIT_MAX_OPEN_SECONDS": 900,
+            "RECORDINGS_DIR": "recordings", #записанные ответы провайдеров
+            "RATES_PIPELINE": "thread", #thread - RatesScheduler, asyncio - AsyncRatesScheduler
             "RATES_TTL_SECONDS": 300,
+            #Резервные провайдеры для пар основного: запускаются, если основной не ответил за свой p95.
+            #По умолчанию выключены; например {"coingecko": ["coinbase"], "exchangerate": ["coinbase"]}
+            "RATES_BACKUP_SOURCES": {},
+            "RATES_QUORUM": 1, #1 - первый ответ; N - медиана по N ответам
+            "RATES_HEDGE_DEFAULT_MS": 1000, #задержка запуска резерва, пока у источника мало замеров
+            "RATES_HEDGE_MIN_SAMPLES": 5,
+            "RATES_LATENCY_WINDOW": 200, #последних вызовов на источник для p50/p95
+            "ALERTS_FILE": "alerts.jsonl", #журнал уведомлений о курсах: add/remove/fired
+            "NOTIFICATIONS_FILE": "notifications.jsonl", #сработавшие уведомления (append-only)
+            "ORDERS_FILE": "orders.jsonl", #журнал лимитных заявок: place/cancel/filled/rejected
+            "DEMAND_FILE": "demand.json", #валюты со спросом: запросы get-rate/show-rates
+            "DEMAND_WATCH_SECONDS": 86400, #сколько запрошенная валюта считается горячей
+            #Горячие валюты (держат или запрашивали) - каждые 20 минут одним запросом к CoinGecko,
+            #полный список - раз в 6 часов; в сумме запросов не больше, чем при полном обновлении раз в час
+            "RATES_HOT_INTERVAL_SECONDS": 1200,
+            "RATES_COLD_INTERVAL_SECONDS": 21600,
             "DEFAULT_BASE_CURRENCY": "USD",
             "LOG_DIR": "logs",
+            "LOG_FORMAT": "json", #json - одна JSON-строка на запись, text - прежний формат
+            "LOG_QUEUE_SIZE": 10000, #при переполнении записи отбрасываются и считаются
+            "LOG_SAMPLING": {}, #доля успешных записей по действию, например {"GET_RATE": 0.1}
+            "REPORTS_DIR": "reports", #ночные отчёты по портфелям
+            "RATE_STATS_WINDOWS": ["1h", "24h", "7d"], #окна rate-stats с инкрементальными аккумуляторами
+            "RATE_STATS_CORR_STEP_SECONDS": 1200, #шаг общей сетки для корреляций пар
+            "REBALANCE_MIN_TRADE_USD": 1.0, #сделки ребалансировки меньше порога не выполняются
+            "BULK_CHUNK_ROWS": 10000, #строк в пачке import-users/import-portfolios
         }
 
         data = dict(defaults)
@@ -44,6 +92,7 @@ class SettingsLoader:
             if isinstance(tool_cfg, dict):
                 data.update(tool_cfg)
 
+        data.update(self._overrides)
         self._cache = data
         self._loaded = True
 
@@ -51,6 +100,11 @@ class SettingsLoader:
         self._load()
         return self._cache.get(key, default)
 
+    def override(self, **values: Any) -> None:
+        #Значения поверх defaults и pyproject до конца процесса: например, отдельная папка данных нагрузочного прогона
+        self._overrides.update(values)
+        self.reload()
+
     def reload(self) -> None:
         self._loaded = False
         self._cache = {}
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+try:
+    import fcntl #только POSIX; без него писатели не блокируют друг друга
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from valutatrade_hub.infra.settings import SettingsLoader
+
+#Снимок курсов в общем файле, отображённом в память (seqlock).
+#Писатель: seq -> нечётный, пишет слоты, seq -> чётный. Читатель без блокировок:
+#читает seq, копирует слоты, перечитывает seq; если seq нечётный или изменился - повторяет.
+#Заголовок: magic, версия формата, retired, seq, число пар, ёмкость, last_refresh
+_HEADER = struct.Struct("<4sHBxQII32s")
+#Слот: пара, курс, updated_at, источник
+_SLOT = struct.Struct("<32sd32s32s")
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 8
+_RETIRED_OFFSET = 6
+_MAGIC = b"VTRS"
+_LAYOUT_VERSION = 1
+_READ_RETRIES = 100
+
+_logger = logging.getLogger(__name__)
+
+
+def shared_rates_path() -> Path:
+    return SettingsLoader().path_for("RATES_SHM_FILE")
+
+
+def _encode(value: Any, size: int) -> bytes | None:
+    raw = str(value or "").encode("ascii", errors="replace")
+    return raw if len(raw) <= size else None
+
+
+def _decode(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode("ascii", errors="replace")
+
+
+def _create(path: Path, capacity: int) -> None:
+    #Новый файл собирается рядом и подменяется атомарно
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _LAYOUT_VERSION, 0, 0, 0, capacity, b""))
+        f.truncate(_HEADER.size + capacity * _SLOT.size)
+    old = None
+    if path.exists():
+        old = path.open("r+b")
+    try:
+        os.replace(tmp, path)
+        if old is not None and os.fstat(old.fileno()).st_size >= _HEADER.size:
+            #Старый файл помечается выведенным и получает новый seq, чтобы читатели переоткрыли путь
+            with mmap.mmap(old.fileno(), 0) as mm:
+                mm[_RETIRED_OFFSET] = 1
+                (seq,) = _SEQ.unpack_from(mm, _SEQ_OFFSET)
+                _SEQ.pack_into(mm, _SEQ_OFFSET, (seq | 1) + 1)
+    finally:
+        if old is not None:
+            old.close()
+
+
+def publish_rates(doc: dict[str, Any]) -> int | None:
+    #Вызывается после записи rates.json; ошибка здесь не должна ломать обновление курсов.
+    #Возвращает seq опубликованного снимка (None - не удалось): по нему читатели узнают свою же запись
+    path = shared_rates_path()
+    pairs = doc.get("pairs", {}) or {}
+    slots: list[bytes] = []
+    skipped = 0
+    for pair, obj in pairs.items():
+        rate = obj.get("rate") if isinstance(obj, dict) else None
+        name = _encode(pair, 32)
+        updated_at = _encode(obj.get("updated_at") if isinstance(obj, dict) else None, 32)
+        source = _encode(obj.get("source", "unknown") if isinstance(obj, dict) else None, 32)
+        if not isinstance(rate, (int, float)) or name is None or updated_at is None or source is None:
+            skipped += 1
+            continue
+        slots.append(_SLOT.pack(name, float(rate), updated_at, source))
+    if skipped:
+        _logger.warning("В общий снимок курсов не попало пар: %s", skipped)
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(path.suffix + ".lock"), "a+b") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            capacity = _capacity(path)
+            if capacity < len(slots):
+                wanted = int(SettingsLoader().get("RATES_SHM_CAPACITY", 4096))
+                _create(path, max(wanted, 2 * len(slots)))
+
+            with path.open("r+b") as f, mmap.mmap(f.fileno(), 0) as mm:
+                (seq,) = _SEQ.unpack_from(mm, _SEQ_OFFSET)
+                seq = seq | 1 #нечётный: запись идёт (после сбоя писателя seq уже нечётный)
+                _SEQ.pack_into(mm, _SEQ_OFFSET, seq)
+                offset = _HEADER.size
+                for slot in slots:
+                    mm[offset:offset + _SLOT.size] = slot
+                    offset += _SLOT.size
+                capacity = _HEADER.unpack_from(mm, 0)[5]
+                last_refresh = _encode(doc.get("last_refresh"), 32) or b""
+                _HEADER.pack_into(
+                    mm, 0, _MAGIC, _LAYOUT_VERSION, 0, seq, len(slots), capacity, last_refresh
+                )
+                _SEQ.pack_into(mm, _SEQ_OFFSET, seq + 1)
+        return seq + 1
+    except (OSError, ValueError) as e:
+        _logger.warning("Не удалось обновить общий снимок курсов: %s", e)
+        return None
+
+
+def _capacity(path: Path) -> int:
+    if not path.exists():
+        return -1
+    try:
+        with path.open("rb") as f:
+            head = f.read(_HEADER.size)
+        if len(head) < _HEADER.size:
+            return -1
+        magic, layout, _retired, _seq, _count, capacity, _ts = _HEADER.unpack(head)
+        if magic != _MAGIC or layout != _LAYOUT_VERSION:
+            return -1
+        return capacity
+    except OSError:
+        return -1
+
+
+#Читатель общего снимка: пока seq не изменился, snapshot() отдаёт уже разобранный словарь
+class SharedRatesReader:
+    def __init__(self, path: Path | None = None) -> None:
+        self._path = path or shared_rates_path()
+        self._file = None
+        self._mm: mmap.mmap | None = None
+        self._seq = -1
+        self._doc: dict[str, Any] | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._seq
+
+    def _open(self) -> bool:
+        self._close()
+        try:
+            self._file = self._path.open("rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._close()
+            return False
+        if len(self._mm) < _HEADER.size or self._mm[:4] != _MAGIC:
+            self._close()
+            return False
+        return True
+
+    def _close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        if self._file is not None:
+            self._file.close()
+        self._mm = None
+        self._file = None
+        self._seq = -1
+        self._doc = None
+
+    def snapshot(self) -> dict[str, Any] | None:
+        #{"pairs": ..., "last_refresh": ...} как в rates.json; None - снимок ещё не опубликован
+        with self._lock:
+            return self._read()
+
+    def read(self) -> tuple[int, dict[str, Any] | None]:
+        #Снимок вместе с его seq, прочитанные согласованно
+        with self._lock:
+            doc = self._read()
+            return self._seq, doc
+
+    def _read(self) -> dict[str, Any] | None:
+        for _ in range(_READ_RETRIES):
+            if self._mm is None and not self._open():
+                return None
+            mm = self._mm
+            (seq,) = _SEQ.unpack_from(mm, _SEQ_OFFSET)
+            if seq == self._seq:
+                return self._doc
+            if seq == 0:
+                return None
+            if seq & 1:
+                time.sleep(0.0005) #писатель в середине записи
+                continue
+            header = _HEADER.unpack_from(mm, 0)
+            if header[2]:
+                #Файл заменён писателем на более ёмкий
+                if not self._open():
+                    return None
+                continue
+            count = header[4]
+            data = mm[_HEADER.size:_HEADER.size + count * _SLOT.size]
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] != seq or len(data) != count * _SLOT.size:
+                continue
+            pairs = {
+                _decode(name): {"rate": rate, "updated_at": _decode(updated_at), "source": _decode(source)}
+                for name, rate, updated_at, source in _SLOT.iter_unpack(data)
+            }
+            self._doc = {"pairs": pairs, "last_refresh": _decode(header[6]) or None}
+            self._seq = seq
+            return self._doc
+        return None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
@@ -0,0 +1,367 @@
+from __future__ import annotations
+
+import math
+import random
+import secrets
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from valutatrade_hub.core.exceptions import InsufficientFundsError
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.log_analyzer import LatencyHistogram
+
+#Доли операций виртуального пользователя; register и первый login выполняются один раз в начале
+DEFAULT_MIX = {"get-rate": 30, "show-portfolio": 25, "buy": 25, "sell": 15, "login": 5}
+OPERATIONS = ("register", "login", "buy", "sell", "show-portfolio", "get-rate")
+#Что копируется в папку прогона из основной папки данных
+SEED_FILES = ("RATES_FILE", "CURRENCIES_FILE")
+START_USD = 10000.0
+_PASSWORD = "load-test"
+
+
+def parse_mix(text: str | None) -> dict[str, float]:
+    #"buy=40,sell=20,get-rate=40"; не указанные операции не выполняются
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix: dict[str, float] = {}
+    for part in str(text).split(","):
+        op, sep, value = part.strip().partition("=")
+        op = op.strip().lower()
+        if not sep or op not in OPERATIONS or op == "register":
+            raise ValueError(f"Смесь задаётся как buy=40,sell=20,get-rate=40; операции: {', '.join(OPERATIONS[1:])}")
+        if float(value) < 0:
+            raise ValueError("Доля операции не может быть отрицательной")
+        mix[op] = float(value)
+    if sum(mix.values()) <= 0:
+        raise ValueError("Сумма долей операций должна быть положительной")
+    return mix
+
+
+def prepare_data_dir(target: Path) -> dict[str, float]:
+    #Папка прогона получает курсы и реестр валют из основной; возвращает курсы к USD для виртуальных пользователей
+    settings = SettingsLoader()
+    target.mkdir(parents=True, exist_ok=True)
+    for key in SEED_FILES:
+        src = settings.path_for(key)
+        if src.exists():
+            shutil.copyfile(src, target / src.name)
+    rates = DatabaseManager().read_json(target / settings.path_for("RATES_FILE").name, default={})
+    usd: dict[str, float] = {}
+    for pair, obj in (rates.get("pairs", {}) or {}).items():
+        base, _, quote = pair.partition("_")
+        rate = obj.get("rate") if isinstance(obj, dict) else None
+        if quote == "USD" and base != "USD" and isinstance(rate, (int, float)) and rate > 0:
+            usd[base] = float(rate)
+    return usd
+
+
+def _init_worker(data_dir: str) -> None:
+    #Процесс прогона работает только со своей папкой данных и своими логами
+    SettingsLoader().override(DATA_DIR=data_dir, LOG_DIR=str(Path(data_dir) / "logs"))
+
+
+def _replay_factory(latency_ms: float, seed: int):
+    #Провайдеры без сети: ответы - курсы из rates.json папки прогона, задержка - latency_ms
+    from valutatrade_hub.parser_service.replay import ReplayApiClient
+
+    settings = SettingsLoader()
+    pairs = DatabaseManager().read_json(settings.path_for("RATES_FILE"), default={}).get("pairs", {}) or {}
+    payload = {p: obj for p, obj in pairs.items() if isinstance(obj, dict)}
+    client = ReplayApiClient([{"payload": payload}], name="LoadTestReplay", latency_ms=latency_ms, seed=seed)
+
+    def factory(_source: str) -> list:
+        from valutatrade_hub.parser_service.circuit_breaker import GuardedApiClient
+
+        return [GuardedApiClient(client)]
+
+    return factory
+
+
+class _OpStats:
+    def __init__(self) -> None:
+        self.hist = LatencyHistogram()
+        self.errors: dict[str, int] = {}
+
+    def merge(self, other: _OpStats) -> None:
+        self.hist.merge(other.hist)
+        for name, n in other.errors.items():
+            self.errors[name] = self.errors.get(name, 0) + n
+
+
+#Виртуальный пользователь замкнутого цикла: следующая операция - только после ответа на предыдущую.
+#Модель ожидаемых балансов ведётся по подтверждённым сделкам и сверяется с журналом в конце прогона.
+class VirtualUser:
+    def __init__(
+        self,
+        username: str,
+        usd_rates: dict[str, float],
+        mix: dict[str, float],
+        think_ms: float,
+        rng: random.Random,
+        rate_clients,
+    ) -> None:
+        from valutatrade_hub.core.usecases import CoreUseCases
+
+        self.username = username
+        self.uc = CoreUseCases(rate_clients=rate_clients, autostart=False)
+        self._usd_rates = usd_rates
+        self._codes = sorted(usd_rates)
+        self._ops = [op for op in mix if mix[op] > 0]
+        self._weights = [mix[op] for op in self._ops]
+        self._think_s = max(0.0, float(think_ms)) / 1000
+        self._rng = rng
+        self.holdings: dict[str, float] = {"USD": 0.0}
+        self.trades = 0
+        self.anomalies: list[str] = []
+
+    def _timed(self, stats: dict[str, _OpStats], op: str, fn, *args: Any) -> bool:
+        started = time.perf_counter()
+        try:
+            fn(*args)
+            ok = True
+        except InsufficientFundsError as e:
+            #Продажа по модели обеспечена: отказ значит, что журнал потерял сделку
+            if op == "sell":
+                self.anomalies.append(f"{self.username}: отказ в продаже при балансе по модели ({e})")
+            stats[op].errors["InsufficientFundsError"] = stats[op].errors.get("InsufficientFundsError", 0) + 1
+            ok = False
+        except Exception as e:
+            name = type(e).__name__
+            stats[op].errors[name] = stats[op].errors.get(name, 0) + 1
+            ok = False
+        stats[op].hist.add((time.perf_counter() - started) * 1000)
+        return ok
+
+    def _buy(self, stats: dict[str, _OpStats]) -> None:
+        code = self._rng.choice(self._codes)
+        amount = round(self._rng.uniform(10, 200) / self._usd_rates[code], 8)
+        if amount > 0 and self._timed(stats, "buy", self.uc.buy, code, amount):
+            self.holdings[code] = self.holdings.get(code, 0.0) + amount
+            self.trades += 1
+
+    def _sell(self, stats: dict[str, _OpStats]) -> None:
+        held = [c for c, q in sorted(self.holdings.items()) if c != "USD" and q > 0]
+        if not held:
+            self._buy(stats)
+            return
+        code = self._rng.choice(held)
+        fraction = self._rng.choice((0.25, 0.5, 1.0))
+        amount = self.holdings[code] if fraction == 1.0 else self.holdings[code] * fraction
+        if self._timed(stats, "sell", self.uc.sell, code, amount):
+            self.holdings[code] -= amount
+            self.trades += 1
+
+    def run(self, deadline: float, stats: dict[str, _OpStats]) -> None:
+        if not self._timed(stats, "register", self.uc.register, self.username, _PASSWORD):
+            return
+        if not self._timed(stats, "login", self.uc.login, self.username, _PASSWORD):
+            return
+        if self.uc.session.username != self.username:
+            #login ответил без исключения, но пользователя нет: регистрация потерялась при параллельной записи
+            self.anomalies.append(f"{self.username}: вход невозможен после успешной регистрации")
+            return
+        if self._timed(stats, "buy", self.uc.buy, "USD", START_USD):
+            self.holdings["USD"] += START_USD
+            self.trades += 1
+        while time.monotonic() < deadline:
+            op = self._rng.choices(self._ops, weights=self._weights)[0]
+            if op == "buy":
+                self._buy(stats)
+            elif op == "sell":
+                self._sell(stats)
+            elif op == "get-rate":
+                self._timed(stats, op, self.uc.get_rate, self._rng.choice(self._codes), "USD")
+            elif op == "show-portfolio":
+                self._timed(stats, op, self.uc.show_portfolio)
+            elif op == "login":
+                self._timed(stats, op, self.uc.login, self.username, _PASSWORD)
+            if self._think_s:
+                time.sleep(self._think_s)
+
+
+def run_virtual_users(
+    prefix: str,
+    users: int,
+    duration_s: float,
+    mix: dict[str, float],
+    usd_rates: dict[str, float],
+    think_ms: float = 0.0,
+    provider_latency_ms: float = 50.0,
+    seed: int = 42,
+) -> dict[str, Any]:
+    #Все виртуальные пользователи - потоки текущего процесса, у каждого свой CoreUseCases
+    rate_clients = _replay_factory(provider_latency_ms, seed)
+    stats = {op: _OpStats() for op in OPERATIONS}
+    lock = threading.Lock()
+    vus = [
+        VirtualUser(f"{prefix}u{i}", usd_rates, mix, think_ms, random.Random(f"{seed}:{prefix}:{i}"), rate_clients)
+        for i in range(int(users))
+    ]
+    deadline = time.monotonic() + float(duration_s)
+
+    def body(vu: VirtualUser) -> None:
+        local = {op: _OpStats() for op in OPERATIONS}
+        vu.run(deadline, local)
+        with lock:
+            for op, s in local.items():
+                stats[op].merge(s)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=body, args=(vu,), daemon=True) for vu in vus]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    for vu in vus:
+        vu.uc.shutdown()
+    return {
+        "elapsed_s": elapsed,
+        "stats": stats,
+        "expected": {vu.username: {"holdings": vu.holdings, "trades": vu.trades} for vu in vus},
+        "anomalies": [a for vu in vus for a in vu.anomalies],
+    }
+
+
+def audit(expected: dict[str, dict[str, Any]]) -> list[str]:
+    #Сверка после прогона: пользователи, балансы и число сделок по модели, журнал и агрегаты
+    from valutatrade_hub.core.exposure import ExposureAggregates
+    from valutatrade_hub.core.ledger import TradeLedger
+
+    db = DatabaseManager()
+    settings = SettingsLoader()
+    violations: list[str] = []
+
+    ids: dict[str, list[int]] = {}
+    for u in db.load_users():
+        ids.setdefault(str(u.get("username")), []).append(int(u["user_id"]))
+    by_id: dict[int, list[str]] = {}
+    for name, uids in ids.items():
+        for uid in uids:
+            by_id.setdefault(uid, []).append(name)
+    violations += [f"user_id {uid} выдан нескольким пользователям: {', '.join(n)}" for uid, n in by_id.items() if len(n) > 1]
+
+    seqs: dict[int, int] = {}
+    trades_by_user: dict[int, int] = {}
+    for _pos, entry in db.iter_jsonl(settings.path_for("TRADES_FILE")):
+        seq = int(entry.get("seq", 0))
+        seqs[seq] = seqs.get(seq, 0) + 1
+        uid = int(entry["user_id"])
+        trades_by_user[uid] = trades_by_user.get(uid, 0) + 1
+        amount, rate, usd_delta = float(entry["amount"]), float(entry["rate"]), float(entry["usd_delta"])
+        if not math.isclose(abs(usd_delta), amount * rate, rel_tol=1e-9, abs_tol=1e-9):
+            violations.append(f"сделка seq={seq}: usd_delta {usd_delta} не равна amount*rate")
+    duplicates = sum(n - 1 for n in seqs.values() if n > 1)
+    if duplicates:
+        violations.append(f"журнал сделок: повторяющихся seq - {duplicates}")
+
+    state = TradeLedger().load_all()
+    for uid, wallets in state.items():
+        for code, balance in wallets.items():
+            if balance < -1e-9:
+                violations.append(f"user_id {uid}: отрицательный баланс {code} {balance}")
+
+    for name, exp in expected.items():
+        uids = ids.get(name, [])
+        if len(uids) != 1:
+            violations.append(f"{name}: записей в users.json - {len(uids)} (ожидалась 1)")
+            continue
+        uid = uids[0]
+        if trades_by_user.get(uid, 0) != exp["trades"]:
+            violations.append(
+                f"{name}: сделок в журнале {trades_by_user.get(uid, 0)}, подтверждено клиенту {exp['trades']}"
+            )
+        wallets = state.get(uid, {})
+        for code, qty in exp["holdings"].items():
+            if code == "USD":
+                continue #USD зависит от курса сделки; его проверяют usd_delta и отрицательные балансы
+            actual = wallets.get(code, 0.0)
+            if not math.isclose(actual, qty, rel_tol=1e-9, abs_tol=1e-9):
+                violations.append(f"{name}: {code} в журнале {actual:.8f}, по подтверждённым сделкам {qty:.8f}")
+
+    mismatches = ExposureAggregates().verify(state)
+    violations += [f"агрегаты exposure: {m}" for m in mismatches]
+    return violations
+
+
+def _audit_task(expected: dict[str, dict[str, Any]]) -> list[str]:
+    return audit(expected)
+
+
+def run_load_test(
+    data_dir: Path,
+    users: int = 10,
+    processes: int = 1,
+    duration_s: float = 10.0,
+    mix: dict[str, float] | None = None,
+    think_ms: float = 0.0,
+    provider_latency_ms: float = 50.0,
+    seed: int = 42,
+) -> dict[str, Any]:
+    #Виртуальные пользователи делятся между processes процессами с общей папкой данных data_dir.
+    #Сверка выполняется отдельной задачей в том же пуле, чтобы не трогать настройки вызывающего процесса
+    mix = mix or dict(DEFAULT_MIX)
+    usd_rates = prepare_data_dir(data_dir)
+    if not usd_rates:
+        raise ValueError("В rates.json нет курсов к USD. Выполните 'update-rates'")
+    processes = max(1, int(processes))
+    users = max(1, int(users))
+    run_id = secrets.token_hex(3)
+    shares = [users // processes + (1 if i < users % processes else 0) for i in range(processes)]
+
+    stats = {op: _OpStats() for op in OPERATIONS}
+    expected: dict[str, dict[str, Any]] = {}
+    anomalies: list[str] = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(str(data_dir),)) as pool:
+        futures = [
+            pool.submit(
+                run_virtual_users,
+                f"lt{run_id}p{i}",
+                n,
+                duration_s,
+                mix,
+                usd_rates,
+                think_ms,
+                provider_latency_ms,
+                seed + i,
+            )
+            for i, n in enumerate(shares)
+            if n
+        ]
+        for future in futures:
+            part = future.result()
+            for op, s in part["stats"].items():
+                stats[op].merge(s)
+            expected.update(part["expected"])
+            anomalies += part["anomalies"]
+        elapsed = time.perf_counter() - started
+        violations = anomalies + pool.submit(_audit_task, expected).result()
+
+    total = sum(s.hist.count for s in stats.values())
+    errors = sum(sum(s.errors.values()) for s in stats.values())
+    return {
+        "data_dir": str(data_dir),
+        "users": users,
+        "processes": processes,
+        "elapsed_s": round(elapsed, 3),
+        "operations": total,
+        "ops_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "by_operation": {
+            op: {
+                "count": s.hist.count,
+                "ops_per_s": round(s.hist.count / elapsed, 1) if elapsed else 0.0,
+                **s.hist.as_dict(),
+                "errors": dict(sorted(s.errors.items())),
+            }
+            for op, s in stats.items()
+            if s.hist.count
+        },
+        "violations": violations,
+    }
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterator
+
+#Прежний текстовый формат: "INFO 2026-01-11T07:31:12 BUY result=OK elapsed_ms=12 args=..."
+_TEXT_LINE = re.compile(r"^(?P<level>[A-Z]+) (?P<ts>\S+) (?P<action>[A-Z_]+) result=(?P<result>[A-Z]+)\b(?P<rest>.*)$")
+_ELAPSED = re.compile(r"\belapsed_ms=([0-9.]+)")
+_ERROR_TYPE = re.compile(r"\berror_type=(\S+)")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+#Гистограмма задержек с логарифмическими корзинами: память не зависит от числа записей,
+#относительная ошибка перцентиля - не больше половины шага корзины (~2.5%)
+class LatencyHistogram:
+    MIN_MS = 0.001
+    GROWTH = 1.05
+
+    def __init__(self) -> None:
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        idx = 0 if ms <= self.MIN_MS else int(math.log(ms / self.MIN_MS, self.GROWTH)) + 1
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other: LatencyHistogram) -> None:
+        #Гистограммы из разных процессов складываются по корзинам
+        for idx, n in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + n
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def _bucket_value(self, idx: int) -> float:
+        if idx == 0:
+            return self.MIN_MS
+        #Середина корзины в логарифмической шкале
+        return self.MIN_MS * self.GROWTH ** (idx - 0.5)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * q / 100.0)
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return min(self._bucket_value(idx), self.max_ms)
+        return self.max_ms
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "p50_ms": round(self.percentile(50), 3),
+            "p95_ms": round(self.percentile(95), 3),
+            "p99_ms": round(self.percentile(99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+        }
+
+
+class _ActionStats:
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors: dict[str, int] = {}
+        self.latency = LatencyHistogram()
+
+    def add(self, result: str, elapsed_ms: float | None, error_type: str | None) -> None:
+        self.count += 1
+        if result != "OK":
+            key = error_type or "unknown"
+            self.errors[key] = self.errors.get(key, 0) + 1
+        if elapsed_ms is not None:
+            self.latency.add(elapsed_ms)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": sum(self.errors.values()),
+            "error_types": dict(sorted(self.errors.items(), key=lambda kv: -kv[1])),
+            **self.latency.as_dict(),
+        }
+
+
+def log_files(log_dir: Path, name: str = "actions.log") -> list[Path]:
+    #Ротации RotatingFileHandler: actions.log.3 - самая старая, actions.log - текущая
+    rotated = [p for p in log_dir.glob(f"{name}.*") if p.suffix[1:].isdigit()]
+    rotated.sort(key=lambda p: int(p.suffix[1:]), reverse=True)
+    current = log_dir / name
+    return rotated + ([current] if current.exists() else [])
+
+
+def parse_line(line: str) -> dict[str, Any] | None:
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        try:
+            doc = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(doc, dict) or not doc.get("action"):
+            return None
+        elapsed = doc.get("elapsed_ms")
+        return {
+            "ts": str(doc.get("ts", "")),
+            "action": str(doc["action"]),
+            "result": str(doc.get("result", "OK")),
+            "elapsed_ms": float(elapsed) if isinstance(elapsed, (int, float)) else None,
+            "error_type": doc.get("error_type"),
+        }
+
+    m = _TEXT_LINE.match(line)
+    if m is None:
+        return None
+    rest = m.group("rest")
+    elapsed = _ELAPSED.search(rest)
+    error_type = _ERROR_TYPE.search(rest)
+    return {
+        "ts": m.group("ts"),
+        "action": m.group("action"),
+        "result": m.group("result"),
+        "elapsed_ms": float(elapsed.group(1)) if elapsed else None,
+        "error_type": error_type.group(1) if error_type else None,
+    }
+
+
+def iter_log_records(paths: list[Path]) -> Iterator[dict[str, Any] | None]:
+    #Файлы читаются построчно; None - строка, которую не удалось разобрать
+    for path in paths:
+        try:
+            with path.open("r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    yield parse_line(line)
+        except FileNotFoundError:
+            #Файл успели ротировать между glob и open
+            continue
+
+
+#Потоковый разбор actions.log и ротаций: счётчики, ошибки по типам, перцентили по окнам
+def analyze_logs(paths: list[Path], window_minutes: int = 60, action: str | None = None) -> dict[str, Any]:
+    window_s = max(1, int(window_minutes)) * 60
+    wanted = action.strip().upper() if action else None
+    totals: dict[str, _ActionStats] = {}
+    windows: dict[tuple[int, str], _ActionStats] = {}
+    lines = skipped = 0
+
+    for rec in iter_log_records(paths):
+        lines += 1
+        if rec is None:
+            skipped += 1
+            continue
+        if wanted is not None and rec["action"] != wanted:
+            continue
+        try:
+            ts = datetime.fromisoformat(rec["ts"].replace("Z", "+00:00")).replace(tzinfo=None)
+            start = int((ts - _EPOCH).total_seconds()) // window_s * window_s
+        except ValueError:
+            start = -1
+        args = (rec["result"], rec["elapsed_ms"], rec["error_type"])
+        totals.setdefault(rec["action"], _ActionStats()).add(*args)
+        windows.setdefault((start, rec["action"]), _ActionStats()).add(*args)
+
+    return {
+        "files": [str(p) for p in paths],
+        "lines": lines,
+        "skipped": skipped,
+        "window_minutes": window_s // 60,
+        "actions": {name: totals[name].as_dict() for name in sorted(totals)},
+        "windows": [
+            {
+                "start": (_EPOCH + timedelta(seconds=start)).isoformat() if start >= 0 else None,
+                "action": name,
+                **windows[(start, name)].as_dict(),
+            }
+            for start, name in sorted(windows)
+        ],
+    }
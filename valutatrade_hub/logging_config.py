@@ -1,13 +1,114 @@
 from __future__ import annotations
 
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 from valutatrade_hub.infra.settings import SettingsLoader
 
+#Поля, которые log_action передаёт через extra и которые пишутся в JSON как есть
+STRUCTURED_FIELDS = ("action", "result", "elapsed_ms", "error_type", "error_message")
+
+_listener: QueueListener | None = None
+_stats_lock = threading.Lock()
+_stats = {"dropped": 0, "sampled_out": 0}
+
+
+#Одна JSON-строка на запись
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in STRUCTURED_FIELDS:
+            if hasattr(record, key):
+                doc[key] = getattr(record, key)
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+#Частые успешные действия пишутся с заданной долей, ошибки - всегда
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self._rates = {str(k).upper(): float(v) for k, v in rates.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        action = getattr(record, "action", None)
+        if action is None or getattr(record, "result", None) != "OK":
+            return True
+        rate = self._rates.get(action)
+        if rate is None or random.random() < rate:
+            return True
+        with _stats_lock:
+            _stats["sampled_out"] += 1
+        return False
+
+
+#Ограниченный буфер: при переполнении запись отбрасывается, а не блокирует поток запроса
+class DroppingQueueHandler(QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _stats_lock:
+                _stats["dropped"] += 1
+
+
+def logging_stats() -> dict[str, int]:
+    with _stats_lock:
+        out = dict(_stats)
+    root_queue = next((h.queue for h in logging.getLogger().handlers if isinstance(h, QueueHandler)), None)
+    out["queued"] = root_queue.qsize() if root_queue is not None else 0
+    return out
+
+
+def _detach_queue_handlers() -> None:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+
+
+def shutdown_logging() -> None:
+    #Дописывает всё из очереди в файл; вызывается при выходе. QueueHandler снимается с root,
+    #иначе следующий setup_logging увидит его и не запустит слушателя - записи копились бы в очереди
+    global _listener
+    if _listener is None:
+        return
+    _detach_queue_handlers()
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def _reset_after_fork() -> None:
+    #Поток QueueListener в дочерний процесс не переходит: очередь родителя снимается, setup_logging настроит свою
+    global _listener
+    if _listener is None:
+        return
+    _detach_queue_handlers()
+    _listener = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
 #Логирование действий
 def setup_logging() -> None:
+    global _listener
     settings = SettingsLoader()
     log_dir = Path(settings.get("LOG_DIR", "logs"))
     log_dir.mkdir(parents=True, exist_ok=True)
@@ -20,10 +121,13 @@ def setup_logging() -> None:
 
     root.setLevel(logging.INFO)
 
-    fmt = logging.Formatter(
-        fmt="%(levelname)s %(asctime)s %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S",
-    )
+    if str(settings.get("LOG_FORMAT", "json")).lower() == "json":
+        fmt: logging.Formatter = JsonLinesFormatter()
+    else:
+        fmt = logging.Formatter(
+            fmt="%(levelname)s %(asctime)s %(message)s",
+            datefmt="%Y-%m-%dT%H:%M:%S",
+        )
 
     handler = RotatingFileHandler(
         filename=log_file,
@@ -32,4 +136,13 @@ def setup_logging() -> None:
         encoding="utf-8",
     )
     handler.setFormatter(fmt)
-    root.addHandler(handler)
\ No newline at end of file
+
+    #Запись на диск - в фоновом потоке QueueListener, поток запроса только кладёт запись в очередь
+    log_queue: queue.Queue = queue.Queue(maxsize=int(settings.get("LOG_QUEUE_SIZE", 10000)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.get("LOG_SAMPLING", {}) or {}))
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
@@ -1,27 +1,82 @@
 from __future__ import annotations
 
+import logging
+import threading
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 import requests
 
+from valutatrade_hub.core.currencies import crypto_provider_ids, currency_codes
 from valutatrade_hub.core.exceptions import ApiRequestError
 from valutatrade_hub.core.utils import utcnow_iso
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.throttling import TokenBucket
+
+_bucket_lock = threading.Lock()
+_coingecko_bucket_instance: TokenBucket | None = None
+
+
+#Один лимитер на процесс: квота общая для всех клиентов CoinGecko
+def _coingecko_bucket() -> TokenBucket:
+    global _coingecko_bucket_instance
+    with _bucket_lock:
+        if _coingecko_bucket_instance is None:
+            cfg = ParserConfig()
+            _coingecko_bucket_instance = TokenBucket(cfg.COINGECKO_RATE_PER_MINUTE, burst=cfg.COINGECKO_BURST)
+        return _coingecko_bucket_instance
+
+
+def _retry_after(value: str | None, default: float = 60.0) -> float:
+    #Retry-After - число секунд или HTTP-дата; неразборчивое значение - пауза по умолчанию
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
 
 
 class BaseApiClient(ABC):
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    #codes - загрузить только эти валюты (None - весь список провайдера)
     @abstractmethod
-    def fetch_rates(self) -> dict[str, dict]:
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
         raise NotImplementedError
 
+    #Метаданные валют провайдера для реестра (code, name, type, ...)
+    def fetch_currencies(self) -> list[dict]:
+        return []
+
 #Класс для работы с криптовалютным API
 class CoinGeckoClient(BaseApiClient):
-    def __init__(self) -> None:
+    #interactive - запрос из get-rate: короткий таймаут и без ожидания квоты после 429.
+    #retries - повторы части запроса (None - COINGECKO_CHUNK_RETRIES)
+    def __init__(self, interactive: bool = False, retries: int | None = None) -> None:
         self._cfg = ParserConfig()
+        self._interactive = interactive
+        self._retries = self._cfg.COINGECKO_CHUNK_RETRIES if retries is None else max(0, int(retries))
+
+    def _id_map(self) -> dict[str, str]:
+        id_map = dict(self._cfg.CRYPTO_ID_MAP)
+        id_map.update(crypto_provider_ids())
+        return id_map
 
-    def fetch_rates(self) -> dict[str, dict]:
+    def _fetch_chunk(self, ids: list[str]) -> dict:
         url = f"{self._cfg.COINGECKO_ROOT}/simple/price"
-        ids = [self._cfg.CRYPTO_ID_MAP[c] for c in self._cfg.CRYPTO_CURRENCIES]
         params = {
             "ids": ",".join(ids),
             "vs_currencies": self._cfg.BASE_CURRENCY.lower(),
@@ -30,17 +85,64 @@ class CoinGeckoClient(BaseApiClient):
         headers = {}
         headers["x-cg-demo-api-key"] = self._cfg.COINGECKO_API_KEY
 
-        try:
-            resp = requests.get(url, params=params, headers=headers, timeout=self._cfg.REQUEST_TIMEOUT)
-            if resp.status_code != 200:
-                raise ApiRequestError(reason=f"CoinGecko код статуса ={resp.status_code} body={resp.text[:200]}")
-            data = resp.json()
-        except requests.exceptions.RequestException as e:
-            raise ApiRequestError(reason=f"CoinGecko: возникла проблема на стороне сервиса {e}")
+        retries = 0 if self._interactive else self._retries
+        timeout = self._cfg.INTERACTIVE_TIMEOUT if self._interactive else self._cfg.REQUEST_TIMEOUT
+        last_error: ApiRequestError | None = None
+        for attempt in range(retries + 1):
+            if self._interactive:
+                if not _coingecko_bucket().acquire(timeout=0):
+                    raise ApiRequestError(reason="CoinGecko: квота запросов исчерпана, повторите позже")
+            else:
+                _coingecko_bucket().acquire()
+            try:
+                resp = requests.get(url, params=params, headers=headers, timeout=timeout)
+                if resp.status_code == 429:
+                    retry_after = _retry_after(resp.headers.get("Retry-After"))
+                    _coingecko_bucket().penalize(retry_after)
+                    raise ApiRequestError(reason=f"CoinGecko код статуса =429, повтор через {retry_after:.0f} с")
+                if resp.status_code != 200:
+                    raise ApiRequestError(reason=f"CoinGecko код статуса ={resp.status_code} body={resp.text[:200]}")
+                return resp.json()
+            except requests.exceptions.RequestException as e:
+                last_error = ApiRequestError(reason=f"CoinGecko: возникла проблема на стороне сервиса {e}")
+            except ApiRequestError as e:
+                last_error = e
+            if attempt < retries:
+                time.sleep(min(2**attempt, 8))
+        raise last_error
+
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
+        id_map = self._id_map()
+        if codes is not None:
+            id_map = {code: raw_id for code, raw_id in id_map.items() if code in codes}
+            if not id_map:
+                return {}
+        ids = list(dict.fromkeys(id_map.values()))
+        size = max(1, self._cfg.COINGECKO_CHUNK_SIZE)
+        chunks = [ids[i : i + size] for i in range(0, len(ids), size)]
+
+        #Каждая часть повторяется отдельно, успешные части объединяются
+        data: dict = {}
+        errors: list[str] = []
+        workers = max(1, min(self._cfg.COINGECKO_MAX_WORKERS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self._fetch_chunk, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                try:
+                    data.update(future.result())
+                except ApiRequestError as e:
+                    errors.append(e.reason)
+
+        if errors and not data:
+            raise ApiRequestError(reason="; ".join(errors[:3]))
+        if errors:
+            logging.getLogger(__name__).warning(
+                "CoinGecko: не загружено частей %s из %s: %s", len(errors), len(chunks), errors[0]
+            )
 
         out: dict[str, dict] = {}
         ts = utcnow_iso()
-        for code, raw_id in self._cfg.CRYPTO_ID_MAP.items():
+        for code, raw_id in id_map.items():
             node = data.get(raw_id, {})
             price = node.get(self._cfg.BASE_CURRENCY.lower())
             if isinstance(price, (int, float)):
@@ -48,12 +150,56 @@ class CoinGeckoClient(BaseApiClient):
                 out[pair] = {"rate": float(price), "updated_at": ts, "source": "CoinGecko"}
         return out
 
+    def fetch_currencies(self) -> list[dict]:
+        url = f"{self._cfg.COINGECKO_ROOT}/coins/markets"
+        headers = {"x-cg-demo-api-key": self._cfg.COINGECKO_API_KEY}
+        per_page = 250
+        out: list[dict] = []
+        seen: set[str] = set()
+        page = 1
+        while len(out) < self._cfg.COINGECKO_UNIVERSE_SIZE:
+            params = {
+                "vs_currency": self._cfg.BASE_CURRENCY.lower(),
+                "order": "market_cap_desc",
+                "per_page": per_page,
+                "page": page,
+            }
+            _coingecko_bucket().acquire()
+            try:
+                resp = requests.get(url, params=params, headers=headers, timeout=self._cfg.REQUEST_TIMEOUT)
+                if resp.status_code != 200:
+                    raise ApiRequestError(reason=f"CoinGecko код статуса ={resp.status_code} body={resp.text[:200]}")
+                coins = resp.json()
+            except requests.exceptions.RequestException as e:
+                raise ApiRequestError(reason=f"CoinGecko: возникла проблема на стороне сервиса {e}")
+            if not coins:
+                break
+            for coin in coins:
+                code = str(coin.get("symbol", "")).upper()
+                #Символы у монет повторяются - берём монету с наибольшей капитализацией
+                if not code or code in seen:
+                    continue
+                seen.add(code)
+                out.append(
+                    {
+                        "code": code,
+                        "name": coin.get("name") or code,
+                        "type": "crypto",
+                        "market_cap": coin.get("market_cap") or 0.0,
+                        "provider_id": coin.get("id"),
+                    }
+                )
+            if len(coins) < per_page:
+                break
+            page += 1
+        return out[: self._cfg.COINGECKO_UNIVERSE_SIZE]
+
 #Класс для работы с апи-ключом фиатной валюты
 class ExchangeRateApiClient(BaseApiClient):
     def __init__(self) -> None:
         self._cfg = ParserConfig()
 
-    def fetch_rates(self) -> dict[str, dict]:
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
         if not self._cfg.EXCHANGERATE_API_KEY:
             raise ApiRequestError(reason="Не задан апи-ключ для фиатных валют")
 
@@ -69,10 +215,72 @@ class ExchangeRateApiClient(BaseApiClient):
         conversion_rates = data.get("conversion_rates", {})
         ts = utcnow_iso()
 
+        #Берём все валюты из ответа за один проход, а не только FIAT_CURRENCIES.
+        #Запрос один при любом codes, фильтр лишь не пишет в историю курсы без спроса
         out: dict[str, dict] = {}
-        for code in self._cfg.FIAT_CURRENCIES:
-            value = conversion_rates.get(code)
+        for code, value in conversion_rates.items():
+            if code == self._cfg.BASE_CURRENCY or (codes is not None and code not in codes):
+                continue
             if isinstance(value, (int, float)) and float(value) != 0:
                 pair = f"{code}_{self._cfg.BASE_CURRENCY}"
                 out[pair] = {"rate": 1.0 / float(value), "updated_at": ts, "source": "ExchangeRate-API"}
-        return out
\ No newline at end of file
+        return out
+
+    def fetch_currencies(self) -> list[dict]:
+        if not self._cfg.EXCHANGERATE_API_KEY:
+            raise ApiRequestError(reason="Не задан апи-ключ для фиатных валют")
+
+        url = f"{self._cfg.EXCHANGERATE_API_URL}/{self._cfg.EXCHANGERATE_API_KEY}/codes"
+        try:
+            resp = requests.get(url, timeout=self._cfg.REQUEST_TIMEOUT)
+            if resp.status_code != 200:
+                raise ApiRequestError(reason=f"ExchangeRate-API код статуса={resp.status_code}")
+            data = resp.json()
+        except requests.exceptions.RequestException as e:
+            raise ApiRequestError(reason=f"ExchangeRate-API: возникла проблема на стороне сервиса {e}")
+
+        out: list[dict] = []
+        for item in data.get("supported_codes", []):
+            if isinstance(item, (list, tuple)) and len(item) >= 2:
+                out.append({"code": str(item[0]), "name": str(item[1]), "type": "fiat"})
+        return out
+
+#Резервный провайдер: один запрос отдаёт курсы к USD и фиата, и криптовалют.
+#kind ограничивает ответ валютами реестра одного типа - парами того основного провайдера, которого он подменяет
+class CoinbaseClient(BaseApiClient):
+    def __init__(self, kind: str = "crypto") -> None:
+        self._cfg = ParserConfig()
+        self._kind = kind
+
+    @property
+    def name(self) -> str:
+        #Крипто- и фиат-резервы - разные источники: свой circuit breaker и свой ряд задержек
+        return f"{type(self).__name__}[{self._kind}]"
+
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
+        url = f"{self._cfg.COINBASE_ROOT}/exchange-rates"
+        try:
+            resp = requests.get(url, params={"currency": self._cfg.BASE_CURRENCY}, timeout=self._cfg.REQUEST_TIMEOUT)
+            if resp.status_code != 200:
+                raise ApiRequestError(reason=f"Coinbase код статуса={resp.status_code}")
+            data = resp.json()
+        except requests.exceptions.RequestException as e:
+            raise ApiRequestError(reason=f"Coinbase: возникла проблема на стороне сервиса {e}")
+
+        scope = currency_codes(crypto=self._kind == "crypto")
+        if codes is not None:
+            scope &= set(codes)
+        out: dict[str, dict] = {}
+        ts = utcnow_iso()
+        #Курсы - сколько единиц валюты за 1 USD, строками
+        for code, value in ((data.get("data") or {}).get("rates") or {}).items():
+            code = str(code).upper()
+            if code == self._cfg.BASE_CURRENCY or code not in scope:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value > 0:
+                out[f"{code}_{self._cfg.BASE_CURRENCY}"] = {"rate": 1.0 / value, "updated_at": ts, "source": "Coinbase"}
+        return out
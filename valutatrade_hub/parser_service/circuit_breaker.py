@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any
+
+try:
+    import fcntl #только POSIX; без него два процесса могут затереть переходы цепи друг друга
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def _iso(ts: float | None) -> str | None:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+#Состояния всех провайдеров в одном файле, чтобы открытая цепь пережила перезапуск.
+#Файл маленький и перечитывается на каждый вызов - так его видят и соседние процессы.
+class CircuitStore:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            obj = super().__new__(cls)
+            obj._db = DatabaseManager()
+            obj._settings = SettingsLoader()
+            obj._lock = threading.Lock()
+            cls._instance = obj
+        return cls._instance
+
+    def _path(self):
+        return self._settings.path_for("CIRCUITS_FILE")
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        #Чтение состояния и запись перехода - под одной блокировкой файла: иначе соседний процесс
+        #перезапишет circuits.json между ними, и ошибка или проба потеряются
+        path = self._path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(path.suffix + ".lock"), "a+b") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def get(self, name: str) -> dict[str, Any]:
+        with self._lock:
+            states = self._db.read_json(self._path(), default={})
+            return dict(states.get(name) or {"state": CLOSED, "failures": 0})
+
+    def put(self, name: str, state: dict[str, Any]) -> None:
+        with self._lock:
+            states = self._db.read_json(self._path(), default={})
+            states[name] = state
+            self._db.write_json(self._path(), states)
+
+    def all(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return self._db.read_json(self._path(), default={})
+
+
+#Circuit breaker: closed -> (ошибки) -> open -> (пауза) -> half_open -> closed/open
+class CircuitBreaker:
+    def __init__(self, name: str) -> None:
+        settings = SettingsLoader()
+        self.name = name
+        self._store = CircuitStore()
+        self._threshold = int(settings.get("CIRCUIT_FAILURE_THRESHOLD", 1))
+        self._base_open = float(settings.get("CIRCUIT_OPEN_SECONDS", 60))
+        self._max_open = float(settings.get("CIRCUIT_MAX_OPEN_SECONDS", 900))
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    def before_call(self) -> None:
+        with self._lock, self._store.locked():
+            st = self._store.get(self.name)
+            if st["state"] == CLOSED:
+                return
+            now = time.time()
+            if st["state"] == OPEN and now >= float(st.get("next_probe_ts", 0)):
+                #Пропускаем ровно одну пробу, остальные вызовы отбиваем до её результата
+                st["state"] = HALF_OPEN
+                st["probe_started_ts"] = now
+                self._store.put(self.name, st)
+                return
+            if st["state"] == HALF_OPEN and now - float(st.get("probe_started_ts", 0)) > self._max_open:
+                #Зависшая проба (процесс упал) - разрешаем новую
+                st["probe_started_ts"] = now
+                self._store.put(self.name, st)
+                return
+            raise ApiRequestError(
+                reason=f"{self.name}: цепь разомкнута, следующая проба после {_iso(st.get('next_probe_ts'))}"
+            )
+
+    def on_success(self) -> None:
+        with self._lock, self._store.locked():
+            st = self._store.get(self.name)
+            if st["state"] == CLOSED and not st.get("failures"):
+                return
+            if st["state"] != CLOSED:
+                self._logger.info("Цепь %s замкнута", self.name)
+            self._store.put(self.name, {"state": CLOSED, "failures": 0})
+
+    def on_failure(self, error: Exception) -> None:
+        with self._lock, self._store.locked():
+            st = self._store.get(self.name)
+            failures = int(st.get("failures", 0)) + 1
+            now = time.time()
+            if st["state"] == HALF_OPEN:
+                open_seconds = min(self._max_open, float(st.get("open_seconds", self._base_open)) * 2)
+            elif failures >= self._threshold:
+                open_seconds = self._base_open
+            else:
+                self._store.put(self.name, {**st, "failures": failures, "last_error": str(error)[:200]})
+                return
+            self._store.put(
+                self.name,
+                {
+                    "state": OPEN,
+                    "failures": failures,
+                    "open_seconds": open_seconds,
+                    "opened_at": _iso(now),
+                    "next_probe_ts": now + open_seconds,
+                    "last_error": str(error)[:200],
+                },
+            )
+            self._logger.warning("Цепь %s разомкнута на %.0f с: %s", self.name, open_seconds, error)
+
+
+#Обёртка над любым клиентом: при открытой цепи - мгновенный отказ без таймаута
+class GuardedApiClient(BaseApiClient):
+    def __init__(self, client: BaseApiClient) -> None:
+        self._client = client
+        self._breaker = CircuitBreaker(client.name)
+
+    @property
+    def name(self) -> str:
+        return self._client.name
+
+    def _call(self, method: str, *args):
+        self._breaker.before_call()
+        try:
+            result = getattr(self._client, method)(*args)
+        except Exception as e:
+            self._breaker.on_failure(e)
+            raise
+        self._breaker.on_success()
+        return result
+
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
+        return self._call("fetch_rates", codes)
+
+    def fetch_currencies(self) -> list[dict]:
+        return self._call("fetch_currencies")
+
+
+def circuit_status() -> list[str]:
+    lines: list[str] = []
+    for name, st in sorted(CircuitStore().all().items()):
+        line = f"- {name}: {st.get('state', CLOSED)} (ошибок подряд: {st.get('failures', 0)})"
+        if st.get("state") in (OPEN, HALF_OPEN):
+            line += f", следующая проба: {_iso(st.get('next_probe_ts'))}, причина: {st.get('last_error', '')}"
+        lines.append(line)
+    return lines
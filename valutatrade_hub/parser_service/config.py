@@ -18,12 +18,26 @@ class ParserConfig:
 
     COINGECKO_ROOT: str = "https://api.coingecko.com/api/v3"
     EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6"
+    COINBASE_ROOT: str = "https://api.coinbase.com/v2" #резервный провайдер, ключ не нужен
 
     BASE_CURRENCY: str = "USD"
     FIAT_CURRENCIES: tuple[str, ...] = ("EUR", "GBP", "RUB")
     CRYPTO_CURRENCIES: tuple[str, ...] = ("BTC", "ETH", "SOL")
 
     REQUEST_TIMEOUT: int = 10
+    #get-rate ждёт ответа пользователь: один запрос с коротким таймаутом, без повторов
+    INTERACTIVE_TIMEOUT: int = 3
+
+    #Сколько криптовалют (по капитализации) брать из CoinGecko при синхронизации реестра
+    COINGECKO_UNIVERSE_SIZE: int = int(os.getenv("COINGECKO_UNIVERSE_SIZE", "250"))
+
+    #Запрос /simple/price разбивается на части, которые грузятся параллельно
+    COINGECKO_CHUNK_SIZE: int = int(os.getenv("COINGECKO_CHUNK_SIZE", "100"))
+    COINGECKO_MAX_WORKERS: int = int(os.getenv("COINGECKO_MAX_WORKERS", "4"))
+    COINGECKO_CHUNK_RETRIES: int = 2
+    #Квота demo-ключа: 30 запросов в минуту
+    COINGECKO_RATE_PER_MINUTE: int = int(os.getenv("COINGECKO_RATE_PER_MINUTE", "30"))
+    COINGECKO_BURST: int = 5
 
     CRYPTO_ID_MAP: dict[str, str] = None
 
@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from valutatrade_hub.core.alerts import AlertBook
+from valutatrade_hub.core.demand import DemandTracker
+from valutatrade_hub.core.orders import OrderBook
+from valutatrade_hub.core.rate_stats import RateStats
+from valutatrade_hub.core.utils import utcnow_iso
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.updater import register_unknown_currencies
+
+
+@dataclass
+class StageMetrics:
+    received: int = 0
+    emitted: int = 0
+    dropped: int = 0
+    busy_s: float = 0.0
+    max_queue_depth: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    def as_dict(self, queue: asyncio.Queue | None) -> dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "received": self.received,
+            "emitted": self.emitted,
+            "dropped": self.dropped,
+            "per_s": round(self.emitted / elapsed, 2),
+            "busy_pct": round(100 * self.busy_s / elapsed, 1),
+            "queue_depth": queue.qsize() if queue is not None else 0,
+            "max_queue_depth": self.max_queue_depth,
+        }
+
+
+#Асинхронный конвейер: fetch -> normalize -> dedupe -> persist.
+#Стадии связаны ограниченными очередями; медленная запись на диск не задерживает загрузку:
+#пока persist занят, dedupe сливает новые курсы в один ожидающий пакет.
+class AsyncRatesPipeline:
+    def __init__(
+        self,
+        clients: list[BaseApiClient],
+        storage: RatesStorage,
+        interval_seconds: float = 3600,
+        queue_size: int = 8,
+        demand: DemandTracker | None = None,
+        alerts: AlertBook | None = None,
+        orders: OrderBook | None = None,
+        stats: RateStats | None = None,
+    ) -> None:
+        self._clients = clients
+        self._storage = storage
+        self._demand = demand
+        self._alerts = alerts
+        self._orders = orders
+        self._stats = stats
+        self._interval = float(interval_seconds)
+        self._queue_size = int(queue_size)
+        self._logger = logging.getLogger(__name__)
+        self._metrics = {name: StageMetrics() for name in ("fetch", "normalize", "dedupe", "persist")}
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._last_rates: dict[str, tuple[float, str]] = {}
+        self._dedupe_pending = 0
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        queues = {"fetch": None, "normalize": "fetched", "dedupe": "normalized", "persist": "batches"}
+        return {
+            stage: m.as_dict(self._queues.get(queues[stage]) if queues[stage] else None)
+            for stage, m in self._metrics.items()
+        }
+
+    async def _put(self, name: str, item: Any) -> None:
+        #Блокирующий put на полной очереди и есть обратное давление на предыдущую стадию
+        queue = self._queues[name]
+        await queue.put(item)
+        m = self._metrics[{"fetched": "normalize", "normalized": "dedupe", "batches": "persist"}[name]]
+        m.max_queue_depth = max(m.max_queue_depth, queue.qsize())
+
+    async def _fetch_loop(self, client: BaseApiClient, rounds: int | None) -> None:
+        m = self._metrics["fetch"]
+        done = 0
+        while rounds is None or done < rounds:
+            started = time.monotonic()
+            try:
+                codes = await asyncio.to_thread(self._demand.plan, client.name) if self._demand else None
+                #HTTP-клиенты синхронные - вызов уходит в пул потоков, цикл событий свободен
+                data = {} if codes is not None and not codes else await asyncio.to_thread(client.fetch_rates, codes)
+                if codes is None and self._demand is not None:
+                    await asyncio.to_thread(self._demand.mark_full, client.name)
+                await asyncio.to_thread(register_unknown_currencies, client, data)
+                m.received += 1
+                await self._put("fetched", (client.name, data))
+                m.emitted += 1
+            except Exception as e:
+                m.dropped += 1
+                self._logger.error("Ошибка %s: %s", client.name, str(e))
+            m.busy_s += time.monotonic() - started
+            done += 1
+            if rounds is None or done < rounds:
+                await asyncio.sleep(self._interval)
+
+    async def _normalize_loop(self) -> None:
+        m = self._metrics["normalize"]
+        while True:
+            name, data = await self._queues["fetched"].get()
+            started = time.monotonic()
+            m.received += len(data)
+            rows: dict[str, dict[str, Any]] = {}
+            for pair, obj in data.items():
+                rate = obj.get("rate") if isinstance(obj, dict) else None
+                if not isinstance(rate, (int, float)) or rate <= 0 or "_" not in pair:
+                    m.dropped += 1
+                    continue
+                rows[pair.upper()] = {
+                    "rate": float(rate),
+                    "updated_at": obj.get("updated_at") or utcnow_iso(),
+                    "source": obj.get("source", name),
+                    "client": name,
+                }
+            m.emitted += len(rows)
+            m.busy_s += time.monotonic() - started
+            await self._put("normalized", rows)
+            self._queues["fetched"].task_done()
+
+    async def _dedupe_loop(self) -> None:
+        m = self._metrics["dedupe"]
+        pending: dict[str, dict[str, Any]] = {}
+        queue = self._queues["normalized"]
+        while True:
+            try:
+                rows = await asyncio.wait_for(queue.get(), timeout=0.05 if pending else None)
+            except asyncio.TimeoutError:
+                rows = None
+            started = time.monotonic()
+            if rows is not None:
+                m.received += len(rows)
+                for pair, obj in rows.items():
+                    #Более свежий курс по паре замещает ожидающий, лишний пакет не пишем
+                    if pair in pending:
+                        m.dropped += 1
+                    pending[pair] = obj
+                queue.task_done()
+            if pending:
+                try:
+                    self._queues["batches"].put_nowait(pending)
+                    m.emitted += len(pending)
+                    pm = self._metrics["persist"]
+                    pm.max_queue_depth = max(pm.max_queue_depth, self._queues["batches"].qsize())
+                    pending = {}
+                except asyncio.QueueFull:
+                    pass
+            self._dedupe_pending = len(pending)
+            m.busy_s += time.monotonic() - started
+
+    def _persist_batch(self, batch: dict[str, dict[str, Any]]) -> int:
+        snapshot = self._storage.read_snapshot()
+        old_pairs = snapshot.get("pairs", {}) or {}
+        pairs = dict(old_pairs)
+        ts = utcnow_iso()
+        history: list[dict[str, Any]] = []
+        for pair, obj in batch.items():
+            pairs[pair] = {"rate": obj["rate"], "updated_at": obj["updated_at"], "source": obj["source"]}
+            #В историю попадает только изменившийся курс
+            if self._last_rates.get(pair) == (obj["rate"], obj["source"]):
+                continue
+            self._last_rates[pair] = (obj["rate"], obj["source"])
+            history.append(
+                {
+                    "id": f"{pair}_{ts}",
+                    "from_currency": pair.split("_", 1)[0],
+                    "to_currency": pair.split("_", 1)[1],
+                    "rate": obj["rate"],
+                    "timestamp": obj["updated_at"],
+                    "source": obj["source"],
+                    "meta": {"client": obj["client"]},
+                }
+            )
+        self._storage.write_snapshot(pairs)
+        if history:
+            self._storage.append_history(history)
+            if self._stats is not None:
+                self._stats.ingest(history)
+        if self._alerts is not None:
+            try:
+                self._alerts.evaluate(old_pairs, pairs)
+            except Exception as e:
+                self._logger.error("Не удалось проверить уведомления о курсах: %s", str(e))
+        if self._orders is not None:
+            try:
+                self._orders.match(pairs)
+            except Exception as e:
+                self._logger.error("Не удалось исполнить лимитные заявки: %s", str(e))
+        return len(history)
+
+    async def _persist_loop(self) -> None:
+        m = self._metrics["persist"]
+        queue = self._queues["batches"]
+        while True:
+            batch = await queue.get()
+            started = time.monotonic()
+            m.received += len(batch)
+            try:
+                written = await asyncio.to_thread(self._persist_batch, batch)
+                m.emitted += len(batch)
+                m.dropped += len(batch) - written
+            except Exception as e:
+                self._logger.error("Не удалось сохранить курсы: %s", str(e))
+            m.busy_s += time.monotonic() - started
+            queue.task_done()
+
+    async def run(self, rounds: int | None = None, stop: asyncio.Event | None = None) -> dict[str, dict[str, Any]]:
+        self._queues = {
+            "fetched": asyncio.Queue(maxsize=self._queue_size),
+            "normalized": asyncio.Queue(maxsize=self._queue_size),
+            "batches": asyncio.Queue(maxsize=1),
+        }
+        for m in self._metrics.values():
+            m.started = time.monotonic()
+
+        workers = [
+            asyncio.create_task(self._normalize_loop()),
+            asyncio.create_task(self._dedupe_loop()),
+            asyncio.create_task(self._persist_loop()),
+        ]
+        fetchers = [asyncio.create_task(self._fetch_loop(c, rounds)) for c in self._clients]
+        try:
+            if stop is None:
+                await asyncio.gather(*fetchers)
+            else:
+                stopper = asyncio.create_task(stop.wait())
+                await asyncio.wait([stopper, *fetchers], return_when=asyncio.FIRST_COMPLETED)
+                stopper.cancel()
+            #Дожидаемся, пока всё загруженное дойдёт до диска
+            for name in ("fetched", "normalized"):
+                await self._queues[name].join()
+            while self._dedupe_pending:
+                await asyncio.sleep(0.01)
+            await self._queues["batches"].join()
+        finally:
+            for task in fetchers + workers:
+                task.cancel()
+            await asyncio.gather(*fetchers, *workers, return_exceptions=True)
+        return self.metrics()
+
+
+#Аналог RatesScheduler: цикл событий конвейера в отдельном фоновом потоке
+class AsyncRatesScheduler:
+    def __init__(
+        self,
+        interval_seconds: int = 3600,
+        clients: list[BaseApiClient] | None = None,
+        demand: DemandTracker | None = None,
+        alerts: AlertBook | None = None,
+        orders: OrderBook | None = None,
+        stats: RateStats | None = None,
+    ) -> None:
+        if clients is None:
+            from valutatrade_hub.parser_service.quorum import build_clients
+
+            clients = build_clients()
+        self._pipeline = AsyncRatesPipeline(
+            clients,
+            RatesStorage(),
+            interval_seconds=interval_seconds,
+            demand=demand,
+            alerts=alerts,
+            orders=orders,
+            stats=stats,
+        )
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: asyncio.Event | None = None
+        self._logger = logging.getLogger(__name__)
+
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        return self._pipeline.metrics()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._stop = asyncio.Event()
+        try:
+            self._loop.run_until_complete(self._pipeline.run(stop=self._stop))
+        except Exception as e:
+            self._logger.error("Конвейер курсов остановлен: %s", str(e))
+        finally:
+            self._loop.close()
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout=2)
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.core.utils import percentile
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.parser_service.api_clients import (
+    BaseApiClient,
+    CoinbaseClient,
+    CoinGeckoClient,
+    ExchangeRateApiClient,
+)
+from valutatrade_hub.parser_service.circuit_breaker import GuardedApiClient
+
+
+#Задержки источников курсов в этом процессе: последние RATES_LATENCY_WINDOW успешных ответов,
+#ошибки и число пар, взятых в снимок. Замеры идут и от проигравших запросов - иначе p95 занижался бы.
+#Таймауты в окно не попадают: иначе при частых зависаниях p95 равнялся бы таймауту и резерв запускался бы поздно
+class SourceLatency:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            obj = super().__new__(cls)
+            obj._settings = SettingsLoader()
+            obj._lock = threading.Lock()
+            obj._samples = {}
+            obj._calls = {}
+            obj._errors = {}
+            obj._taken = {}
+            cls._instance = obj
+        return cls._instance
+
+    def record(self, name: str, elapsed_ms: float, ok: bool) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                window = int(self._settings.get("RATES_LATENCY_WINDOW", 200))
+                samples = self._samples[name] = deque(maxlen=max(1, window))
+            self._calls[name] = self._calls.get(name, 0) + 1
+            if ok:
+                samples.append(elapsed_ms)
+            else:
+                self._errors[name] = self._errors.get(name, 0) + 1
+
+    def took(self, name: str, pairs: int) -> None:
+        with self._lock:
+            self._taken[name] = self._taken.get(name, 0) + pairs
+
+    def percentile(self, name: str, q: float) -> float | None:
+        #None - замеров меньше RATES_HEDGE_MIN_SAMPLES, оценке рано верить
+        min_samples = int(self._settings.get("RATES_HEDGE_MIN_SAMPLES", 5))
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return percentile(samples, q)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            names = sorted(self._calls)
+            samples = {n: sorted(self._samples[n]) for n in names}
+            out = {
+                n: {"calls": self._calls[n], "errors": self._errors.get(n, 0), "taken": self._taken.get(n, 0)}
+                for n in names
+            }
+        for n in names:
+            out[n]["p50_ms"] = percentile(samples[n], 50)
+            out[n]["p95_ms"] = percentile(samples[n], 95)
+        return out
+
+
+def latency_status() -> list[str]:
+    return [
+        f"- {name}: вызовов {s['calls']}, ошибок {s['errors']}, p50 {s['p50_ms']:.0f} мс, "
+        f"p95 {s['p95_ms']:.0f} мс, пар в снимке {s['taken']}"
+        for name, s in SourceLatency().stats().items()
+    ]
+
+
+#Несколько источников для одних пар. Запросы хеджируются: следующий источник запускается, если
+#запущенные не ответили за p95 последнего из них (или сразу после ошибки). quorum=1 - берётся
+#первый ответ; quorum=N - ждём N ответов и берём медиану по каждой паре. Победивший источник
+#остаётся в поле source пары. Имя группы - имя основного источника: спрос и метаданные валют - его.
+class QuorumApiClient(BaseApiClient):
+    def __init__(
+        self, sources: list[BaseApiClient], quorum: int | None = None, hedge_ms: float | None = None
+    ) -> None:
+        if not sources:
+            raise ValueError("Нужен хотя бы один источник курсов")
+        settings = SettingsLoader()
+        self._sources = list(sources)
+        self._quorum = max(1, min(int(quorum or settings.get("RATES_QUORUM", 1)), len(self._sources)))
+        self._default_hedge_ms = float(hedge_ms if hedge_ms is not None else settings.get("RATES_HEDGE_DEFAULT_MS", 1000))
+        self._latency = SourceLatency()
+        self._logger = logging.getLogger(__name__)
+
+    @property
+    def name(self) -> str:
+        return self._sources[0].name
+
+    @property
+    def sources(self) -> list[BaseApiClient]:
+        return list(self._sources)
+
+    def fetch_currencies(self) -> list[dict]:
+        return self._sources[0].fetch_currencies()
+
+    def _hedge_delay(self, source: BaseApiClient) -> float:
+        p95 = self._latency.percentile(source.name, 95)
+        return (p95 if p95 is not None else self._default_hedge_ms) / 1000
+
+    def _timed(self, source: BaseApiClient, codes: set[str] | None) -> dict[str, dict]:
+        started = time.perf_counter()
+        try:
+            data = source.fetch_rates(codes)
+        except Exception:
+            self._latency.record(source.name, (time.perf_counter() - started) * 1000, ok=False)
+            raise
+        self._latency.record(source.name, (time.perf_counter() - started) * 1000, ok=True)
+        return data
+
+    def _collect(self, codes: set[str] | None) -> tuple[list[tuple[str, dict[str, dict]]], list[str]]:
+        answers: list[tuple[str, dict[str, dict]]] = []
+        errors: list[str] = []
+        queue = list(self._sources)
+        pending: dict[Future, BaseApiClient] = {}
+        hedge_at = 0.0
+        #Отдельный пул на вызов: отставшие запросы дорабатывают в фоне и не занимают потоки следующего обновления
+        pool = ThreadPoolExecutor(max_workers=len(self._sources), thread_name_prefix=f"quorum-{self.name}")
+
+        def launch() -> None:
+            nonlocal hedge_at
+            source = queue.pop(0)
+            pending[pool.submit(self._timed, source, codes)] = source
+            hedge_at = time.monotonic() + self._hedge_delay(source)
+
+        try:
+            while len(answers) < self._quorum:
+                #Ответов и запросов в полёте меньше кворума (старт или ошибка) - запускаем следующий сразу
+                while queue and len(answers) + len(pending) < self._quorum:
+                    launch()
+                if not pending:
+                    break
+                timeout = max(0.0, hedge_at - time.monotonic()) if queue else None
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    self._logger.info("%s: нет ответа за p95, запускаем %s", self.name, queue[0].name)
+                    launch()
+                    continue
+                for future in done:
+                    source = pending.pop(future)
+                    try:
+                        answers.append((source.name, future.result()))
+                    except Exception as e:
+                        errors.append(f"{source.name}: {e}")
+        finally:
+            pool.shutdown(wait=False)
+        return answers, errors
+
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
+        answers, errors = self._collect(codes)
+        if not answers:
+            raise ApiRequestError(reason="; ".join(errors) or f"{self.name}: нет ответа")
+
+        if self._quorum == 1:
+            name, data = answers[0]
+            self._latency.took(name, len(data))
+            return {pair: {**obj, "source": obj.get("source") or name} for pair, obj in data.items()}
+
+        if len(answers) < self._quorum:
+            self._logger.warning("%s: кворум не собран, ответов %s из %s", self.name, len(answers), self._quorum)
+        quotes: dict[str, list[tuple[float, str, dict]]] = {}
+        for name, data in answers:
+            for pair, obj in data.items():
+                rate = obj.get("rate") if isinstance(obj, dict) else None
+                if isinstance(rate, (int, float)) and rate > 0:
+                    quotes.setdefault(pair, []).append((float(rate), obj.get("source") or name, obj))
+
+        out: dict[str, dict] = {}
+        taken: dict[str, int] = {}
+        for pair, qs in quotes.items():
+            qs.sort(key=lambda q: q[0])
+            mid = qs[len(qs) // 2]
+            if len(qs) % 2:
+                rate, source = mid[0], mid[1]
+            else:
+                #Чётное число ответов - среднее двух средних котировок, в source оба источника
+                low = qs[len(qs) // 2 - 1]
+                rate, source = statistics.fmean((low[0], mid[0])), f"{low[1]}+{mid[1]}"
+            out[pair] = {**mid[2], "rate": rate, "source": source}
+            for name in source.split("+"):
+                taken[name] = taken.get(name, 0) + 1
+        for name, n in taken.items():
+            self._latency.took(name, n)
+        return out
+
+
+_PRIMARIES = {"coingecko": CoinGeckoClient, "exchangerate": ExchangeRateApiClient}
+
+
+def _backup_client(name: str, primary: str) -> BaseApiClient:
+    if str(name).strip().lower() == "coinbase":
+        return CoinbaseClient(kind="crypto" if primary == "coingecko" else "fiat")
+    raise ValueError(f"Неизвестный резервный провайдер: {name}")
+
+
+def build_clients(source: str = "all", record: bool = False, interactive: bool = False) -> list[BaseApiClient]:
+    #Клиент на основной провайдер; с резервами из RATES_BACKUP_SOURCES - группа QuorumApiClient.
+    #Circuit breaker у каждого источника свой; interactive - быстрый отказ CoinGecko для get-rate
+    from valutatrade_hub.parser_service.replay import RecordingApiClient
+
+    src = str(source).strip().lower()
+    if src in {"all", ""}:
+        keys = list(_PRIMARIES)
+    elif src in _PRIMARIES:
+        keys = [src]
+    else:
+        raise ValueError("source должен быть: coingecko, exchangerate или all")
+
+    def guarded(client: BaseApiClient) -> BaseApiClient:
+        return GuardedApiClient(RecordingApiClient(client) if record else client)
+
+    backups = SettingsLoader().get("RATES_BACKUP_SOURCES", {}) or {}
+    clients: list[BaseApiClient] = []
+    for key in keys:
+        #Под circuit breaker повторы частей CoinGecko выключены: breaker считает ошибку на вызов,
+        #и три неудачные попытки внутри одного вызова он видел бы как одну. Повторяет сам breaker - пробами
+        primary = CoinGeckoClient(interactive=interactive, retries=0) if key == "coingecko" else _PRIMARIES[key]()
+        sources = [guarded(primary)]
+        sources += [guarded(_backup_client(b, key)) for b in backups.get(key, [])]
+        clients.append(sources[0] if len(sources) == 1 else QuorumApiClient(sources))
+    return clients
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.core.utils import percentile, utcnow_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.storage import RatesStorage
+
+
+def recordings_dir() -> Path:
+    settings = SettingsLoader()
+    return settings.data_dir() / str(settings.get("RECORDINGS_DIR", "recordings"))
+
+
+#Запись: проксирует реальный клиент и сохраняет каждый ответ в <имя клиента>.jsonl
+class RecordingApiClient(BaseApiClient):
+    def __init__(self, client: BaseApiClient, folder: Path | None = None) -> None:
+        self._client = client
+        self._path = (folder or recordings_dir()) / f"{client.name}.jsonl"
+        self._db = DatabaseManager()
+
+    @property
+    def name(self) -> str:
+        return self._client.name
+
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
+        started = time.perf_counter()
+        record: dict[str, Any] = {"client": self.name, "recorded_at": utcnow_iso()}
+        try:
+            payload = self._client.fetch_rates(codes)
+            record["payload"] = payload
+            return payload
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            self._db.append_jsonl(self._path, [record])
+
+    def fetch_currencies(self) -> list[dict]:
+        return self._client.fetch_currencies()
+
+
+#Воспроизведение записанных ответов без сети: задержка, разброс, ошибки, таймауты
+class ReplayApiClient(BaseApiClient):
+    def __init__(
+        self,
+        records: list[dict[str, Any]],
+        name: str = "ReplayApiClient",
+        latency_ms: float | None = None,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        partial_rate: float = 0.0,
+        timeout_s: float = 10.0,
+        seed: int | None = None,
+    ) -> None:
+        self._records = [r for r in records if isinstance(r.get("payload"), dict)]
+        if not self._records:
+            raise ValueError("В записи нет ни одного успешного ответа")
+        self._name = name
+        self._latency_ms = latency_ms #None - задержка как при записи
+        self._jitter_ms = float(jitter_ms)
+        self._error_rate = float(error_rate)
+        self._timeout_rate = float(timeout_rate)
+        self._partial_rate = float(partial_rate)
+        self._timeout_s = float(timeout_s)
+        self._rng = random.Random(seed)
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_recording(cls, path: Path, **kwargs: Any) -> ReplayApiClient:
+        records = [r for _pos, r in DatabaseManager().iter_jsonl(path)]
+        kwargs.setdefault("name", records[0].get("client", path.stem) if records else path.stem)
+        return cls(records, **kwargs)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def fetch_rates(self, codes: set[str] | None = None) -> dict[str, dict]:
+        with self._lock:
+            record = self._records[self._pos % len(self._records)]
+            self._pos += 1
+            roll = self._rng.random()
+            base = self._latency_ms if self._latency_ms is not None else float(record.get("elapsed_ms", 0.0))
+            delay = max(0.0, base + self._rng.uniform(-self._jitter_ms, self._jitter_ms)) / 1000
+            pairs = [
+                p
+                for p in record["payload"]
+                if (codes is None or p.split("_", 1)[0] in codes)
+                and (not self._partial_rate or self._rng.random() >= self._partial_rate)
+            ]
+
+        if roll < self._timeout_rate:
+            time.sleep(self._timeout_s)
+            raise ApiRequestError(reason=f"{self._name}: таймаут (replay)")
+        time.sleep(delay)
+        if roll < self._timeout_rate + self._error_rate:
+            raise ApiRequestError(reason=f"{self._name}: ошибка провайдера (replay)")
+
+        #Курсы выдаются как свежие, чтобы работала проверка TTL
+        ts = utcnow_iso()
+        return {pair: {**record["payload"][pair], "updated_at": ts} for pair in pairs}
+
+
+#Хранилище в памяти, чтобы нагрузочный прогон не переписывал data/rates.json
+class MemoryRatesStorage(RatesStorage):
+    def __init__(self) -> None:
+        self._snapshot: dict[str, Any] = {"pairs": {}, "last_refresh": None}
+        self.history_size = 0
+
+    def read_snapshot(self) -> dict[str, Any]:
+        return self._snapshot
+
+    def write_snapshot(self, pairs: dict[str, dict[str, Any]]) -> None:
+        self._snapshot = {"pairs": pairs, "last_refresh": utcnow_iso()}
+
+    def append_history(self, records: list[dict[str, Any]]) -> None:
+        self.history_size += len(records)
+
+
+def load_replay_clients(folder: Path | None = None, **kwargs: Any) -> list[ReplayApiClient]:
+    folder = folder or recordings_dir()
+    return [ReplayApiClient.from_recording(p, **kwargs) for p in sorted(folder.glob("*.jsonl"))]
+
+
+#Прогон RatesUpdater на воспроизводимых клиентах: пропускная способность и хвосты задержек
+def benchmark_refresh(clients: list[BaseApiClient], iterations: int = 100) -> dict[str, float]:
+    from valutatrade_hub.parser_service.updater import RatesUpdater
+
+    storage = MemoryRatesStorage()
+    updater = RatesUpdater(clients=clients, storage=storage)
+    latencies: list[float] = []
+    pairs = 0
+    started = time.perf_counter()
+    for _ in range(int(iterations)):
+        t0 = time.perf_counter()
+        pairs += updater.run_update()["total"]
+        latencies.append((time.perf_counter() - t0) * 1000)
+    total_s = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "iterations": float(iterations),
+        "refresh_per_s": iterations / total_s if total_s else 0.0,
+        "pairs_per_s": pairs / total_s if total_s else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
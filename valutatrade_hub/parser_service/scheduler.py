@@ -3,14 +3,29 @@ from __future__ import annotations
 import logging
 import threading
 
-from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
+from valutatrade_hub.core.alerts import AlertBook
+from valutatrade_hub.core.demand import DemandTracker
+from valutatrade_hub.core.orders import OrderBook
+from valutatrade_hub.core.rate_stats import RateStats
+from valutatrade_hub.parser_service.quorum import build_clients
 from valutatrade_hub.parser_service.storage import RatesStorage
 from valutatrade_hub.parser_service.updater import RatesUpdater
 
 #Класс для автоматического обновления курсов валют
 class RatesScheduler:
-    def __init__(self, interval_seconds: int = 3600) -> None: #Обновление показателей валюты раз - в час, так как у меня количество обращений к апи ограничено
+    def __init__(
+        self,
+        interval_seconds: int = 3600,
+        demand: DemandTracker | None = None,
+        alerts: AlertBook | None = None,
+        orders: OrderBook | None = None,
+        stats: RateStats | None = None,
+    ) -> None: #Обновление показателей валюты раз - в час, так как у меня количество обращений к апи ограничено
         self._interval = int(interval_seconds)
+        self._demand = demand
+        self._alerts = alerts
+        self._orders = orders
+        self._stats = stats
         self._stop_event = threading.Event()
         self._thread: threading.Thread | None = None
         self._logger = logging.getLogger(__name__)
@@ -29,8 +44,12 @@ class RatesScheduler:
 
     def _run_loop(self) -> None:
         updater = RatesUpdater(
-            clients=[CoinGeckoClient(), ExchangeRateApiClient()],
+            clients=build_clients(),
             storage=RatesStorage(),
+            demand=self._demand,
+            alerts=self._alerts,
+            orders=self._orders,
+            stats=self._stats,
         )
 
         while not self._stop_event.is_set():
@@ -2,17 +2,25 @@ from __future__ import annotations
 
 from typing import Any
 
+from valutatrade_hub.core.rates_snapshot import publish_snapshot
 from valutatrade_hub.core.utils import utcnow_iso
 from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.shared_rates import publish_rates
 
 #Сохранение итогового проекта
 class RatesStorage:
     def __init__(self) -> None:
         self._db = DatabaseManager()
 
+    def read_snapshot(self) -> dict[str, Any]:
+        return self._db.load_rates()
+
     def write_snapshot(self, pairs: dict[str, dict[str, Any]]) -> None:
         doc = {"pairs": pairs, "last_refresh": utcnow_iso()}
         self._db.save_rates(doc)
+        seq = publish_rates(doc)
+        #Читатели в этом процессе видят новый снимок сразу; по origin они узнают его в rates.shm и rates.json
+        publish_snapshot(doc, origin=("shm", seq) if seq is not None else self._db.rates_origin())
 
     def append_history(self, records: list[dict[str, Any]]) -> None:
         history = self._db.load_history()
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import threading
+import time
+
+
+#Token bucket: не больше rate_per_minute запросов в минуту с запасом burst
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int = 1) -> None:
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute должен быть положительным")
+        self._rate = float(rate_per_minute) / 60.0
+        self._capacity = float(max(1, burst))
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return True
+                wait = (1.0 - self._tokens) / self._rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    def penalize(self, seconds: float) -> None:
+        #После 429 откладываем все запросы на Retry-After секунд
+        with self._lock:
+            self._refill()
+            self._tokens -= float(seconds) * self._rate
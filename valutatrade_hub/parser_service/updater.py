@@ -3,31 +3,80 @@ from __future__ import annotations
 import logging
 from typing import Any
 
+from valutatrade_hub.core.alerts import AlertBook
+from valutatrade_hub.core.currencies import is_known_currency, register_currencies
+from valutatrade_hub.core.demand import DemandTracker
+from valutatrade_hub.core.orders import OrderBook
+from valutatrade_hub.core.rate_stats import RateStats
 from valutatrade_hub.core.utils import utcnow_iso
 from valutatrade_hub.parser_service.api_clients import BaseApiClient
 from valutatrade_hub.parser_service.storage import RatesStorage
 
+#Метаданные запрашиваем только когда провайдер вернул незнакомые коды
+def register_unknown_currencies(client: BaseApiClient, data: dict[str, dict]) -> None:
+    logger = logging.getLogger(__name__)
+    unknown = {pair.split("_", 1)[0] for pair in data if not is_known_currency(pair.split("_", 1)[0])}
+    if not unknown:
+        return
+    try:
+        added = register_currencies(client.fetch_currencies())
+        logger.info("Реестр валют пополнен из %s: %s", client.name, added)
+    except Exception as e:
+        logger.error("Не удалось получить метаданные валют %s: %s", client.name, str(e))
+
 #Класс для работы с процессами обновлений
 class RatesUpdater:
-    def __init__(self, clients: list[BaseApiClient], storage: RatesStorage) -> None:
+    def __init__(
+        self,
+        clients: list[BaseApiClient],
+        storage: RatesStorage,
+        demand: DemandTracker | None = None,
+        alerts: AlertBook | None = None,
+        orders: OrderBook | None = None,
+        stats: RateStats | None = None,
+    ) -> None:
         self._clients = clients
         self._storage = storage
+        self._demand = demand #None - каждый раз полный список провайдера
+        self._alerts = alerts
+        self._orders = orders
+        self._stats = stats
         self._logger = logging.getLogger(__name__)
 
     def run_update(self) -> dict[str, Any]:
         self._logger.info("Начинаем обновление...")
 
-        merged_pairs: dict[str, dict[str, Any]] = {}
+        #Пары недоступных провайдеров остаются из прошлого снимка со старым updated_at
+        previous = self._storage.read_snapshot()
+        merged_pairs: dict[str, dict[str, Any]] = dict(previous.get("pairs", {}) or {})
+        fresh_pairs: dict[str, dict[str, Any]] = {} #только пары, пришедшие в этом обновлении
+        updated = 0
+        attempted = 0
         history_records: list[dict[str, Any]] = []
         ts = utcnow_iso()
 
         for client in self._clients:
-            name = type(client).__name__
+            name = client.name
+            codes = self._demand.plan(name) if self._demand is not None else None
+            if codes is not None and not codes:
+                self._logger.info("Пропускаем %s: нет валют со спросом", name)
+                continue
+            attempted += 1
             try:
-                data = client.fetch_rates()
-                self._logger.info("Извлекаем из %s... OK (%s rates)", name, len(data))
+                data = client.fetch_rates(codes)
+                self._logger.info(
+                    "Извлекаем из %s (%s)... OK (%s rates)",
+                    name,
+                    "все" if codes is None else f"спрос: {len(codes)}",
+                    len(data),
+                )
+                if codes is None and self._demand is not None:
+                    self._demand.mark_full(name)
+                register_unknown_currencies(client, data)
+                updated += len(data)
                 for pair, obj in data.items():
                     merged_pairs[pair] = obj
+                    fresh_pairs[pair] = obj
                     history_records.append(
                         {
                             "id": f"{pair}_{ts}",
@@ -42,8 +91,26 @@ class RatesUpdater:
             except Exception as e:
                 self._logger.error("Ошибка %s: %s", name, str(e))
 
+        if not updated:
+            if attempted:
+                self._logger.warning("Ни один провайдер не ответил, остаётся прежний снимок")
+            return {"total": 0, "last_refresh": previous.get("last_refresh")}
+
         self._logger.info("Записываем данные %s в data/rates.json...", len(merged_pairs))
         self._storage.write_snapshot(merged_pairs)
         self._storage.append_history(history_records)
+        if self._stats is not None:
+            self._stats.ingest(history_records)
+        if self._alerts is not None:
+            try:
+                self._alerts.evaluate(previous.get("pairs", {}) or {}, merged_pairs)
+            except Exception as e:
+                self._logger.error("Не удалось проверить уведомления о курсах: %s", str(e))
+        if self._orders is not None:
+            try:
+                #Заявки исполняются только по свежим курсам: пара упавшего провайдера несёт прошлую цену
+                self._orders.match(fresh_pairs)
+            except Exception as e:
+                self._logger.error("Не удалось исполнить лимитные заявки: %s", str(e))
 
-        return {"total": len(merged_pairs), "last_refresh": ts}
\ No newline at end of file
+        return {"total": updated, "last_refresh": ts}
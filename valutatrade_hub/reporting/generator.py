@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from valutatrade_hub.core.ledger import TradeLedger, apply_trade
+from valutatrade_hub.core.utils import parse_iso_dt
+
+REPORT_FIELDS = [
+    "user_id",
+    "wallets",
+    "value",
+    "value_ref",
+    "pnl",
+    "pnl_pct",
+    "top_currency",
+    "top_weight",
+    "hhi",
+    "unpriced",
+]
+
+#Состояние процесса-воркера: снимок курсов передаётся один раз через initializer
+_worker_ctx: dict[str, Any] = {}
+
+
+def _usd_rates(pairs: dict[str, Any]) -> dict[str, float]:
+    out: dict[str, float] = {"USD": 1.0}
+    for pair, obj in pairs.items():
+        rate = obj.get("rate") if isinstance(obj, dict) else obj
+        if not isinstance(rate, (int, float)) or rate <= 0:
+            continue
+        base, _, quote = pair.partition("_")
+        if quote == "USD":
+            out[base] = float(rate)
+        elif base == "USD" and quote not in out:
+            out[quote] = 1.0 / float(rate)
+    return out
+
+
+def reference_rates(history: Iterable[dict[str, Any]], since: datetime) -> dict[str, float]:
+    #Для каждой пары - последний курс из истории не позже since; история читается потоком
+    best: dict[str, tuple[datetime, float]] = {}
+    for rec in history:
+        ts = parse_iso_dt(str(rec.get("timestamp", "")))
+        rate = rec.get("rate")
+        if ts is None or not isinstance(rate, (int, float)):
+            continue
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        if ts > since:
+            continue
+        pair = f"{rec.get('from_currency')}_{rec.get('to_currency')}"
+        if pair not in best or best[pair][0] <= ts:
+            best[pair] = (ts, float(rate))
+    return _usd_rates({pair: {"rate": rate} for pair, (_ts, rate) in best.items()})
+
+
+def _init_worker(now_rates: dict[str, float], ref_rates: dict[str, float], base: str) -> None:
+    _worker_ctx["now"] = now_rates
+    _worker_ctx["ref"] = ref_rates
+    _worker_ctx["base"] = base
+
+
+def _value_row(row: dict[str, Any]) -> dict[str, Any]:
+    now, ref, base = _worker_ctx["now"], _worker_ctx["ref"], _worker_ctx["base"]
+    to_base_now = 1.0 / now[base] if base in now else None
+    to_base_ref = 1.0 / ref[base] if base in ref else None
+
+    value = value_ref = 0.0
+    positions: dict[str, float] = {}
+    unpriced: list[str] = []
+    for code, balance in row["wallets"].items():
+        if balance <= 0:
+            continue
+        if code not in now or to_base_now is None:
+            unpriced.append(code)
+            continue
+        pos = balance * now[code] * to_base_now
+        positions[code] = pos
+        value += pos
+        #Нет исторического курса - считаем позицию без изменения цены
+        if code in ref and to_base_ref is not None:
+            value_ref += balance * ref[code] * to_base_ref
+        else:
+            value_ref += pos
+
+    top_code, top_weight, hhi = "", 0.0, 0.0
+    if value > 0:
+        for code, pos in positions.items():
+            w = pos / value
+            hhi += w * w
+            if w > top_weight:
+                top_code, top_weight = code, w
+
+    pnl = value - value_ref
+    return {
+        "user_id": row["user_id"],
+        "wallets": len(row["wallets"]),
+        "value": round(value, 2),
+        "value_ref": round(value_ref, 2),
+        "pnl": round(pnl, 2),
+        "pnl_pct": round(100 * pnl / value_ref, 4) if value_ref else 0.0,
+        "top_currency": top_code,
+        "top_weight": round(top_weight, 4),
+        "hhi": round(hhi, 4),
+        "unpriced": ",".join(sorted(unpriced)),
+    }
+
+
+def _iter_ndjson(path: Path) -> Iterator[dict[str, Any]]:
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _process_partition(rows_path: str, tail_path: str, out_path: str, fmt: str) -> dict[str, Any]:
+    #Воркер собирает портфели своего диапазона user_id: строки снимка + свои сделки из хвоста журнала.
+    #В памяти - только его часть книги; результат пишется в свой файл
+    state: dict[int, dict[str, float]] = {}
+    for row in _iter_ndjson(Path(rows_path)):
+        state[int(row["user_id"])] = row["wallets"]
+    for entry in _iter_ndjson(Path(tail_path)):
+        apply_trade(state.setdefault(int(entry["user_id"]), {}), entry)
+
+    summary = {"users": 0, "value": 0.0, "value_ref": 0.0, "unpriced_users": 0}
+    with open(out_path, "w", encoding="utf-8", newline="") as out:
+        writer = csv.DictWriter(out, fieldnames=REPORT_FIELDS) if fmt == "csv" else None
+        for uid in sorted(state):
+            rec = _value_row({"user_id": uid, "wallets": state.pop(uid)})
+            if writer is not None:
+                writer.writerow(rec)
+            else:
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            summary["users"] += 1
+            summary["value"] += rec["value"]
+            summary["value_ref"] += rec["value_ref"]
+            summary["unpriced_users"] += 1 if rec["unpriced"] else 0
+    return summary
+
+
+#Отчёт по всем портфелям: книга делится на диапазоны user_id, диапазоны обрабатывает пул процессов.
+#Родитель состояние не собирает: снимок и хвост журнала раскладываются по частям потоком
+class PortfolioReportGenerator:
+    def __init__(self, workers: int | None = None, partitions_per_worker: int = 4) -> None:
+        self._workers = max(1, int(workers or os.cpu_count() or 1))
+        self._partitions = self._workers * max(1, int(partitions_per_worker))
+
+    def _write_partitions(self, ledger: TradeLedger, max_user_id: int, tmp: Path) -> list[tuple[Path, Path]]:
+        #Диапазоны подряд идущих user_id: склеенные по порядку результаты частей отсортированы.
+        #Пользователи новее max_user_id (зарегистрированы во время отчёта) попадают в последнюю часть
+        width = max(1, -(-(max_user_id + 1) // self._partitions))
+        paths = [(tmp / f"in-{i:04d}.ndjson", tmp / f"tail-{i:04d}.ndjson") for i in range(self._partitions)]
+        rows = [p.open("w", encoding="utf-8") for p, _t in paths]
+        tails = [t.open("w", encoding="utf-8") for _p, t in paths]
+        last = self._partitions - 1
+        try:
+            snapshot, offset = ledger.snapshot_source()
+            for uid, wallets in ledger.iter_snapshot(snapshot):
+                rows[min(uid // width, last)].write(json.dumps({"user_id": uid, "wallets": wallets}) + "\n")
+            for entry in ledger.iter_tail(offset):
+                tails[min(int(entry["user_id"]) // width, last)].write(json.dumps(entry) + "\n")
+        finally:
+            for f in rows + tails:
+                f.close()
+        return paths
+
+    def generate(
+        self,
+        ledger: TradeLedger,
+        max_user_id: int,
+        rates_pairs: dict[str, Any],
+        history: Iterable[dict[str, Any]],
+        since: datetime,
+        out_path: Path,
+        base: str = "USD",
+        fmt: str = "csv",
+    ) -> dict[str, Any]:
+        if fmt not in {"csv", "ndjson"}:
+            raise ValueError("format должен быть: csv или ndjson")
+        now_rates = _usd_rates(rates_pairs)
+        ref_rates = reference_rates(history, since)
+
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix="vt-report-", dir=out_path.parent))
+        try:
+            inputs = self._write_partitions(ledger, max_user_id, tmp)
+            outputs = [tmp / f"out-{i:04d}.part" for i in range(len(inputs))]
+            with ProcessPoolExecutor(
+                max_workers=self._workers,
+                initializer=_init_worker,
+                initargs=(now_rates, ref_rates, base),
+            ) as pool:
+                futures = [
+                    pool.submit(_process_partition, str(rows), str(tail), str(o), fmt)
+                    for (rows, tail), o in zip(inputs, outputs)
+                ]
+                parts = [f.result() for f in futures]
+
+            #Части склеиваются по порядку, поэтому строки отсортированы по user_id
+            with out_path.open("w", encoding="utf-8", newline="") as out:
+                if fmt == "csv":
+                    csv.DictWriter(out, fieldnames=REPORT_FIELDS).writeheader()
+                for part in outputs:
+                    with part.open("r", encoding="utf-8") as src:
+                        shutil.copyfileobj(src, out)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        total = {k: sum(p[k] for p in parts) for k in ("users", "value", "value_ref", "unpriced_users")}
+        total["pnl"] = total["value"] - total["value_ref"]
+        total["workers"] = self._workers
+        total["path"] = str(out_path)
+        return total